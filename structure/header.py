@@ -1,5 +1,6 @@
 from typing import Callable
 from utils import util
+from structure import options as tcp_options
 
 class Printable(util.Comparable):
 	def __init__(self) -> None:
@@ -67,7 +68,7 @@ class TCPHeader(Header):
 	"""A human readable TCP Header abtraction
 	"""
 
-	def __init__(self, src_port, dst_port, seq_num, ack_num, _flags:Flags, rcvwd) -> None:
+	def __init__(self, src_port, dst_port, seq_num, ack_num, _flags:Flags, rcvwd, options=()) -> None:
 		"""Constructs a TCP Header.
 
 		(Note: in the end, during transmission everything will be converted to byte data)
@@ -79,6 +80,7 @@ class TCPHeader(Header):
 			ack_num (int): ack number
 			_flags (Flags): TCP Flags
 			rcvwd (int): rcvwd 
+			options (tuple, optional): TCP options as (kind, value bytes) pairs. Defaults to ().
 		"""
 		self.__src_port = src_port
 		self.__dst_port = dst_port
@@ -87,7 +89,8 @@ class TCPHeader(Header):
 		self.__flags = _flags
 		self.__rcvwd = rcvwd
 		self.__checksum = 0
-		self.__header_len = 20
+		self.__options = tuple(options)
+		self.__header_len = 20 + tcp_options.encoded_len(self.__options)
 		# self.__checksum = self.compute_checksum()
 	
 	@property
@@ -122,16 +125,37 @@ class TCPHeader(Header):
 	def header_len(self):
 		return self.__header_len
 
+	@property
+	def options(self):
+		return self.__options
+
+	def option(self, kind):
+		"""Returns the value of option @kind, None if it is absent
+		"""
+		for option_kind, value in self.__options:
+			if option_kind == kind:
+				return value
+		return None
+
 	def set_checksum(self, value):
 		self.__checksum = value
 		return
 
+	def set_option(self, kind, value):
+		"""Replaces the value of option @kind by @value, of the same length
+		"""
+		self.__options = tuple((option_kind, value if option_kind == kind else old) for option_kind, old in self.__options)
+		return
+
 	def is_fin(self):
 		return self.__flags.fin == 1
 
 	def is_ack(self):
 		return self.__flags.ack == 1
 
+	def is_syn(self):
+		return self.__flags.syn == 1
+
 	def __eq__(self, __o: object) -> bool:
 		if not isinstance(__o, TCPHeader):
 			return False
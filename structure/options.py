@@ -0,0 +1,71 @@
+import struct
+
+# option kinds, following TCP's numbering where one exists
+END = 0
+NOP = 1
+MSS = 2
+SACK_PERMITTED = 4 # in a SYN, and in the SYN-ACK agreeing to it
+SACK = 5 # blocks of data received past a hole (RFC 2018), a duplicate first (D-SACK, RFC 2883), see utils.sack
+CHECKSUM_REQUEST = 14 # alternate checksum (RFC 1146): algorithm asked for in a SYN, agreed to in the SYN-ACK
+CHECKSUM_DATA = 15 # alternate checksum data: the CRC32 of the packet, always the first option
+FASTOPEN = 34
+MULTIPATH = 250 # unassigned kind: asked for in a SYN, path of a data segment, echoed in ACKs, see utils.multipath
+SESSION = 251 # unassigned kind: a session of several files (see utils.session), asked for in a SYN and agreed to in the SYN-ACK
+RESUME = 252 # unassigned kind: identity of the file in a SYN, ranges the server has in the SYN-ACK, digest of the file in the FIN
+FEC = 253 # experimental kind (RFC 4727): parity packets, and the receiver's count of segments rebuilt from them
+COMPRESS = 254 # experimental kind (RFC 4727): compression methods offered in a SYN, the one picked in the SYN-ACK
+
+# algorithms of CHECKSUM_REQUEST
+CRC32 = 1
+
+MAX_LEN = 40 # as in TCP, options take up to 40 bytes (so a header is at most 60 bytes)
+
+
+def encode(options):
+	"""Converts options to their on-the-wire TLV form, padded to a multiple of 4 bytes
+
+	Args:
+		options (tuple): of (kind, value bytes) pairs
+
+	Returns:
+		bytes: kind (1 byte), length (1 byte, including kind and length) and value of each option
+	"""
+	encoded = b''
+	for kind, value in options:
+		encoded += struct.pack('BB', kind, len(value) + 2) + value
+	if len(encoded) % 4 != 0:
+		encoded += bytes([END]) * (4 - len(encoded) % 4)
+	if len(encoded) > MAX_LEN:
+		raise Exception(f'options take {len(encoded)} bytes, more than {MAX_LEN}')
+	return encoded
+
+def decode(data):
+	"""Converts on-the-wire options back to (kind, value) pairs
+
+	Args:
+		data (bytes): the header bytes following the fixed 20 byte header
+
+	Returns:
+		tuple: of (kind, value bytes) pairs
+	"""
+	options = []
+	i = 0
+	while i < len(data):
+		kind = data[i]
+		if kind == END:
+			break
+		if kind == NOP:
+			i += 1
+			continue
+		length = data[i + 1]
+		if length < 2:
+			raise Exception(f'malformed option {kind} of length {length}')
+		options.append((kind, bytes(data[i + 2:i + length])))
+		i += length
+	return tuple(options)
+
+def encoded_len(options):
+	"""Number of bytes :func:encode produces for @options
+	"""
+	length = sum(len(value) + 2 for _, value in options)
+	return length + (4 - length % 4) % 4
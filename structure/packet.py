@@ -1,7 +1,9 @@
-import logging
 import struct
+import sys
+import zlib
 
 from .header import TCPHeader, Flags
+from . import options as tcp_options
 from utils import util
 
 class Packet(util.Comparable):
@@ -12,15 +14,18 @@ class Packet(util.Comparable):
 	bytes.
 	"""
 
-	def __init__(self, header:TCPHeader, payload:str) -> None:
+	def __init__(self, header:TCPHeader, payload:str, wire=None) -> None:
 		"""Construct a packet from header and payload
 
 		Args:
 			header (TCPHeader): a constructed TCP header
 			payload (str or bytes): payload
+			wire (bytes or memoryview, optional): bytes the packet was deserialized from, so that
+				:func:self.is_corrupt checks them rather than serializing again. Defaults to None.
 		"""
 		self.__header = header
 		self.__payload = payload
+		self.__wire = wire
 
 	@property
 	def header(self):
@@ -39,35 +44,38 @@ class Packet(util.Comparable):
 		self.__payload = value
 
 	def compute_checksum(self):
-		checksum = self.__compute_checksum()
-		checksum = ~checksum & 0xffff # 1s complement and mask
-		self.__header.set_checksum(checksum)
-		return
-
-	def __compute_checksum(self):
-		"""Computes the 1s complement treating self.__header=0
-
-		Returns:
-			[int]: 1s complement of checksummed packet
+		"""Fills in the checksum: a CRC32 in the CHECKSUM_DATA option if the header has that
+		option (as its first one), else the 16 bit one's complement sum in the checksum field
 		"""
-		prev_checksum = self.__header.checksum
-		self.__header.set_checksum(value=0)
-		# computes checksum without header
-		all_bytes = serialize(self)
-		checksum = 0
-		for i in range(0, len(all_bytes), 2):
-			if i + 1 == len(all_bytes):
-				checksum += all_bytes[i]
-				break
-			checksum += (all_bytes[i] << 8 + all_bytes[i+1])
-		# reset
-		self.__header.set_checksum(prev_checksum)
-		return checksum 
+		self.__header.set_checksum(0)
+		if self.__has_crc():
+			self.__header.set_option(tcp_options.CHECKSUM_DATA, bytes(CRC.size))
+			self.__header.set_option(tcp_options.CHECKSUM_DATA, CRC.pack(zlib.crc32(serialize(self))))
+		else:
+			self.__header.set_checksum(~ones_sum(serialize(self)) & 0xffff)
+		self.__wire = None
+		return
 
 	def is_corrupt(self):
-		current_checksum = self.__compute_checksum()
-		logging.debug(f'checksum result {current_checksum & self.__header.checksum}')
-		return current_checksum & self.__header.checksum != 0
+		"""Checks the CRC32 or the one's complement sum, in one pass over the wire bytes
+		"""
+		wire = self.__wire if self.__wire is not None else serialize(self)
+		if self.__has_crc():
+			# computed with the option value zeroed
+			crc = zlib.crc32(wire[:CRC_OFFSET])
+			crc = zlib.crc32(bytes(CRC.size), crc)
+			crc = zlib.crc32(wire[CRC_OFFSET + CRC.size:], crc)
+			return CRC.pack(crc) != self.__header.option(tcp_options.CHECKSUM_DATA)
+		# with the checksum field in, the sum is 0 (i.e. 0xffff, one's complement)
+		return ones_sum(wire) != 0
+
+	def __has_crc(self):
+		options = self.__header.options
+		return len(options) > 0 and options[0][0] == tcp_options.CHECKSUM_DATA and len(options[0][1]) == CRC.size
+
+	def __hash__(self):
+		# the payload may be a memoryview of a pooled receive buffer, which is not hashable
+		return hash((self.__header, len(self.__payload)))
 
 	def __str__(self):
 		content = f"""
@@ -78,6 +86,18 @@ class Packet(util.Comparable):
 		return content
 
 
+CRC = struct.Struct('I')
+CRC_OFFSET = 22 # of the CHECKSUM_DATA value: the first option, after its kind and length
+
+def ones_sum(data):
+	"""One's complement sum of @data as 16 bit words, modulo 0xffff
+
+	As 2**16 = 1 (mod 0xffff), the words need not be added one by one: @data read as a
+	single integer has the same remainder. 16 bit words are read in the byte order the
+	checksum field is packed in, and an odd last byte is zero-padded.
+	"""
+	return int.from_bytes(data, sys.byteorder) % 0xffff
+
 def serialize(packet:Packet):
 	"""Converts the Human-readable Packet to bytes
 
@@ -86,7 +106,7 @@ def serialize(packet:Packet):
 
 	Returns:
 		bytes: actual bytes of the packet 
-		(i.e. 20 bytes header + up to 512 byte payload)
+		(i.e. 20 bytes header + options + up to 512 byte payload)
 	"""
 	line_1 = struct.pack('HH', packet.header.src_port, packet.header.dst_port)
 	line_2 = struct.pack('I', packet.header.seq_num)
@@ -98,6 +118,8 @@ def serialize(packet:Packet):
 	line_5 = struct.pack('HH', packet.header.checksum, 0)
 	# final
 	final = line_1 + line_2 + line_3 + line_4 + line_5
+	if packet.header.header_len > 20:
+		final += tcp_options.encode(packet.header.options)
 	if len(packet.payload) != 0:
 		final += packet.payload
 	return final
@@ -106,17 +128,18 @@ def deserialize(packet):
 	"""Converts bytes to a HUman-readable Packet
 
 	Args:
-		packet (bytes): network transmitted bytes
+		packet (bytes or memoryview): network transmitted bytes
 
 	Returns:
-		Packet: human-readable Packet
+		Packet: human-readable Packet. Given a memoryview, the payload is a view of the same
+		buffer rather than a copy
 	"""
-	total_size = len(packet)
 	src_port, dst_port, \
 		seq_num, ack_num, \
 			header_len, flags, rcvwd, \
-				checksum, urg, \
-					data = struct.unpack(f'HHIIBBHHH{total_size-20}s', packet)
+				checksum, urg = struct.unpack_from('HHIIBBHHH', packet)
+	options = tcp_options.decode(packet[20:header_len]) if header_len > 20 else ()
+	data = packet[header_len:]
 	flags = format(flags, '#07b')
 	header = TCPHeader(
 		src_port=src_port,
@@ -129,7 +152,8 @@ def deserialize(packet):
 			ack=int(flags[2]), 
 			syn=int(flags[6]),
 			fin=int(flags[5])),
-		rcvwd=rcvwd)
+		rcvwd=rcvwd,
+		options=options)
 	header.set_checksum(checksum)
-	packet = Packet(header, data)
+	packet = Packet(header, data, wire=packet)
 	return packet
\ No newline at end of file
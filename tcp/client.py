@@ -1,45 +1,175 @@
 import logging
+import struct
 import threading
-import time
 import structure.packet
 import globals
 
 from socket import *
+from structure import options as tcp_options
 from structure.packet import Packet
 from structure.header import TCPHeader, Flags
-from utils import timer
+from utils import timer, trace, udpio, util, resume
+from utils import sack as tcp_sack
+from utils.bufferpool import BufferPool
+from utils.clock import SYSTEM
+from utils.compress import StreamCompressor, METHODS
+from utils.congestion import CongestionControl
+from utils.fec import FecEncoder, PARITY, RECOVERED
+from utils.multipath import Multipath, PATH
+from utils.rack import Rack
 from utils.sampler import RTTSampler
+from utils.sendqueue import SendQueue
+from utils.stats import ConnectionStats
 
 class UDP_CLIENT():
 	"""Underlying UDP client for communication
 	"""
 
-	def __init__(self, udpl_ip, udpl_port, ack_lstn_port):
+	def __init__(self, udpl_ip, udpl_port, ack_lstn_port, tracer=None, gso=False, sndbuf=None, rcvbuf=None, paths=()):
 		self.__dst_address = (udpl_ip, udpl_port)
-		self.__buffersize = globals.MSS + 20
+		self.__buffersize = globals.MSS + 20 + tcp_options.MAX_LEN
 		self.__socket = socket(family=AF_INET, type=SOCK_DGRAM)
 		self.__socket.bind(('127.0.0.1', ack_lstn_port))
+		if sndbuf is not None or rcvbuf is not None:
+			udpio.set_buffers(self.__socket, sndbuf=sndbuf, rcvbuf=rcvbuf)
+		# (destination, socket) of every path, the first one being the above. The sockets of the
+		# others only send, from their own port (e.g. for newudpl -i), the server ACKs to ours
+		self.__routes = [(self.__dst_address, self.__socket)]
+		for ip, port, local_port in paths:
+			path_socket = socket(family=AF_INET, type=SOCK_DGRAM)
+			path_socket.bind(('127.0.0.1', local_port))
+			if sndbuf is not None:
+				udpio.set_buffers(path_socket, sndbuf=sndbuf)
+			self.__routes.append(((ip, port), path_socket))
+		self.__gso = gso and udpio.supports_gso(self.__socket)
+		if gso and not self.__gso:
+			logging.warning('UDP GSO not supported, sending one datagram per syscall')
+		self.__pool = BufferPool(self.__buffersize, count=8)
+		self.__stats = ConnectionStats('client')
+		self.__tracer = tracer
 
 	@property
 	def dst_addr(self):
 		return self.__dst_address
 
-	def send_packet(self, packet:Packet):
-		socket = self.__socket
-		packet = structure.packet.serialize(packet)
-		ret = socket.sendto(packet, self.__dst_address)
+	@property
+	def tracer(self):
+		return self.__tracer
+
+	@property
+	def stats(self):
+		return self.__stats
+
+	@property
+	def path_count(self):
+		"""Number of paths datagrams can go over, see :func:self.send_wire
+		"""
+		return len(self.__routes)
+
+	@property
+	def gso(self):
+		"""Whether :func:self.send_wires hands runs of datagrams to the kernel at once (UDP GSO)
+		"""
+		return self.__gso
+
+	def set_ect(self):
+		"""Marks what we send ECN capable, for a congested queue on the way to mark rather than drop it
+		"""
+		if not all([udpio.set_ect(path_socket) for _, path_socket in self.__routes]):
+			logging.warning('could not mark datagrams ECN capable, only the server marks them')
+		return
+
+	def send_packet(self, packet:Packet, event=trace.SEND):
+		return self.send_wire(structure.packet.serialize(packet), event=event)
+
+	def send_wire(self, wire, event=trace.SEND, path=0):
+		"""Sends an already serialized packet, e.g. a cached one being retransmitted, over @path
+		"""
+		if self.__tracer is not None:
+			self.__tracer.record_wire(event, trace.TX, wire)
+		dst_address, path_socket = self.__routes[path]
+		ret = path_socket.sendto(wire, dst_address)
+		self.__stats.incr('segments_sent')
+		self.__stats.incr('bytes_sent', ret)
+		return ret
+
+	def send_wires(self, wires, event=trace.SEND, path=0):
+		"""Sends several serialized packets over @path, with as few syscalls as GSO allows
+
+		Falls back to one :func:self.send_wire per packet without GSO, or for good if the
+		kernel rejects a GSO send (e.g. the route does not support it).
+		"""
+		if not self.__gso or len(wires) == 1:
+			return sum(self.send_wire(wire, event=event, path=path) for wire in wires)
+		dst_address, path_socket = self.__routes[path]
+		ret = 0
+		for size, run in udpio.gso_batches(wires):
+			if len(run) == 1 or not self.__gso:
+				ret += sum(self.send_wire(wire, event=event, path=path) for wire in run)
+				continue
+			try:
+				sent = udpio.send_gso(path_socket, run, size, dst_address)
+			except OSError as err:
+				logging.warning('UDP GSO send failed (%s), sending one datagram per syscall', err)
+				self.__gso = False
+				ret += sum(self.send_wire(wire, event=event, path=path) for wire in run)
+				continue
+			if self.__tracer is not None:
+				for wire in run:
+					self.__tracer.record_wire(event, trace.TX, wire)
+			self.__stats.incr('segments_sent', len(run))
+			self.__stats.incr('bytes_sent', sent)
+			ret += sent
 		return ret
 
 	def receive_packet(self):
-		raw_packet, _ = self.__socket.recvfrom(self.__buffersize)
-		return structure.packet.deserialize(raw_packet)
+		"""Blocking receive of a packet
+
+		Returns:
+			Packet: packet received, None if the socket was shut down or the datagram is not a packet.
+			Its payload is a view of the receive buffer, hand it back with :func:self.release once consumed
+		"""
+		buffer = self.__pool.acquire()
+		size = self.__socket.recv_into(buffer)
+		if size == 0:
+			self.__pool.release(buffer)
+			return None
+		self.__stats.incr('segments_received')
+		self.__stats.incr('bytes_received', size)
+		try:
+			packet = structure.packet.deserialize(memoryview(buffer)[:size].toreadonly())
+		except Exception:
+			self.__pool.release(buffer)
+			return None
+		if self.__tracer is not None:
+			self.__tracer.record(trace.RECV, trace.RX, packet)
+		return packet
+
+	def release(self, packet:Packet):
+		"""Returns the receive buffer of @packet to the pool, once its payload is consumed
+		"""
+		if isinstance(packet.payload, memoryview):
+			self.__pool.release(packet.payload.obj)
+		return
+
+	def set_timeout(self, timeout):
+		"""Sets the timeout of :func:self.receive_packet in seconds, None to block forever
+		"""
+		self.__socket.settimeout(timeout)
+		return
 
 	def get_info(self):
 		info = self.__socket.getsockname()
 		return info
 
 	def terminate(self):
-		self.__socket.close()
+		try:
+			# wakes up a thread blocked in receive_packet
+			self.__socket.shutdown(SHUT_RDWR)
+		except OSError:
+			pass
+		for _, path_socket in self.__routes:
+			path_socket.close()
 		return self
 
 
@@ -50,37 +180,148 @@ class TCP_CLIENT(UDP_CLIENT):
 	FIN_WAIT_1 = 2
 	FIN_WAIT_2 = 3
 	TIME_WAIT = 4
-	BEGIN_CLOSE = 5
+	CLOSING = 5
+	SYN_SENT = 6
 
+	RCVWD = 64 # receive buffer, in segments
+	DELAYED_ACK = 0.04 # seconds an ACK waits for data to carry it, at most
 	INIT_TIMEOUT_INTERVAL = 1
 	CLOSE_WAIT_TIME = 30
+	CONNECT_TIMEOUT = 30
+	MAX_TIME_WAIT = 2
+	MAX_WINDOW = 65535 # segments, the largest window a header advertises
+	DUP_ACK_THRESHOLD = 3 # duplicate ACKs that trigger a fast retransmit
+
+	# what the retransmission timer is armed for
+	TIMEOUT = 0
+	PROBE = 1 # a tail loss probe
+	REORDER = 2 # the end of a RACK reordering window
 
-	def __init__(self, udpl_ip, udpl_port, window_size, ack_lstn_port):
-		"""TCP reliable sender implementation
+	def __init__(self, udpl_ip, udpl_port, window_size, ack_lstn_port, tracer=None, isn=None, cookie_jar=None, nodelay=False,
+		fec=False, compress=None, crc=False, resume=None, session=False, gso=False, sndbuf=None, rcvbuf=None,
+		congestion=True, metrics=None, ecn=False, sack=True, paths=(), clock=None):
+		"""TCP reliable sender implementation, which also receives what the server sends back (see :func:self.read)
 
 		Args:
 			udpl_ip (str): udpl IP address to send to (proxy address)
 			udpl_port (int): udpl port address to send to
-			window_size (int): number of packets allowed in current window
+			window_size (int): number of packets allowed in current window, 0 or None for no limit of
+				our own (i.e. the server's autotuned window and the congestion window only)
 			ack_lstn_port (int): port number of receiving ACK from server
+			tracer (PacketTracer, optional): records every packet sent/received. Defaults to None.
+			isn (int, optional): initial sequence number. Defaults to None (random).
+			cookie_jar (CookieJar, optional): fast open cookies, enables fast open. Defaults to None.
+			nodelay (bool, optional): like TCP_NODELAY, :func:self.write sends partial segments right away
+				instead of coalescing them (Nagle). Defaults to False.
+			fec (bool, optional): send XOR parity packets, from which the server rebuilds a segment lost per group
+				without a retransmission, if it agrees to in the handshake. Defaults to False.
+			compress (str, optional): 'zlib' or 'lzma', compresses what :func:self.write sends, if the server
+				agrees to in the handshake. No data goes in the SYN then. Defaults to None.
+			crc (bool, optional): protect every packet after the handshake with a CRC32 rather than the
+				16 bit checksum, if the server agrees to. Defaults to False.
+			resume (tuple, optional): (size, fingerprint) of the file about to be sent, see utils.resume.identify:
+				asks the server which ranges of it it has already, from an earlier transfer cut short.
+				No data goes in the SYN then. Defaults to None.
+			session (bool, optional): send several files, framed (see utils.session), if the server agrees
+				to in the handshake. No data goes in the SYN then. Defaults to False.
+			gso (bool, optional): on Linux, :func:self.write hands runs of full segments to the kernel
+				in one syscall (UDP GSO), where supported. Defaults to False.
+			sndbuf (int, optional): SO_SNDBUF of the socket in bytes. Defaults to None (system default).
+			rcvbuf (int, optional): SO_RCVBUF of the socket in bytes. Defaults to None (system default).
+			congestion (bool, optional): bound the window by a Reno congestion window too, see
+				utils.congestion. Defaults to True.
+			metrics (MetricsCache, optional): RTT, slow start threshold and delivery rate of earlier
+				connections to the same server, which this one starts from and updates when it
+				terminates. Defaults to None.
+			ecn (bool, optional): ask the server for ECN: the congestion window is halved when it echoes
+				congestion marks (ECE), without a loss, once per window. Defaults to False.
+			sack (bool, optional): ask the server for SACK: losses are then detected by time (RACK, see
+				utils.rack) rather than from duplicate ACKs, and a lost tail of the window is probed for
+				after 2 RTTs rather than a timeout. Defaults to True.
+			paths (list, optional): (ip, port, local port) of more paths to the server, e.g. more udpl
+				instances: if the server agrees, data segments are spread over them and (@udpl_ip, @udpl_port),
+				weighted by the RTT and loss rate measured on each (see utils.multipath). Defaults to ().
+			clock (Clock, optional): time and timers the connection runs on, e.g. a utils.clock.VirtualClock
+				to simulate it (see utils.sim). Defaults to None (the real ones).
 		"""
-		super().__init__(udpl_ip, udpl_port, ack_lstn_port)
-		self.__seq_num = 0
-		self.__ack_num = 0 # assumes both sides start with seq=0
-		self.__timer = timer.TCPTimer(TCP_CLIENT.INIT_TIMEOUT_INTERVAL, self.retransmit)
-		self.__window = []
-		self.__window_size = window_size
-		self.__send_base = 0 # smallest unacked seq num
-		self.__state = TCP_CLIENT.ESTABLISHED
+		super().__init__(udpl_ip, udpl_port, ack_lstn_port, tracer=tracer, gso=gso, sndbuf=sndbuf, rcvbuf=rcvbuf, paths=paths)
+		self.__clock = clock or SYSTEM
+		self.__iss = isn if isn is not None else util.random_isn()
+		self.__seq_num = self.__iss
+		self.__ack_num = 0 # learnt from the SYN-ACK
+		self.__ack_sent = 0 # largest ACK sent so far, along with data or not
+		self.__timer = timer.TCPTimer(TCP_CLIENT.INIT_TIMEOUT_INTERVAL, self.retransmit, clock=self.__clock)
+		self.__window = SendQueue() # unacked segments, with their send times for the RTT sampler
+		self.__window_size = window_size if window_size else TCP_CLIENT.MAX_WINDOW
+		self.__send_base = self.__iss # smallest unacked seq num
+		self.__state = TCP_CLIENT.CLOSED
+
+		# negotiated in the handshake
+		self.__mss = globals.MSS
+		self.__peer_window = None
+		self.__cookie_jar = cookie_jar
+		self.__syn_data = b''
+		self.__fec_requested = fec
+		self.__fec = None # FecEncoder, once the server agreed
+		self.__fec_recovered = 0 # segments the server reported rebuilt
+		self.__compress = METHODS[compress] if compress is not None else None
+		self.__compressor = None # StreamCompressor, once the server agreed
+		self.__crc_requested = crc
+		self.__crc = False # once the server agreed
+		self.__resume = resume
+		self.__resumed = None # ranges the server has, once it agreed
+		self.__session_requested = session
+		self.__session = False # once the server agreed
+		self.__ecn_requested = ecn
+		self.__ecn = False # once the server agreed
+		self.__cwr = False # the next data segment tells the server we reduced the window
+		self.__ecn_recover = None # seq num before which ECE is not reacted to again
+		self.__sack_requested = sack
+		self.__sack = False # once the server agreed
+		self.__multipath_requested = len(paths) > 0
+		self.__multipath = None # Multipath, once the server agreed
 
 		# used for RTT sampler
-		self.__waiting_packets = {}
 		self.__rtt_sampling = RTTSampler(TCP_CLIENT.INIT_TIMEOUT_INTERVAL)
+		self.__rtt_sampled = False
+
+		# used for congestion control, and the metrics cache
+		self.__congestion = CongestionControl(max_cwnd=self.__window_size) if congestion else None
+		self.__delivered = 0 # bytes ACKed
+		self.__rate_mark = None # (time, bytes delivered) the current delivery rate sample started at
+		self.__delivery_rate = None # bytes/s, over an RTT at least
+		self.__dup_acks = 0 # in a row
+		self.__recover = None # seq num that ends fast recovery once ACKed, while in it
+		self.__rack = Rack()
+		self.__reorder_at = None # time the reordering window of a segment not delivered yet ends
+		self.__timer_event = TCP_CLIENT.TIMEOUT
+		self.__tlp_end = None # end seq num of the tail loss probe out, until its episode ends
+		self.__metrics = metrics
+		cached = metrics.get(self.dst_addr) if metrics is not None else None
+		if cached is not None:
+			self.__warm_start(cached)
 
 		# used for threading
 		self.window_lock = threading.Lock()
-		self.rcv_lock = threading.Lock()
-		self.__thread_fin_packets = []
+		self.window_open = threading.Condition(self.window_lock) # notified whenever the window gains room
+
+		# used for the byte stream API
+		self.__send_buffer = bytearray()
+		self.__buffer_lock = threading.Lock() # held while segmenting, keeps the stream in order
+		self.__nodelay = nodelay
+
+		# used for receiving, see :func:self.read
+		self.__receive_buffer = bytearray() # in order, not read yet
+		self.__out_of_order = {} # seq num -> data past a gap
+		self.__readable = threading.Condition() # notified whenever data or the server's FIN comes in
+		self.__peer_fin = False # the server is done sending
+		self.__rcvwd = TCP_CLIENT.RCVWD # last advertised
+		self.__delayed_ack = timer.TCPTimer(TCP_CLIENT.DELAYED_ACK, self.__send_delayed_ack, clock=self.__clock)
+
+		# used for closing
+		self.__fin_seq = None
+		self.__time_wait_timer = None
+		self.__closed = threading.Event()
 
 	@property
 	def state(self):
@@ -92,73 +333,592 @@ class TCP_CLIENT(UDP_CLIENT):
 			FIN_WAIT_1 = 2 \n
 			FIN_WAIT_2 = 3 \n
 			TIME_WAIT = 4 \n
-			BEGIN_CLOSE = 5 \n
+			CLOSING = 5 \n
+			SYN_SENT = 6 \n
 
 		Returns:
 			[int]: current state information
 		"""
 		return self.__state
 
-	def __next_seq(self, payload):
-		num_bytes = len(payload) or 1
-		return self.__seq_num + num_bytes
+	@property
+	def mss(self):
+		"""MSS negotiated with the server, i.e. the largest payload :func:self.send accepts
+		"""
+		return self.__mss
+
+	@property
+	def window(self):
+		"""Number of packets allowed in current window, also bound by the server's advertised window
+		and the congestion window
+		"""
+		window = self.__window_size
+		if self.__peer_window is not None:
+			window = min(window, self.__peer_window)
+		if self.__congestion is not None:
+			window = min(window, max(int(self.__congestion.cwnd), 1))
+		return window
+
+	@property
+	def compression(self):
+		"""Compression method of the stream sent by :func:self.write (see utils.compress), None if uncompressed
+		"""
+		return self.__compressor.method if self.__compressor is not None else None
+
+	@property
+	def session(self):
+		"""Whether the server agreed to a session of several files
+		"""
+		return self.__session
+
+	@property
+	def resumed(self):
+		"""(start, end) ranges of the file the server has already, not to be sent again, if it agreed
+		to resume a transfer (possibly none of them). None otherwise
+		"""
+		return self.__resumed
+
+	@property
+	def nodelay(self):
+		"""Whether :func:self.write sends partial segments without waiting for outstanding ACKs
+		"""
+		return self.__nodelay
+
+	@property
+	def rcvwd(self):
+		"""Receive window advertised in the last header sent, in segments
+		"""
+		return self.__rcvwd
+
+	@property
+	def paths(self):
+		"""Estimates of every path (see utils.multipath), None unless data is spread over several
+		"""
+		return self.__multipath.snapshot() if self.__multipath is not None else None
+
+	@property
+	def free_window(self):
+		"""Number of bytes :func:self.send can take right now without blocking
+		"""
+		return max(self.__room(), 0) * self.__mss
+
+	def __room(self):
+		"""Number of segments the window takes right now: the congestion window bounds those in flight
+		(neither SACKed nor deemed lost), our own and the server's window every unACKed one
+		"""
+		window = self.__window_size
+		if self.__peer_window is not None:
+			window = min(window, self.__peer_window)
+		room = window - len(self.__window)
+		if self.__congestion is not None:
+			room = min(room, max(int(self.__congestion.cwnd), 1) - self.__window.in_flight)
+		return room
+
+	def __warm_start(self, cached):
+		"""Starts from the metrics an earlier connection to the same server left in the cache: its RTT
+		estimates for the timeout, its slow start threshold, and an initial congestion window of about
+		the bandwidth-delay product it measured, within that threshold
+		"""
+		self.__rtt_sampling.seed(cached['srtt'], cached['rttvar'])
+		self.__update_rtt_stats()
+		if self.__congestion is not None:
+			cwnd = CongestionControl.INIT_CWND
+			if cached['delivery_rate']:
+				bdp = cached['delivery_rate'] * cached['srtt'] / self.__mss
+				if cached['ssthresh'] is not None:
+					bdp = min(bdp, cached['ssthresh'])
+				cwnd = max(cwnd, bdp)
+			self.__congestion = CongestionControl(cwnd=cwnd, ssthresh=cached['ssthresh'], max_cwnd=self.__window_size)
+			self.stats.set('cwnd', round(self.__congestion.cwnd, 2))
+		logging.info('warm start from cached metrics: %s', cached)
+		return
+
+	def __sample_delivery_rate(self, acked, now):
+		"""Bytes ACKed per second, measured over an RTT at least
+		"""
+		self.__delivered += acked
+		if self.__rate_mark is None:
+			self.__rate_mark = (now, self.__delivered - acked)
+			return
+		since, delivered = self.__rate_mark
+		if now - since >= self.__rtt_sampling.estimated_rtt:
+			self.__delivery_rate = (self.__delivered - delivered) / (now - since)
+			self.stats.set('delivery_rate', round(self.__delivery_rate))
+			self.__rate_mark = (now, self.__delivered)
+		return
+
+	def __save_metrics(self):
+		"""Caches what this connection learnt about the path, for the next one to the same server
+		"""
+		if self.__metrics is None or not self.__rtt_sampled:
+			return
+		ssthresh = self.__congestion.ssthresh if self.__congestion is not None else None
+		self.__metrics.set(self.dst_addr, srtt=self.__rtt_sampling.estimated_rtt, rttvar=self.__rtt_sampling.dev_rtt,
+			ssthresh=ssthresh, delivery_rate=self.__delivery_rate)
+		return
+
+	@staticmethod
+	def __seg_len(packet:Packet):
+		# SYN and FIN take up a seq num each
+		return (len(packet.payload) + packet.header.flags.syn + packet.header.flags.fin) or 1
+
+	def __next_seq(self, packet:Packet):
+		return self.__seq_num + TCP_CLIENT.__seg_len(packet)
+
+	def __receive_window(self):
+		"""Window to advertise in a header: the room left in the receive buffer, in segments.
+		At least 1, so that the server cannot stall on a lost window update.
+		"""
+		room = TCP_CLIENT.RCVWD - len(self.__receive_buffer) // self.__mss
+		self.__rcvwd = min(max(room, 1), TCP_CLIENT.RCVWD)
+		return self.__rcvwd
+
+	def __transmit(self, packet:Packet):
+		"""Sends @packet, serializing it once: the window keeps the bytes for retransmission
+		"""
+		wire = structure.packet.serialize(packet)
+		self.send_wire(wire, path=TCP_CLIENT.__path_of(packet))
+		parity = self.__post_send(packet, wire)
+		if parity is not None:
+			self.__send_parity(parity)
+		return
 
-	def __post_send(self, packet:Packet):
+	def __post_send(self, packet:Packet, wire):
+		"""Queues @packet for retransmission
+
+		Returns:
+			(bytes, bytes): parity packet to send after it, see :func:FecEncoder.add, None if there is none
+		"""
 		logging.debug("at __post_send")
-		# 1. update seq_num
-		self.__seq_num = self.__next_seq(packet.payload)
+		# 1. update seq_num, and what the server knows we received
+		self.__seq_num = self.__next_seq(packet)
+		if packet.header.ack_num > self.__ack_sent:
+			if not packet.header.flags.syn:
+				self.stats.incr('acks_piggybacked')
+			self.__ack_sent = packet.header.ack_num
 
 		# 2. update window
 		self.window_lock.acquire()
-		self.__window.append(packet)
+		self.__window.append(packet.header.seq_num, self.__seq_num, wire, self.__clock.time())
 
 		# 3. check if timer is running
 		self.__rtt_sampling.double_interval(enabled=False, restore=False)
 		if not self.__timer.is_alive():
 			logging.debug("restart timer")
-			self.__timer.restart(new_interval=self.__rtt_sampling.get_interval())
-		
-		# 4. update RTT sampler
-		packet_ack = packet.header.seq_num + (len(packet.payload) or 1)
-		start_time = self.__waiting_packets.get(packet_ack)
-		if start_time is None:
-			self.__waiting_packets[packet_ack] = time.time()
-			logging.debug(f'adding __waiting_packets {packet_ack} for payload={packet.payload} at {time.time()}')
-		else: # this should not happen
-			logging.error(f'self.__waiting_packets already has {packet}')
+			self.__arm_timer()
 		self.window_lock.release()
+		self.stats.set('bytes_in_flight', self.__seq_num - self.__send_base)
+
+		# 4. FEC group
+		if self.__fec is not None and len(packet.payload) > 0 and not packet.header.flags.syn:
+			return self.__fec.add(packet.header.seq_num, packet.payload)
+		return None
+
+	def __flush_parity(self):
+		"""Sends the parity of a partial FEC group: when nothing follows for a while (end of the
+		stream, full window), a loss in there would otherwise wait for a timeout
+		"""
+		if self.__fec is not None:
+			parity = self.__fec.flush()
+			if parity is not None:
+				self.__send_parity(parity)
+		return
+
+	def __send_parity(self, parity):
+		"""Sends a parity packet. It takes up no seq num and is never retransmitted
+		"""
+		option, payload = parity
+		_, src_port = self.get_info()
+		header = TCPHeader(
+			src_port=src_port,
+			dst_port=self.dst_addr[1],
+			seq_num=PARITY.unpack(option)[0],
+			ack_num=self.__ack_num,
+			_flags=Flags(cwr=0, ece=0, ack=1, syn=0, fin=0),
+			rcvwd=self.__receive_window(),
+			options=self.__options((tcp_options.FEC, option)))
+		packet = Packet(header, payload)
+		packet.compute_checksum()
+		self.send_packet(packet)
+		self.stats.incr('fec_parity_sent')
+		return
+
+	def open(self, payload=b''):
+		"""Active open: sends a SYN, without waiting for the SYN-ACK (see :func:self.connect)
+
+		The SYN announces our MSS and, with a cookie jar, asks for a fast open cookie, or
+		carries @payload along with the cookie we already have for this server.
+
+		Args:
+			payload (bytes, optional): data to send in the SYN. Defaults to b''.
+		"""
+		options = [(tcp_options.MSS, struct.pack('H', globals.MSS))]
+		self.__syn_data = b''
+		if self.__cookie_jar is not None:
+			cookie = self.__cookie_jar.get(self.dst_addr)
+			if cookie is None:
+				options.append((tcp_options.FASTOPEN, b''))
+			else:
+				options.append((tcp_options.FASTOPEN, cookie))
+				self.__syn_data = payload[:globals.MSS]
+		if self.__fec_requested:
+			options.append((tcp_options.FEC, b''))
+		if self.__crc_requested:
+			options.append((tcp_options.CHECKSUM_REQUEST, bytes([tcp_options.CRC32])))
+		if self.__compress is not None:
+			# whether the stream gets compressed is not known yet, so it all waits for the handshake
+			options.append((tcp_options.COMPRESS, bytes([self.__compress])))
+			self.__syn_data = b''
+		if self.__session_requested:
+			# frames or a plain file, depending on the server's answer
+			options.append((tcp_options.SESSION, b''))
+			self.__syn_data = b''
+		if self.__resume is not None:
+			# which data to send depends on the server's answer
+			options.append((tcp_options.RESUME, resume.IDENTITY.pack(*self.__resume)))
+			self.__syn_data = b''
+		_, src_port = self.get_info()
+		if self.__multipath_requested:
+			options.append((tcp_options.MULTIPATH, b''))
+		if self.__sack_requested and tcp_options.encoded_len(options + [(tcp_options.SACK_PERMITTED, b'')]) <= tcp_options.MAX_LEN:
+			options.append((tcp_options.SACK_PERMITTED, b''))
+		header = TCPHeader(
+			src_port=src_port,
+			dst_port=self.dst_addr[1],
+			seq_num=self.__iss,
+			ack_num=0,
+			_flags=Flags(cwr=int(self.__ecn_requested), ece=int(self.__ecn_requested), ack=0, syn=1, fin=0),
+			rcvwd=self.__receive_window(),
+			options=tuple(options))
+		packet = Packet(header, self.__syn_data)
+		packet.compute_checksum()
+
+		self.__state = TCP_CLIENT.SYN_SENT
+		self.__transmit(packet) # retransmitted by the timer like any other packet
 		return
 
-	def send(self, payload:str):
+	def connect(self, payload=b''):
+		"""Performs the three-way handshake with the server
+
+		Args:
+			payload (bytes, optional): data to send in the SYN if fast open is possible. Defaults to b''.
+
+		Returns:
+			int: number of bytes of @payload delivered during the handshake, the rest has to be sent with :func:self.send
+		"""
+		self.open(payload)
+		deadline = self.__clock.time() + TCP_CLIENT.CONNECT_TIMEOUT
+		try:
+			while self.__state == TCP_CLIENT.SYN_SENT:
+				remaining = deadline - self.__clock.time()
+				if remaining <= 0:
+					raise TimeoutError()
+				self.set_timeout(remaining)
+				self.receive()
+		except TimeoutError:
+			self.reset()
+			raise Exception(f'Could not connect to {self.dst_addr} within {TCP_CLIENT.CONNECT_TIMEOUT}s')
+		finally:
+			self.set_timeout(None)
+		return self.__seq_num - (self.__iss + 1)
+
+	def __handle_syn_ack(self, packet:Packet):
+		header = packet.header
+		if not (header.is_syn() and header.is_ack() and self.__iss + 1 <= header.ack_num <= self.__seq_num):
+			logging.debug('ignoring %s while waiting for SYN-ACK', header)
+			return
+		self.__ack_num = header.seq_num + 1
+		self.__ack_sent = self.__ack_num # the ACK below, or data right after it
+		peer_mss = header.option(tcp_options.MSS)
+		if peer_mss is not None:
+			self.__mss = min(globals.MSS, struct.unpack('H', peer_mss)[0])
+		self.__peer_window = header.rcvwd
+		if self.__fec_requested and header.option(tcp_options.FEC) is not None:
+			self.__fec = FecEncoder()
+		self.__crc = self.__crc_requested and header.option(tcp_options.CHECKSUM_REQUEST) == bytes([tcp_options.CRC32])
+		if self.__compress is not None and header.option(tcp_options.COMPRESS) == bytes([self.__compress]):
+			self.__compressor = StreamCompressor(self.__compress)
+		self.__session = self.__session_requested and header.option(tcp_options.SESSION) is not None
+		self.__sack = self.__sack_requested and header.option(tcp_options.SACK_PERMITTED) is not None
+		if self.__multipath_requested and header.option(tcp_options.MULTIPATH) is not None:
+			self.__multipath = Multipath(self.path_count)
+		elif self.__multipath_requested:
+			logging.warning('the server does not take multipath, sending over the first path only')
+		self.__ecn = self.__ecn_requested and header.flags.ece == 1 and header.flags.cwr == 0
+		if self.__ecn:
+			self.set_ect()
+		received = header.option(tcp_options.RESUME)
+		if self.__resume is not None and received is not None:
+			self.__resumed = resume.unpack_ranges(received)
+		cookie = header.option(tcp_options.FASTOPEN)
+		if self.__cookie_jar is not None and cookie:
+			self.__cookie_jar.set(self.dst_addr, cookie)
+		if header.ack_num < self.__seq_num:
+			# data in SYN was not accepted, it will be sent again as a regular segment
+			logging.info('fast open data not accepted')
+			self.window_lock.acquire()
+			self.__seq_num = header.ack_num
+			self.__window.clear()
+			self.window_lock.release()
+		self.__state = TCP_CLIENT.ESTABLISHED
+		with self.window_open:
+			self.window_open.notify_all() # the server's window is known now
+		logging.info('connection established, mss=%s, server window=%s', self.__mss, self.__peer_window)
+		self.__send_ack()
+		return
+
+	def send(self, payload:str, block=True, timeout=None):
 		"""Reliably send a packet with payload @payload
 
+		When the window is full, waits until an ACK opens room in it, rather than polling.
+		See :attr:self.free_window for how much can be sent without waiting.
+
 		Args:
 			payload (str or bytes): payload
+			block (bool, optional): wait for room in the window. Defaults to True.
+			timeout (float, optional): seconds to wait at most. Defaults to None (forever).
 
 		Returns:
-			int: success=0
+			int: success=0, -1=window still full (non-blocking or timed out) or connection closed
 		"""
+		if len(payload) > self.__mss:
+			raise Exception(f'payload of {len(payload)} bytes exceeds MSS={self.__mss}, use write() for a byte stream')
 		# 0. consult window
-		if len(self.__window) == self.__window_size:
+		if self.__wait_room(block, timeout) == 0:
 			return -1
 		# 1. construct packet
+		packet = self.__data_packet(payload)
+
+		# 2. send packet, 3. update seq_num, etc
+		self.__transmit(packet)
+		return 0
+
+	def send_many(self, payloads, block=True, timeout=None):
+		"""Sends as many of @payloads as the window takes right now, at least one, handing them
+		to the socket together (see :func:UDP_CLIENT.send_wires)
+
+		Args:
+			payloads (list): payloads of at most MSS bytes each
+			block (bool, optional): wait for room in the window. Defaults to True.
+			timeout (float, optional): seconds to wait at most. Defaults to None (forever).
+
+		Returns:
+			int: number of payloads sent, the first ones of @payloads, or -1 as :func:self.send
+		"""
+		room = self.__wait_room(block, timeout)
+		if room == 0:
+			return -1
+		runs = {} # path -> wires, each path's in one go
+		parities = []
+		for payload in payloads[:room]:
+			packet = self.__data_packet(payload)
+			wire = structure.packet.serialize(packet)
+			parities.append(self.__post_send(packet, wire)) # queued before it is sent, the timer covers the whole run
+			runs.setdefault(TCP_CLIENT.__path_of(packet), []).append(wire)
+		for path, wires in runs.items():
+			self.send_wires(wires, path=path)
+		for parity in parities:
+			if parity is not None:
+				self.__send_parity(parity)
+		return len(parities)
+
+	def __wait_room(self, block, timeout):
+		"""Waits for room in the window, see :func:self.send
+
+		Returns:
+			int: number of segments the window takes, 0 if it is still full or the connection is closed
+		"""
+		room = lambda: self.__room() > 0 or self.__state == TCP_CLIENT.CLOSED
+		with self.window_open:
+			if block and self.__fec is not None and not room():
+				# an ACK is due within an RTT: without one, a segment of the partial FEC group may be
+				# lost, and its parity lets the server rebuild it rather than wait for a timeout
+				linger = self.__rtt_sampling.estimated_rtt if timeout is None else min(self.__rtt_sampling.estimated_rtt, timeout)
+				if not self.window_open.wait_for(room, timeout=linger):
+					self.__flush_parity()
+				if timeout is not None:
+					timeout -= linger
+			has_room = self.window_open.wait_for(room, timeout=timeout if block else 0)
+			if not has_room or self.__state == TCP_CLIENT.CLOSED:
+				return 0
+			return self.__room()
+
+	def __data_packet(self, payload):
 		_, src_port = self.get_info()
 		header = TCPHeader(
 			src_port=src_port,
 			dst_port=self.dst_addr[1],
 			seq_num=self.__seq_num, 
 			ack_num=self.__ack_num, 
-			_flags=Flags(cwr=0, ece=0, ack=0, syn=0,fin=0),
-			rcvwd=10)
+			_flags=Flags(cwr=int(self.__cwr), ece=0, ack=1, syn=0,fin=0),
+			rcvwd=self.__receive_window(),
+			options=self.__options(*self.__route()))
+		self.__cwr = False
 		packet = Packet(header, payload)
 		packet.compute_checksum()
+		return packet
 
-		# 2. send packet
-		self.send_packet(packet)
+	def __options(self, *options):
+		"""Options of a packet sent once connected: the CRC32 comes first, if agreed on
+		"""
+		if self.__crc:
+			return ((tcp_options.CHECKSUM_DATA, bytes(4)),) + options
+		return options
 
-		# 3. update seq_num, etc
-		self.__post_send(packet)
-		return 0
+	def __route(self):
+		"""Picks the path of a segment about to be sent, with several paths
+
+		Returns:
+			tuple: its MULTIPATH option, none with a single path
+		"""
+		if self.__multipath is None:
+			return ()
+		_, value = self.__multipath.route(self.__clock.time())
+		return ((tcp_options.MULTIPATH, value),)
+
+	@staticmethod
+	def __path_of(packet:Packet):
+		"""Path @packet goes over, as its MULTIPATH option says (the first one without)
+		"""
+		value = packet.header.option(tcp_options.MULTIPATH)
+		if value is None or len(value) != PATH.size:
+			return 0
+		return PATH.unpack(value)[0]
+
+	def __resend(self, segment):
+		"""Sends a segment of the window again. With several paths, over a path picked anew: it then
+		takes a new MULTIPATH option, and is serialized again rather than sent as cached
+		"""
+		if self.__multipath is None:
+			return self.send_wire(segment.wire, event=trace.RETRANSMIT)
+		packet = structure.packet.deserialize(segment.wire)
+		if packet.header.option(tcp_options.MULTIPATH) is None:
+			return self.send_wire(segment.wire, event=trace.RETRANSMIT) # e.g. the SYN
+		path, value = self.__multipath.route(self.__clock.time())
+		packet.header.set_option(tcp_options.MULTIPATH, value)
+		packet.compute_checksum()
+		return self.send_wire(structure.packet.serialize(packet), event=trace.RETRANSMIT, path=path)
+
+	def write(self, data, block=True):
+		"""Byte stream send: buffers @data and sends it in full MSS segments
+
+		A trailing partial segment is held back while data is in flight, and goes out once
+		everything is ACKed or more data fills it up (Nagle), unless :attr:self.nodelay.
+		With :attr:self.compression, @data is compressed by blocks first, and a partial block
+		waits for :func:self.flush. Blocks while the window is full.
+
+		Args:
+			data (bytes): data to send
+			block (bool, optional): wait for room in the window. Defaults to True. Without, what the
+				window does not take stays buffered (see :attr:self.buffered) until the next
+				:func:self.write or :func:self.flush.
+
+		Returns:
+			int: number of bytes accepted, i.e. len(@data)
+
+		Raises:
+			Exception: if the connection got closed meanwhile
+		"""
+		accepted = len(data)
+		with self.__buffer_lock:
+			self.stats.incr('bytes_uncompressed', accepted)
+			if self.__compressor is not None:
+				data = self.__compressor.compress(data)
+			self.__send_buffer += data
+			self.__push(block=block)
+		# an ACK may have emptied the window while we held the buffer
+		self.__push_idle()
+		return accepted
+
+	@property
+	def buffered(self):
+		"""Number of bytes :func:self.write took and did not send yet, compressed if :attr:self.compression
+		"""
+		return len(self.__send_buffer)
+
+	def flush(self, block=True):
+		"""Sends whatever :func:self.write has buffered, partial segment included
+
+		Args:
+			block (bool, optional): wait for room in the window. Defaults to True. Without, what
+				the window does not take stays buffered, see :attr:self.buffered.
+		"""
+		with self.__buffer_lock:
+			if self.__compressor is not None:
+				self.__send_buffer += self.__compressor.flush()
+			self.__push(force=True, block=block)
+			self.__flush_parity()
+		return
+
+	def __push(self, force=False, block=True):
+		"""Segments the send buffer, to be called with the buffer lock held
+		"""
+		buffer = self.__send_buffer
+		sent = 0
+		while len(buffer) - sent >= self.__mss or (len(buffer) > sent and (force or self.__nodelay or len(self.__window) == 0)):
+			full = min((len(buffer) - sent) // self.__mss, udpio.MAX_SEGMENTS, max(self.__room(), 1))
+			if self.gso and full > 1:
+				# a run of full segments, one syscall
+				end = sent + full * self.__mss
+				count = self.send_many([bytes(buffer[i:i + self.__mss]) for i in range(sent, end, self.__mss)], block=block)
+				if count == -1:
+					if block:
+						del buffer[:sent]
+						raise Exception('Connection closed while writing')
+					break
+				sent += count * self.__mss
+				continue
+			segment = bytes(buffer[sent:sent + self.__mss])
+			if self.send(segment, block=block) == -1:
+				if block:
+					del buffer[:sent]
+					raise Exception('Connection closed while writing')
+				break
+			sent += len(segment)
+		del buffer[:sent]
+		return
+
+	def __push_idle(self):
+		"""Nagle: sends the buffered partial segment once nothing is in flight. Never blocks,
+		as it runs on the receiving thread: if the buffer is busy, its owner pushes it.
+		"""
+		if len(self.__send_buffer) == 0 or len(self.__window) > 0:
+			return
+		if not self.__buffer_lock.acquire(blocking=False):
+			return
+		try:
+			self.__push(block=False)
+		finally:
+			self.__buffer_lock.release()
+		return
+
+	def read(self, size=-1, timeout=None):
+		"""Byte stream receive: what the server sent, in order
+
+		Blocks until some data is in, the server is done sending, or @timeout expires. Reading
+		makes room in the receive buffer, which the next headers advertise.
+
+		Args:
+			size (int, optional): number of bytes to return at most. Defaults to -1 (whatever is in).
+			timeout (float, optional): seconds to wait at most. Defaults to None (forever).
+
+		Returns:
+			bytes: data received, b'' once everything before the server's FIN is read, or the
+			connection is closed. None if @timeout expired first
+		"""
+		buffer = self.__receive_buffer
+		with self.__readable:
+			ready = lambda: len(buffer) > 0 or self.__peer_fin or self.__state == TCP_CLIENT.CLOSED
+			if not self.__readable.wait_for(ready, timeout=timeout):
+				return None
+			size = len(buffer) if size < 0 else min(size, len(buffer))
+			data = bytes(buffer[:size])
+			del buffer[:size]
+		if self.__state != TCP_CLIENT.CLOSED and self.__rcvwd <= TCP_CLIENT.RCVWD // 2 \
+			and TCP_CLIENT.RCVWD - len(buffer) // self.__mss > TCP_CLIENT.RCVWD // 2:
+			# window update, the server may be waiting for room
+			self.__send_ack()
+		return data
 
 	def retransmit(self):
 		"""Actions when timer timed out, retransmitting the oldest UNACKED packet
@@ -167,87 +927,378 @@ class TCP_CLIENT(UDP_CLIENT):
 		from the current window
 		2. retransmit
 		3. double timeout interval and restart timer
-		4. update self.__waiting_packets, which contains packet that could be RTT sampled.
-		If there is a timeout, then all packets in current window should NOT be inside
-		self.__waiting_packets (as discussed in post @331)
+		4. stop RTT sampling of the packets in the window: if there is a timeout, none
+		of them should be sampled (as discussed in post @331)
+
+		When the timer was armed for the end of a reordering window or for a tail loss
+		probe (see :func:self.__arm_timer), that is done instead.
 		"""
 		logging.debug('retransmitting')
 		# 0. if connection is closed, stop whatever you haven't finished
 		self.window_lock.acquire() # need to read
-		if self.__state == TCP_CLIENT.CLOSED or len(self.__window) == 0:
+		if self.__state == TCP_CLIENT.CLOSED or len(self.__window) == 0 or self.__timer.is_alive():
+			# nothing to do, or armed anew (e.g. by an ACK) while this expiry waited for the lock
+			self.window_lock.release()
+			return
+		if self.__timer_event == TCP_CLIENT.REORDER:
+			self.__detect_losses(self.__clock.time())
+			self.__arm_timer()
+			self.window_lock.release()
+			return
+		if self.__timer_event == TCP_CLIENT.PROBE:
+			self.__send_probe()
 			self.window_lock.release()
 			return
 		# 1. retransmit
 		# self.__window = sorted(self.__window, key= lambda pkt: pkt.header.seq_num)
 		
-		packet = self.__window[0]
-		logging.debug(f'retransmitting {packet}')
-		self.send_packet(packet)
+		segment = self.__window.first()
+		logging.debug('retransmitting %s', segment.seq_num)
+		self.__resend(segment)
+		self.__window.mark_retransmit()
+		self.stats.incr('retransmits_timeout')
+		if self.__fec is not None:
+			self.__fec.lost()
+		if self.__congestion is not None:
+			self.__congestion.on_timeout(len(self.__window))
+			self.stats.set('cwnd', round(self.__congestion.cwnd, 2))
+		self.__recover = None
+		self.__dup_acks = 0
+		self.__reorder_at = None
+		self.__tlp_end = None
 
 		# 2. restart timer
 		self.__rtt_sampling.double_interval() # doubling timeout interval
 		new_timeout_interval = self.__rtt_sampling.get_interval()
-		logging.debug(f'doubling to {new_timeout_interval}')
+		logging.debug('doubling to %s', new_timeout_interval)
+		self.stats.set('rto', new_timeout_interval)
+		self.__timer_event = TCP_CLIENT.TIMEOUT
 		self.__timer.restart(new_interval=new_timeout_interval)
 
 		# 3. do not track RTT for retransmitted packets and all packets inside the window
-		tmp = [pkt.header.seq_num + (len(pkt.payload) or 1) for pkt in self.__window]
-		logging.debug(f"currently having {tmp}")
-		for unacked in self.__window:
-			packet_ack = unacked.header.seq_num + (len(unacked.payload) or 1)
-			start_time = self.__waiting_packets.get(packet_ack)
-			if start_time is not None:
-				self.__waiting_packets.pop(packet_ack, None)
+		self.__window.invalidate_samples()
 		self.window_lock.release()
-		logging.debug(f'now {self.__waiting_packets.keys()}')
 		return
 
-	def __next_ack(self, packet:Packet):
-		num_bytes = len(packet.payload) or 1
-		return packet.header.seq_num + num_bytes
-	
+	def __arm_timer(self):
+		"""(Re)starts the timer, to be called with the window lock held: for the retransmission timeout,
+		or for whatever comes first, the end of a reordering window or a tail loss probe. A probe due
+		goes out in place of the timeout, by then at the latest (RFC 8985), as the timeout has no floor
+		and falls below 2 RTTs on a steady path
+		"""
+		interval = self.__rtt_sampling.timeout_interval
+		self.__timer_event = TCP_CLIENT.TIMEOUT
+		probe = self.__probe_timeout()
+		if probe is not None:
+			interval = min(probe, interval)
+			self.__timer_event = TCP_CLIENT.PROBE
+		if self.__reorder_at is not None:
+			wait = max(self.__reorder_at - self.__clock.time(), 0.001)
+			if wait <= interval:
+				interval = wait
+				self.__timer_event = TCP_CLIENT.REORDER
+		self.__timer.restart(new_interval=interval)
+		return
+
+	def __probe_timeout(self):
+		"""Seconds after which the segment sent last goes again as a tail loss probe (RFC 8985) if no
+		ACK comes meanwhile: 2 RTTs, plus the time the server may hold its ACK back when that segment
+		is the only one in flight. None if no probe is due: outside of SACK, in recovery, or with a
+		probe out already
+		"""
+		if not self.__sack or not self.__rtt_sampled or self.__recover is not None or self.__tlp_end is not None:
+			return None
+		if self.__state not in (TCP_CLIENT.ESTABLISHED, TCP_CLIENT.FIN_WAIT_1):
+			return None
+		timeout = 2 * self.__rtt_sampling.estimated_rtt
+		if self.__window.in_flight == 1:
+			timeout += TCP_CLIENT.DELAYED_ACK
+		return timeout
+
+	def __send_probe(self):
+		"""Tail loss probe, to be called with the window lock held: sends the segment sent last again,
+		for its ACK to reveal (with SACK) what was lost before it, or to repair it if it was the one lost.
+		The retransmission timeout follows.
+		"""
+		segment = self.__window.last()
+		logging.debug('tail loss probe %s', segment.seq_num)
+		self.__resend(segment)
+		self.__window.mark_retransmit(now=self.__clock.time(), last=True)
+		self.__tlp_end = segment.end_seq
+		self.stats.incr('tail_loss_probes')
+		self.__arm_timer()
+		return
+
+	def __on_sack(self, blocks, now):
+		"""Takes the SACK blocks of an ACK, to be called with the window lock held, with SACK agreed. A
+		D-SACK tells a retransmission was not needed: it ends a tail loss probe episode without a loss,
+		or widens the reordering window. Then losses are looked for, see :func:self.__detect_losses
+
+		Returns:
+			bool: whether the timer is to be armed anew
+		"""
+		if tcp_sack.is_dsack(blocks, self.__send_base):
+			left, right = blocks.pop(0)
+			self.stats.incr('dsacks')
+			if self.__tlp_end is not None and left < self.__tlp_end <= right:
+				self.__tlp_end = None # the original came through, nothing was lost
+			else:
+				self.__rack.on_dsack(self.__send_base, self.__seq_num)
+		for left, right in blocks:
+			self.__window.sack(left, right)
+		delivered, lowest = self.__window.take_delivered()
+		self.__rack.on_delivered(delivered, lowest, now)
+		if self.__window.sacked == 0 and self.__recover is None:
+			had_deadline = self.__reorder_at is not None
+			self.__reorder_at = None
+			return had_deadline
+		return self.__detect_losses(now)
+
+	def __detect_losses(self, now):
+		"""RACK, to be called with the window lock held: the segments sent before the latest one delivered,
+		by more than an RTT and the reordering window, are deemed lost and retransmitted right away. The
+		first such loss enters recovery and halves the congestion window.
+
+		Returns:
+			bool: whether segments were retransmitted, or a reordering window is pending
+		"""
+		reo_wnd = self.__rack.reo_wnd(self.__rtt_sampling.estimated_rtt, self.__recover is not None, self.__window.sacked)
+		if self.__multipath is not None:
+			# segments over a faster path overtake the others
+			reo_wnd += self.__multipath.rtt_spread(self.__rtt_sampling.timeout_interval)
+		lost, timeout = self.__rack.detect(self.__window, reo_wnd, now)
+		self.__reorder_at = now + timeout if timeout is not None else None
+		if lost == 0:
+			return timeout is not None
+		if self.__recover is None:
+			self.__recover = self.__seq_num
+			self.__tlp_end = None # recovery takes over from the probe
+			if self.__congestion is not None:
+				self.__congestion.on_loss(len(self.__window))
+				self.stats.set('cwnd', round(self.__congestion.cwnd, 2))
+		for segment in self.__window.retransmit_lost(now):
+			logging.debug('retransmitting %s, deemed lost', segment.seq_num)
+			self.__resend(segment)
+			self.stats.incr('retransmits_fast')
+			if self.__fec is not None:
+				self.__fec.lost()
+		return True
+
+	def __on_ece(self):
+		"""The server echoes congestion marks: halves the congestion window like a loss would, but with
+		nothing to retransmit, at most once per window of data, and says so with CWR
+		"""
+		if self.__recover is not None or (self.__ecn_recover is not None and self.__send_base < self.__ecn_recover):
+			return # reduced already for this window
+		self.__ecn_recover = self.__seq_num
+		self.__cwr = True
+		self.stats.incr('ecn_reductions')
+		if self.__congestion is not None:
+			with self.window_lock:
+				self.__congestion.on_loss(len(self.__window))
+				self.stats.set('cwnd', round(self.__congestion.cwnd, 2))
+		return
+
+	def __fast_retransmit(self, partial=False):
+		"""Retransmits the oldest unACKed packet without waiting for the timer: on the third duplicate
+		ACK, which enters fast recovery (NewReno) and halves the congestion window, or on an ACK that
+		leaves the next hole of the window, @partial, which does not halve it again
+		"""
+		with self.window_lock:
+			if self.__state == TCP_CLIENT.CLOSED or len(self.__window) == 0:
+				return
+			segment = self.__window.first()
+			logging.debug('fast retransmitting %s', segment.seq_num)
+			self.__resend(segment)
+			self.__window.mark_retransmit()
+			self.__window.invalidate_samples() # the ACKs of what follows the hole are late
+			self.stats.incr('retransmits_fast')
+			if self.__fec is not None:
+				self.__fec.lost()
+			if not partial:
+				self.__recover = self.__seq_num
+				if self.__congestion is not None:
+					self.__congestion.on_loss(len(self.__window))
+					self.stats.set('cwnd', round(self.__congestion.cwnd, 2))
+			self.__arm_timer()
+		return
+
+	def __receive_data(self, packet:Packet):
+		"""Reassembles the server's stream into the receive buffer, and takes its FIN once
+		everything before it is in
+
+		ACKs every other segment, or within :attr:DELAYED_ACK, unless data we send carries the
+		ACK first: while data is about to go out, the ACK waits for it up to every fourth segment.
+		Data out of order or already received is ACKed right away.
+		"""
+		header = packet.header
+		length = len(packet.payload)
+		if length > 0:
+			seq_num = header.seq_num
+			if seq_num + length <= self.__ack_num or seq_num > self.__ack_num + TCP_CLIENT.RCVWD * self.__mss:
+				# our ACK got lost, or a datagram of a previous connection
+				self.__send_ack()
+				return
+			with self.__readable:
+				gap = len(self.__out_of_order) > 0
+				if seq_num > self.__ack_num:
+					self.__out_of_order.setdefault(seq_num, bytes(packet.payload))
+				else:
+					self.__receive_buffer += packet.payload[self.__ack_num - seq_num:]
+					self.__ack_num = seq_num + length
+					while len(self.__out_of_order) > 0 and min(self.__out_of_order) <= self.__ack_num:
+						seq_num = min(self.__out_of_order)
+						data = self.__out_of_order.pop(seq_num)
+						self.__receive_buffer += data[self.__ack_num - seq_num:]
+						self.__ack_num = max(self.__ack_num, seq_num + len(data))
+					self.__readable.notify_all()
+			self.stats.set('ooo_queue_depth', len(self.__out_of_order))
+			owed = self.__ack_num - self.__ack_sent
+			if gap or len(self.__out_of_order) > 0 or owed >= 4 * self.__mss or (owed >= 2 * self.__mss and not self.__sending()):
+				self.__send_ack()
+			elif not self.__delayed_ack.is_alive():
+				self.__delayed_ack.restart(new_interval=TCP_CLIENT.DELAYED_ACK)
+		if header.is_fin() and header.seq_num + length == self.__ack_num:
+			self.__ack_num += 1 # position of next byte
+			with self.__readable:
+				self.__peer_fin = True
+				self.__readable.notify_all()
+		return
+
+	def __sending(self):
+		"""Whether data is about to go out, which carries the ACK: some is being written, and the window has room
+		"""
+		busy = len(self.__send_buffer) > 0 or self.__buffer_lock.locked()
+		return busy and self.__room() > 0 and self.__state == TCP_CLIENT.ESTABLISHED
+
+	def __send_delayed_ack(self):
+		"""Delayed ACK timer expired: sends the ACK no data carried meanwhile
+		"""
+		if self.__ack_num > self.__ack_sent and self.__state != TCP_CLIENT.CLOSED:
+			self.__send_ack()
+		return
+
 	def __post_recv(self, packet:Packet):
-		# 0. If I received a FIN, then ACK will be the same as last one
-		if packet.header.is_fin():
-			self.__ack_num = self.__next_ack(packet) # position of next byte
-		
-		logging.debug(f"{packet.header.ack_num} > send_base: {self.__send_base}")
+		if self.__state == TCP_CLIENT.SYN_SENT:
+			self.__handle_syn_ack(packet)
+			if self.__state == TCP_CLIENT.SYN_SENT:
+				return
+		if packet.header.ack_num > self.__seq_num:
+			# acks something never sent, e.g. a datagram of a previous connection
+			logging.debug('ignoring %s', packet.header)
+			return
+		window_grew = self.__update_peer_window(packet.header.rcvwd)
+		recovered = packet.header.option(tcp_options.FEC)
+		if self.__fec is not None and recovered is not None and len(recovered) == RECOVERED.size:
+			# segments rebuilt from parity were lost all the same, they count towards the loss rate
+			recovered = RECOVERED.unpack(recovered)[0]
+			if recovered > self.__fec_recovered:
+				self.__fec.lost(recovered - self.__fec_recovered)
+				self.stats.incr('fec_recovered', recovered - self.__fec_recovered)
+				self.__fec_recovered = recovered
+		blocks = tcp_sack.unpack(packet.header.option(tcp_options.SACK) or b'') if self.__sack else []
+		echo = packet.header.option(tcp_options.MULTIPATH)
+		if self.__multipath is not None and echo is not None:
+			# unambiguous even for a retransmission, unlike the samples of cumulative ACKs, which
+			# mostly land on segments SACKed earlier when they come over paths of different RTTs
+			rtt_sample = self.__multipath.on_echo(echo, self.__clock.time())
+			if rtt_sample is not None:
+				self.__rtt_sampling.update_interval(rtt_sample)
+				self.__rtt_sampled = True
+				self.__update_rtt_stats()
+		logging.debug("%s > send_base: %s", packet.header.ack_num, self.__send_base)
 		self.__rtt_sampling.double_interval(enabled=False)
 		# 1. update window, received ACK
 		if packet.header.ack_num > self.__send_base:
 			# 2. new ACK received
-			
+			now = self.__clock.time()
+			self.stats.incr('bytes_delivered', packet.header.ack_num - self.__send_base)
+			self.__sample_delivery_rate(packet.header.ack_num - self.__send_base, now)
+			self.__dup_acks = 0
 			self.__send_base = packet.header.ack_num
-			logging.debug(f"post_recv, send_base={self.__send_base}")
+			self.stats.set('bytes_in_flight', self.__seq_num - self.__send_base)
+			logging.debug("post_recv, send_base=%s", self.__send_base)
 			# update packets in window
 			self.window_lock.acquire()
-			new_window = []
-			for unacked in self.__window:
-				# cumulative ack
-				if unacked.header.seq_num >= self.__send_base:
-					new_window.append(unacked)
-			self.__window = new_window
-			self.window_lock.release()
-			# if still some unacked packets
+			acked, rtt_sample = self.__window.ack(self.__send_base, now) # cumulative ack
+			if self.__congestion is not None and self.__recover is None:
+				self.__congestion.on_ack(acked)
+				self.stats.set('cwnd', round(self.__congestion.cwnd, 2))
+			if self.__recover is not None and self.__send_base >= self.__recover:
+				self.__recover = None # every hole at the time of the loss is filled
+				self.__rack.on_recovery()
+			if self.__sack:
+				self.__on_sack(blocks, now)
+			if self.__tlp_end is not None and self.__send_base > self.__tlp_end:
+				# the probe was ACKed with no D-SACK: it repaired a loss, which the window pays for
+				self.__tlp_end = None
+				if self.__recover is None and self.__congestion is not None:
+					self.__congestion.on_loss(len(self.__window) + acked)
+					self.stats.set('cwnd', round(self.__congestion.cwnd, 2))
+			# if still some unacked packets (under the lock, so that a packet sent
+			# concurrently does not find the timer about to be cancelled)
 			if len(self.__window) > 0:
-				self.__timer.restart(new_interval=self.__rtt_sampling.get_interval())
+				self.__arm_timer()
 			# all done
 			else:
 				self.__timer.cancel()
-		
-			self.__ack_num = self.__next_ack(packet) # position of next byte
+			self.window_open.notify_all()
+			self.window_lock.release()
 
 			# 3. update RTT
-			start_time = self.__waiting_packets.get(packet.header.ack_num)
-			if start_time is not None: # not retransmitted
-				end_time = time.time()
-				self.__rtt_sampling.update_interval(end_time - start_time)
-				self.__waiting_packets.pop(packet.header.ack_num, None)
-				logging.debug(f'first time received {packet.header.ack_num} at {end_time}, now {self.__waiting_packets.keys()}')
-			return
+			if rtt_sample is not None: # not retransmitted
+				self.__rtt_sampling.update_interval(rtt_sample)
+				self.__rtt_sampled = True
+				logging.debug('first time received %s, rtt %s', packet.header.ack_num, rtt_sample)
+				self.__update_rtt_stats()
+			if self.__recover is not None and not self.__sack:
+				self.__fast_retransmit(partial=True) # the next hole
+			self.__push_idle()
 		else:
-			# TODO:duplicate ack, fast retransmit possible
-			pass
+			if packet.header.ack_num == self.__send_base and len(self.__window) > 0 and len(packet.payload) == 0 \
+				and not packet.header.is_fin():
+				# duplicate ack: a segment past a hole came in
+				self.stats.incr('dup_acks')
+				self.__dup_acks += 1
+				if self.__dup_acks == TCP_CLIENT.DUP_ACK_THRESHOLD and self.__recover is None and not self.__sack:
+					self.__fast_retransmit()
+			if self.__sack and len(blocks) > 0:
+				with self.window_lock:
+					if self.__on_sack(blocks, self.__clock.time()) and len(self.__window) > 0:
+						self.__arm_timer()
+					self.window_open.notify_all() # SACKed segments leave the congestion window
+			if window_grew:
+				self.__push_idle()
+
+		if self.__ecn and packet.header.flags.ece and not packet.header.flags.syn: # ECN setup, in the SYN-ACK
+			self.__on_ece()
+
+		# 4. data the server sent, and its FIN, once the writer knows about the room the ACK made
+		self.__receive_data(packet)
+		return
+
+	def __update_peer_window(self, rcvwd):
+		"""Follows the window advertised in every ACK, which the server shrinks while its sink is backed up.
+		Taken as at least 1 segment, so that the connection cannot stall on a lost window update.
+
+		Returns:
+			bool: whether the window grew
+		"""
+		rcvwd = max(rcvwd, 1)
+		if rcvwd == self.__peer_window:
+			return False
+		with self.window_lock:
+			grew = self.__peer_window is not None and rcvwd > self.__peer_window
+			self.__peer_window = rcvwd
+			self.stats.set('rcv_window', rcvwd)
+			if grew:
+				self.window_open.notify_all()
+		return grew
+
+	def __update_rtt_stats(self):
+		self.stats.set('srtt', round(self.__rtt_sampling.estimated_rtt, 6))
+		self.stats.set('rttvar', round(self.__rtt_sampling.dev_rtt, 6))
+		self.stats.set('rto', self.__rtt_sampling.timeout_interval)
 		return
 		
 
@@ -255,53 +1306,77 @@ class TCP_CLIENT(UDP_CLIENT):
 		"""Receving a packet from server
 
 		Returns:
-			[Packet]: packet received.
+			[Packet]: packet received, None if nothing usable was received (e.g. socket shut down).
+			Its receive buffer is back in the pool, so the payload is not to be read anymore
 		"""
 		# 1. receive ACK packet
 		packet = self.receive_packet()
+		if packet is None:
+			return None
 
 		# 2. update ack_num
+		self.process(packet)
+		self.release(packet) # data is copied into the receive buffer
+		return packet
+
+	def process(self, packet:Packet):
+		"""Processes a packet received from server, e.g. one replayed from a trace
+
+		Args:
+			packet (Packet): packet received
+
+		Returns:
+			[Packet]: packet processed, None if it is corrupt
+		"""
+		if packet.is_corrupt():
+			# e.g. a damaged ack_num, which must not move the window
+			self.stats.incr('corrupt_drops')
+			if self.tracer is not None:
+				self.tracer.record(trace.DROP, trace.RX, packet)
+			return None
 		self.__post_recv(packet)
+		self.__post_recv_fin(packet)
 		return packet
 
-	def __wait_server_ack(self, fin_packet:Packet):
-		logging.debug(f'at __wait_server_ack')
-		fin_seq = fin_packet.header.seq_num
-		self.__state = TCP_CLIENT.FIN_WAIT_1
+	def __post_recv_fin(self, packet:Packet):
+		"""Drives the FIN handshake, once :func:self.shutdown has sent our FIN
+
+		FIN_WAIT_1 --(FIN acked)--> FIN_WAIT_2 --(server FIN)--> TIME_WAIT --(timer)--> CLOSED
+		FIN_WAIT_1 --(server FIN)--> CLOSING --(FIN acked)--> TIME_WAIT
+		"""
+		header = packet.header
+		fin_acked = self.__fin_seq is not None and header.is_ack() and header.ack_num >= self.__fin_seq + 1
+		if fin_acked and self.__state == TCP_CLIENT.FIN_WAIT_1:
+			self.__state = TCP_CLIENT.FIN_WAIT_2
+		elif fin_acked and self.__state == TCP_CLIENT.CLOSING:
+			self.__enter_time_wait()
 
-		# find FIN ACK packet
-		check_threading = True
-		while self.__state == TCP_CLIENT.FIN_WAIT_1:
-			# wait
-			time.sleep(1)
-			self.rcv_lock.acquire()
-			"""
-			Obtain LOCK here so that:
-			Case 1. the other thread in tcpclient.py obtained the lock and went rcv. 
-				- self.__thread_fin_packets is 100% updated. This works
-			Case 2. I got the lock
-				- the other thread obviously went rcv. Also works
-			"""
-			# check list first
-			if check_threading:
-				for packet in self.__thread_fin_packets:
-					# check if is the ACK for fin
-					logging.debug(f'fin ack wait: checking {packet.header}')
-					if packet.header.ack_num >= fin_seq + 1 and packet.header.is_ack():
-						self.__state = TCP_CLIENT.FIN_WAIT_2
-						self.__thread_fin_packets.remove(packet)
-						self.__window = []
-						self.rcv_lock.release()
-						return packet
-				check_threading = False
-			# receive
-			packet = self.receive()
-			self.rcv_lock.release()
-			
-			logging.debug(f'fin ack wait: {packet.header}')
-			if packet.header.ack_num == fin_seq + 1 and packet.header.is_ack():
-				self.__state = TCP_CLIENT.FIN_WAIT_2
-				return packet
+		if header.is_fin() and header.seq_num + len(packet.payload) + 1 == self.__ack_num:
+			# in order, i.e. everything the server sent is in
+			if self.__state == TCP_CLIENT.FIN_WAIT_2:
+				self.__send_ack()
+				self.__enter_time_wait()
+			elif self.__state == TCP_CLIENT.FIN_WAIT_1:
+				self.__send_ack()
+				self.__state = TCP_CLIENT.CLOSING
+			elif self.__state == TCP_CLIENT.TIME_WAIT:
+				# our ACK of the server's FIN got lost
+				self.__send_ack()
+		return
+
+	def __enter_time_wait(self):
+		"""Lingers for a bounded TIME_WAIT to re-ACK a retransmitted server FIN, then closes
+		"""
+		self.__state = TCP_CLIENT.TIME_WAIT
+		interval = min(2 * self.__rtt_sampling.timeout_interval, TCP_CLIENT.MAX_TIME_WAIT)
+		logging.debug('time wait for %s', interval)
+		self.__time_wait_timer = timer.TCPTimer(interval, self.__close, clock=self.__clock)
+		self.__time_wait_timer.start()
+		return
+
+	def __close(self):
+		self.reset()
+		self.__closed.set()
 		return
 
 	def __send_ack(self):
@@ -314,156 +1389,95 @@ class TCP_CLIENT(UDP_CLIENT):
 			seq_num=self.__seq_num, 
 			ack_num=self.__ack_num, 
 			_flags=Flags(cwr=0, ece=0, ack=1, syn=0,fin=0),
-			rcvwd=10)
-		packet = Packet(header, '')
+			rcvwd=self.__receive_window(),
+			options=self.__options())
+		packet = Packet(header, b'')
 		packet.compute_checksum()
 
 		# 2. send packet
 		self.send_packet(packet)
 
-		# 3. No need to do anything
-		self.__post_send(packet)
+		# 3. No need to do anything, pure ACKs take up no seq num
+		self.__ack_sent = max(self.__ack_sent, header.ack_num)
 		return packet
 
-	def __wait_server_fin(self):
-		# wait for fin from server
-		check_thread = True
-		while self.__state == TCP_CLIENT.FIN_WAIT_2:
-			# wait
-			time.sleep(1)
-			"""
-			Obtain LOCK here so that:
-			Case 1. the other thread in tcpclient.py obtained the lock and went rcv. 
-				- self.__thread_fin_packets is 100% updated. This works
-			Case 2. I got the lock
-				- the other thread obviously went rcv. Also works
-			"""
-			self.rcv_lock.acquire()
-			if check_thread:
-				logging.debug(f'fin wait check thread')
-				for packet in self.__thread_fin_packets:
-					if packet.header.is_fin():
-						# send ack
-						# final_ack = self.__send_ack()
-						self.__state = TCP_CLIENT.TIME_WAIT
-						self.rcv_lock.release()
-						return
-				check_thread = False
-			# try to receive
-			packet = self.receive()
-			self.rcv_lock.release()
-			# check if it is fin
-			logging.debug(f'fin wait: {packet.header}')
-			if packet.header.is_fin():
-				# send ack
-				# final_ack = self.__send_ack()
-				break
-
-		self.__state = TCP_CLIENT.TIME_WAIT
-		#return final_ack
-		return None
-
-	def __time_wait(self, final_ack:Packet):
-		logging.debug(f'at __time_wait')
-		self.rcv_lock.acquire()
-		fin_seq = final_ack.header.seq_num
-		start_time = time.time()
-		while time.time() - start_time < TCP_CLIENT.CLOSE_WAIT_TIME:
-			# if received ack for final ack, done
-			packet = self.receive()
-
-			logging.debug(f'at __time_wait with {packet.header}')
-			if packet.header.ack_num >= fin_seq + 1 and packet.header.is_ack():
-				self.__state = TCP_CLIENT.FIN_WAIT_2
-				self.__window = []
-				break
-			time.sleep(0.2)
-		self.__state = TCP_CLIENT.CLOSED
-		self.rcv_lock.release()
-		return
-
 	def reset(self):
 		"""Clean up (optional as the program terminates anyway)
 		"""
 		self.__state = TCP_CLIENT.CLOSED
 		self.window_lock.acquire()
 		self.__timer.cancel()
-		self.__window = []
+		self.__window.clear()
+		self.__reorder_at = None
+		self.__tlp_end = None
+		self.window_open.notify_all() # blocked senders give up
 		self.window_lock.release()
+		if self.__time_wait_timer is not None:
+			self.__time_wait_timer.cancel()
+		self.__delayed_ack.cancel()
+		with self.__readable:
+			self.__readable.notify_all() # blocked readers give up
 		return
 
-	def __post_fin(self, packet:Packet):
-		# 1. wait for ACK for FIN sent
-		self.__wait_server_ack(packet)
-		# 2. wait for FIN from server
-		final_ack = self.__wait_server_fin()
-		# 3. time wait
-		# self.__time_wait(final_ack) #TODO
-		self.reset()
-		return
-
-	def terminate(self):
-		"""Terminate the connection
-
-		After the FIN handshake, close the underlying UDP socket.
+	def shutdown(self, digest=None):
+		"""Done sending: sends our FIN right behind what was sent (it is retransmitted by the timer
+		like any other packet), without waiting for the FIN handshake (see :func:self.terminate).
+		What :func:self.write buffered is to be flushed first.
 
-		Returns:
-			None: None
+		Args:
+			digest (bytes, optional): digest of the whole file (see utils.resume.new_digest), for the
+				server to check a resumed transfer against. Defaults to None.
 		"""
-		# 0. wait for all other retransmission to be done
-		while len(self.__window) > 0:
-			# the other thread will timeout and retransmit
-			time.sleep(1)
-
-		# change state so that the other thread will not receive packets
-		self.__state = TCP_CLIENT.BEGIN_CLOSE
-
 		# 1. construct FIN packet
+		options = ()
+		if digest is not None and self.__resumed is not None:
+			options = ((tcp_options.RESUME, digest),)
 		_, src_port = self.get_info()
 		header = TCPHeader(
 			src_port=src_port, 
 			dst_port=self.dst_addr[1], 
 			seq_num=self.__seq_num, 
 			ack_num=self.__ack_num, 
-			_flags=Flags(cwr=0, ece=0, ack=0, syn=0, fin=1),
-			rcvwd=10)
+			_flags=Flags(cwr=0, ece=0, ack=1, syn=0, fin=1),
+			rcvwd=self.__receive_window(),
+			options=self.__options(*options, *self.__route()))
 		packet = Packet(header, b'')
 		packet.compute_checksum()
-		self.__fin_start_seq = self.__seq_num
-
-		# 2. send packet
-		self.send_packet(packet)
+		self.__fin_seq = self.__seq_num
+		self.__state = TCP_CLIENT.FIN_WAIT_1
 
-		# 3. start timers
-		self.__post_send(packet)
+		# 2. send packet, 3. start timers
+		self.__transmit(packet)
+		return
 
-		# 4. wait for acks and etc
-		self.__post_fin(packet)
-		return super().terminate()
+	def terminate(self, digest=None):
+		"""Terminate the connection
 
-	# for multithreading
-	def update_fin_packets(self, packet:Packet):
-		"""Method for adding packets into the self.__thread_fin_packets list
+		Sends our FIN right behind the data (see :func:self.shutdown), and waits until the receiving
+		thread has seen the FIN handshake through, i.e. until the server is done sending too, as long
+		as it makes progress. Then close the underlying UDP socket.
 
-		This is needed since I am doing multithreading: a threading running :func:receive could
-		accidentally grabbed a FIN ACK packet, which the main thread would be waiting on. This 
-		would cause a HANG in the program. 
+		Args:
+			digest (bytes, optional): digest of the whole file (see utils.resume.new_digest), for the
+				server to check a resumed transfer against. Defaults to None.
 
-		So the solution is to use lock + a safety measure such that if those termination packets
-		are grabbed, it is appended in the self.__thread_fin_packets list which the main thread
-		will also check.
+		Returns:
+			None: None
+		"""
+		# 0. whatever is left in the send buffer goes before the FIN
+		self.flush()
+		# 1. our FIN
+		self.shutdown(digest)
 
-		Args:
-			packet (Packet): packet in the FIN handshake accidentally grabbed by slave thread
-		"""
-		# in case if the thread grabbed one of those packets, client won't be able to terminate
-		# if packet.header.ack_num >= self.__fin_start_seq or packet.header.seq_num >= self.__fin_start_seq:
-		logging.debug("adding in update_fin_packets")
-		if len(self.__thread_fin_packets) == 0:
-			logging.debug("added")
-			self.__thread_fin_packets.append(packet)
-		else:
-			if packet not in self.__thread_fin_packets:
-				logging.debug("added")
-				self.__thread_fin_packets.append(packet)
-		return
+		# 2. wait for acks and etc, signaled by the receiving thread
+		received = self.__ack_num
+		while not self.__clock.wait(self.__closed, TCP_CLIENT.CLOSE_WAIT_TIME):
+			if self.__ack_num == received:
+				logging.error('FIN handshake did not complete within %ss, closing anyway', TCP_CLIENT.CLOSE_WAIT_TIME)
+				break
+			received = self.__ack_num # the server is still sending
+		self.__save_metrics()
+		if self.__multipath is not None:
+			logging.info('paths: %s', self.__multipath.snapshot())
+		self.reset()
+		return super().terminate()
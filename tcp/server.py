@@ -1,29 +1,66 @@
+import collections
+import functools
 import logging
-import time
+import os
+import struct
+import threading
 import structure.packet
 import globals
 
 from pathlib import Path
+from structure import options as tcp_options
 from structure.header import TCPHeader, Flags
 from structure.packet import Packet
-from utils import util
+from utils import timer, udpio, util, trace, resume, session
+from utils import sack as tcp_sack
+from utils.bufferpool import BufferPool
+from utils.clock import SYSTEM
+from utils.compress import StreamDecompressor, METHODS
+from utils.cookies import CookieFactory
+from utils.fec import FecDecoder, RECOVERED, PARITY
+from utils.multipath import PATH, ECHO
+from utils.sampler import RTTSampler
+from utils.session import SessionReader
+from utils.resume import StreamMap
+from utils.sendqueue import SendQueue
+from utils.autotune import WindowTuner
+from utils.stats import ConnectionStats
+from utils.writebehind import WriteBehind
 from socket import *
 
 class UDP_SERVER():
 	"""Underlying unreliable UDP server/receiver
 	"""
 
-	def __init__(self, lsten_port, ack_addr, ack_port) -> None:
+	def __init__(self, lsten_port, ack_addr, ack_port, tracer=None, gro=False, sndbuf=None, rcvbuf=None) -> None:
 		self.__serveraddress = ('', lsten_port) # the socket is reachable by any address the machine happens to have
 		self.__ack_address = ack_addr, ack_port
-		self.__buffersize = globals.MSS + 20
+		self.__buffersize = globals.MSS + 20 + tcp_options.MAX_LEN
 		self.__socket = socket(family=AF_INET, type=SOCK_DGRAM)
+		self.__pool = BufferPool(self.__buffersize)
+		if sndbuf is not None or rcvbuf is not None:
+			udpio.set_buffers(self.__socket, sndbuf=sndbuf, rcvbuf=rcvbuf)
+		self.__rcvbuf_locked = rcvbuf is not None # as on Linux, set explicitly means not autotuned
+		self.__recvtos = False # the ECN codepoint of every datagram comes along, see :func:self.enable_ecn
+		self.__ce = False
+		# with GRO, one receive may return several datagrams: the ones not returned yet wait here
+		self.__gro = gro and udpio.enable_gro(self.__socket)
+		self.__gro_buffer = bytearray(udpio.MAX_DATAGRAM) if self.__gro else None
+		self.__coalesced = collections.deque()
+		if gro and not self.__gro:
+			logging.warning('UDP GRO not supported, receiving one datagram per syscall')
+		self.__stats = ConnectionStats('server')
+		self.__tracer = tracer
 		return
 
 	@property
 	def _serveraddress(self):
 		return self.__serveraddress
 
+	@property
+	def stats(self):
+		return self.__stats
+
 	@property
 	def _socket(self):
 		return self.__socket
@@ -32,22 +69,110 @@ class UDP_SERVER():
 	def ack_addr(self):
 		return self.__ack_address
 
-	def send_packet(self, packet:Packet, client_address):
+	@property
+	def tracer(self):
+		return self.__tracer
+
+	def send_packet(self, packet:Packet, client_address, event=trace.SEND):
+		if self.__tracer is not None:
+			self.__tracer.record(event, trace.TX, packet)
 		socket = self.__socket
 		packet = structure.packet.serialize(packet)
 		ret = socket.sendto(packet, client_address)
+		self.__stats.incr('segments_sent')
+		self.__stats.incr('bytes_sent', ret)
+		return ret
+
+	def send_wire(self, wire, client_address, event=trace.SEND):
+		"""Sends an already serialized packet, e.g. a cached one being retransmitted
+		"""
+		if self.__tracer is not None:
+			self.__tracer.record_wire(event, trace.TX, wire)
+		ret = self.__socket.sendto(wire, client_address)
+		self.__stats.incr('segments_sent')
+		self.__stats.incr('bytes_sent', ret)
 		return ret
 
+	@property
+	def ce_marked(self):
+		"""Whether the last datagram received was marked Congestion Experienced on its way
+		"""
+		return self.__ce
+
+	def enable_ecn(self):
+		"""Reads the ECN codepoint of every datagram received, where supported (IP_RECVTOS)
+		"""
+		self.__recvtos = udpio.enable_recvtos(self.__socket)
+		if not self.__recvtos:
+			logging.warning('IP_RECVTOS not supported, CE marks of the network are not seen')
+		return
+
+	def queued(self):
+		"""Kernel memory taken by the datagrams waiting in the socket, None where unknown
+		"""
+		return udpio.queued_bytes(self.__socket)
+
+	def reserve(self, datagrams):
+		"""Grows the socket receive buffer to hold @datagrams datagrams, unless its size was given
+		"""
+		if not self.__rcvbuf_locked:
+			udpio.reserve_datagrams(self.__socket, datagrams)
+		return
+
 	def receive_packet(self):
-		server = self.__socket
-		raw_packet, client_address = server.recvfrom(self.__buffersize)
+		"""Blocking receive of a packet, into a buffer of the pool
+
+		With GRO, a single receive may return a run of datagrams coalesced by the kernel: each
+		is copied into a buffer of the pool, and the following calls return them one by one.
+
+		Returns:
+			(Packet, tuple): packet received (None if the datagram is not a packet) and where it came from.
+			Its payload is a view of the receive buffer, hand it back with :func:self.release once consumed
+		"""
+		if self.__coalesced:
+			return self.__coalesced.popleft()
+		if self.__gro:
+			size, ancdata, _, client_address = self.__socket.recvmsg_into([self.__gro_buffer],
+				udpio.GRO_ANCBUFSIZE + udpio.TOS_ANCBUFSIZE * self.__recvtos)
+			if size == 0:
+				return None, client_address
+			self.__ce = self.__recvtos and udpio.is_ce(ancdata) # the same for all datagrams of the run
+			segment_size = udpio.gro_segment_size(ancdata) or size
+			received = memoryview(self.__gro_buffer)[:size]
+			for offset in range(0, size, segment_size):
+				datagram = received[offset:offset + segment_size]
+				buffer = self.__pool.acquire()
+				buffer[:len(datagram)] = datagram
+				self.__coalesced.append((self.__to_packet(buffer, len(datagram)), client_address))
+			return self.__coalesced.popleft()
+		buffer = self.__pool.acquire()
+		if self.__recvtos:
+			size, ancdata, _, client_address = self.__socket.recvmsg_into([buffer], udpio.TOS_ANCBUFSIZE)
+			self.__ce = udpio.is_ce(ancdata)
+		else:
+			size, client_address = self.__socket.recvfrom_into(buffer)
+		return self.__to_packet(buffer, size), client_address
+
+	def __to_packet(self, buffer, size):
+		self.__stats.incr('segments_received')
+		self.__stats.incr('bytes_received', size)
 		try:
 			# e.g. corruption
-			packet = structure.packet.deserialize(raw_packet)
-			logging.debug(f'rcvd {packet}')
+			packet = structure.packet.deserialize(memoryview(buffer)[:size].toreadonly())
+			logging.debug('rcvd %s', packet)
 		except:
 			packet = None
-		return packet, client_address
+			self.__pool.release(buffer)
+		if packet is not None and self.__tracer is not None:
+			self.__tracer.record(trace.RECV, trace.RX, packet)
+		return packet
+
+	def release(self, packet:Packet):
+		"""Returns the receive buffer of @packet to the pool, once its payload is consumed
+		"""
+		if isinstance(packet.payload, memoryview):
+			self.__pool.release(packet.payload.obj)
+		return
 
 	def get_info(self):
 		info = self.__socket.getsockname()
@@ -61,23 +186,119 @@ class TCP_SERVER(UDP_SERVER):
 	ESTABLISHED = 2
 	CLOSE_WAIT = 3
 	LAST_ACK = 4
+	SYN_RCVD = 5
 
-	def __init__(self, lsten_port, ack_addr, ack_port) -> None:
-		"""A TCP reliable receiver implementation
+	RCVWD = 64 # initial advertised receive window, in segments
+	MAX_RCVWD = 1024 # the autotuned receive window grows up to this, in segments
+	DELAYED_ACK = 0.04 # seconds an ACK waits for data to carry it at most, while we send
+	INIT_TIMEOUT_INTERVAL = 1
+	MAX_FIN_RETRIES = 5 # give up on the client's ACK of our FIN after as many retransmissions
+	ECN_THRESHOLD = 64 * 1024 # bytes waiting in the socket past which the segments received count as CE-marked
+
+	def __init__(self, lsten_port, ack_addr, ack_port, tracer=None, isn=None, fastopen=True, fec=True, compress=True, crc=True,
+		checkpoint=None, session=False, duplex=False, gro=False, sndbuf=None, rcvbuf=None, max_rcvwd=MAX_RCVWD,
+		ecn=True, ecn_threshold=ECN_THRESHOLD, sack=True, multipath=True, clock=None) -> None:
+		"""A TCP reliable receiver implementation, which also sends data back (see :func:self.write)
 
 		Args:
 			lsten_port (int): port to listen/bind to
 			ack_addr (str): IP address to send ACK
 			ack_port (int): port to send ACK
+			tracer (PacketTracer, optional): records every packet sent/received. Defaults to None.
+			isn (int, optional): initial sequence number of every connection. Defaults to None (random).
+			fastopen (bool, optional): accept data in the SYN of clients with a valid cookie. Defaults to True.
+			fec (bool, optional): rebuild lost segments from the parity packets of clients asking for it. Defaults to True.
+			compress (bool, optional): agree to a compressed stream with clients asking for it. Defaults to True.
+			crc (bool, optional): agree to CRC32 checksums with clients asking for it. Defaults to True.
+			checkpoint (Checkpoint, optional): ranges of the output file received so far, lets clients
+				asking for it resume a transfer. Defaults to None.
+			session (bool, optional): agree to multi-file sessions (see utils.session) with clients asking
+				for it. Defaults to False.
+			duplex (bool, optional): keep our side open after the client's FIN, until :func:self.shutdown,
+				e.g. to answer a request. Defaults to False (our FIN follows what was written).
+			gro (bool, optional): on Linux, receive runs of datagrams coalesced by the kernel in one
+				syscall (UDP GRO), where supported. Defaults to False.
+			sndbuf (int, optional): SO_SNDBUF of the socket in bytes. Defaults to None (system default).
+			rcvbuf (int, optional): SO_RCVBUF of the socket in bytes. Defaults to None (system default).
+			max_rcvwd (int, optional): the receive window grows from :attr:RCVWD toward twice the
+				bandwidth-delay product of the connection (see utils.autotune), up to this many segments.
+				:attr:RCVWD keeps it fixed. Defaults to :attr:MAX_RCVWD.
+			ecn (bool, optional): agree to ECN with clients asking for it: segments marked Congestion
+				Experienced on the way, or received while more than @ecn_threshold bytes wait in the socket,
+				are echoed with ECE until the client's CWR. Defaults to True.
+			ecn_threshold (int, optional): see @ecn, 0 for marks of the network only. Defaults to :attr:ECN_THRESHOLD.
+			sack (bool, optional): agree to SACK with clients asking for it: ACKs tell which segments came
+				in past a hole, and which arrived twice (D-SACK). Defaults to True.
+			multipath (bool, optional): agree to multipath with clients asking for it: their segments come
+				over several paths into the same reassembly, and ACKs echo the path of the latest one along
+				with the count received over it, for the client to weight the paths. Defaults to True.
+			clock (Clock, optional): time and timers the server runs on, e.g. a utils.clock.VirtualClock
+				to simulate it (see utils.sim). Defaults to None (the real ones).
 		"""
-		super().__init__(lsten_port, ack_addr, ack_port)
+		super().__init__(lsten_port, ack_addr, ack_port, tracer=tracer, gro=gro, sndbuf=sndbuf, rcvbuf=rcvbuf)
+		self.__clock = clock or SYSTEM
+		self.__isn = isn
+		self.__iss = 0 # initial send seq num
+		self.__irs = 0 # initial receive seq num, i.e. the client's ISN
 		self.__seq_num = 0
-		self.__ack_num = 0 # assumes both sides start with seq=0
+		self.__ack_num = 0
+		self.__mss = globals.MSS
 		self.__received_seqs = set()
 		self.__state = TCP_SERVER.CLOSED
+		self.__connections = 0
+		self.__cookies = CookieFactory() if fastopen else None
+		self.__syn_ack_options = ()
+		self.__fec_enabled = fec
+		self.__fec = None # FecDecoder of the current connection, if negotiated
+		self.__compress = compress
+		self.__compression = None # compression method of the current connection, if negotiated
+		self.__crc_enabled = crc
+		self.__crc = False # CRC32 checksums in the current connection
+		self.__checkpoint = checkpoint
+		self.__resume = None # (file size, ranges received) of the current connection, if resumed
+		self.__digest = None # of the file, sent by the client along with its FIN when resuming
+		self.__session_enabled = session
+		self.__session = False # the current client sends several files, framed
+		self.__ecn_enabled = ecn
+		self.__ecn_threshold = ecn_threshold
+		self.__ecn = False # the current client reacts to ECE
+		self.__ece = False # echoed in every header, from a CE mark until the client's CWR
+		if ecn:
+			self.enable_ecn()
+		self.__sack_enabled = sack
+		self.__sack = False # SACK blocks in the ACKs of the current connection
+		self.__sack_latest = None # seq num of the segment queued out of order last
+		self.__dsack = None # (start, end) of a duplicate received, for the next ACK to report
+		self.__multipath_enabled = multipath
+		self.__multipath = False # the current client spreads its segments over several paths
+		self.__path_received = {} # path -> data segments received over it
+		self.__path_echo = None # (path, number) of the latest data segment received, for the next ACK to echo
+		self.__rcvwd = TCP_SERVER.RCVWD # advertised in every header, see :func:self.set_rcvwd
+		self.__max_rcvwd = max_rcvwd
+		self.__tuner = WindowTuner(TCP_SERVER.RCVWD, max_rcvwd, self.__mss)
+		self.__sink_room = None # segments the sink takes, see :func:self.set_rcvwd
+		self.__ack_due = False # the last packet received calls for an ACK, see :attr:self.ack_due
+		self.__ack_sent = 0 # largest ACK sent so far, along with data or not
+		self.__delayed_ack = timer.TCPTimer(TCP_SERVER.DELAYED_ACK, self.__send_delayed_ack, clock=self.__clock)
+
+		# for sending data, see :func:self.write
+		self.__duplex = duplex
+		self.__send_buffer = bytearray() # written, not sent yet
+		self.__send_window = SendQueue() # sent, not acked yet
+		self.__send_base = 0 # smallest unacked seq num
+		self.__send_timer = timer.TCPTimer(TCP_SERVER.INIT_TIMEOUT_INTERVAL, self.__retransmit_data, clock=self.__clock)
+		self.__peer_window = TCP_SERVER.RCVWD # advertised by the client, in segments
+		self.__write_shutdown = False # see :func:self.shutdown
 
-		# for fin specifically
-		self.__fin_packets = {}
+		# for the send timer and fin
+		self.__rtt_sampling = RTTSampler(TCP_SERVER.INIT_TIMEOUT_INTERVAL)
+		self.__syn_ack_time = None
+		self.__rcvd_fin_seq = None # seq num of the client's FIN, once received
+		self.__fin_packet = None # our FIN, kept for retransmission
+		self.__fin_time = None
+		self.__fin_retries = 0
+		self.__fin_timer = None
+		self.__state_lock = threading.Lock() # the FIN timer changes state from its own thread
 
 	@property
 	def state(self):
@@ -88,22 +309,118 @@ class TCP_SERVER(UDP_SERVER):
 			ESTABLISHED = 2
 			CLOSE_WAIT = 3
 			LAST_ACK = 4
+			SYN_RCVD = 5
 
 		Returns:
 			[int]: current state information
 		"""
 		return self.__state
 
-	def __next_seq(self, payload):
-		num_bytes = len(payload) or 1
+	@property
+	def stream_base(self):
+		"""Sequence number of the first data byte of the current connection
+		"""
+		return self.__irs + 1
+
+	@property
+	def connections(self):
+		"""Number of connections (i.e. SYNs from new clients) accepted so far
+		"""
+		return self.__connections
+
+	@property
+	def mss(self):
+		"""MSS negotiated with the current client
+		"""
+		return self.__mss
+
+	@property
+	def compression(self):
+		"""Compression method of the current client's stream (see utils.compress), None if uncompressed
+		"""
+		return self.__compression
+
+	@property
+	def checkpoint(self):
+		return self.__checkpoint
+
+	@property
+	def resume(self):
+		"""(file size, list of (start, end) ranges the client does not send again) if the current
+		client resumes a transfer, None otherwise
+		"""
+		return self.__resume
+
+	@property
+	def session(self):
+		"""Whether the current client sends a session of several files, see utils.session
+		"""
+		return self.__session
+
+	@property
+	def digest(self):
+		"""Digest of the whole file, as sent by a resuming client in its FIN. None until then
+		"""
+		return self.__digest
+
+	@property
+	def rcvwd(self):
+		"""Receive window advertised in the headers sent, in segments
+		"""
+		return self.__rcvwd
+
+	@property
+	def ack_due(self):
+		"""Whether the last packet received calls for an ACK that no data segment carried yet,
+		i.e. a pure ACK is to be sent with :func:self.send
+		"""
+		return self.__ack_due
+
+	@property
+	def duplex(self):
+		"""Whether our side stays open after the client's FIN, until :func:self.shutdown
+		"""
+		return self.__duplex
+
+	@property
+	def free_window(self):
+		"""Number of bytes :func:self.write sends right away rather than buffers
+		"""
+		room = min(self.__peer_window, TCP_SERVER.RCVWD) - len(self.__send_window)
+		return max(room * self.__mss - len(self.__send_buffer), 0)
+
+	def set_rcvwd(self, segments):
+		"""Advertises a window of @segments from the next header on, e.g. shrunk while the
+		sink is backed up, None for no limit of the sink. Clamped to [1, the autotuned window]:
+		the client is never told to stop for good.
+		"""
+		self.__sink_room = segments
+		self.__rcvwd = self.__tuner.window if segments is None else min(max(segments, 1), self.__tuner.window)
+		self.stats.set('rcv_window', self.__rcvwd)
+		return
+
+	def __autotune(self):
+		"""Grows the receive window toward twice the bandwidth-delay product, as data comes in
+		"""
+		if self.__tuner.on_deliver(self.__ack_num, self.__clock.time()):
+			logging.debug('receive window grown to %s segments', self.__tuner.window)
+			self.reserve(self.__tuner.window)
+			self.set_rcvwd(self.__sink_room)
+		return
+
+	def __next_seq(self, packet:Packet):
+		# pure ACKs do not consume sequence numbers, SYN and FIN consume one
+		num_bytes = len(packet.payload) + packet.header.flags.syn + packet.header.flags.fin
 		return self.__seq_num + num_bytes
 
 	def __post_send(self, packet:Packet):
-		self.__seq_num = self.__next_seq(packet.payload)
+		self.__seq_num = self.__next_seq(packet)
+		self.__ack_sent = max(self.__ack_sent, packet.header.ack_num)
 		return
 
 	def send(self, payload):
-		"""Construct and send a packet with payload @payload
+		"""Construct and send a packet with payload @payload, e.g. a pure ACK. It is not retransmitted,
+		see :func:self.write for data
 
 		Args:
 			payload (bytes): payload, should not exceeed MSS=512
@@ -112,33 +429,300 @@ class TCP_SERVER(UDP_SERVER):
 			int: 0=packet accepted, -1=packet rejected (due to full window)
 		"""
 		# 1. construct packet
-		client_address = self.ack_addr
+		packet = self.__data_packet(payload)
+
+		# 2. send packet
+		self.send_packet(packet, self.ack_addr)
+
+		# 3. update seq_num, etc
+		self.__post_send(packet)
+		self.__ack_due = False
+		return packet
+
+	def __data_packet(self, payload):
 		_, src_port = self.get_info()
 		header = TCPHeader(
-			src_port=src_port, 
-			dst_port=client_address[1], 
-			seq_num=self.__seq_num, 
-			ack_num=self.__ack_num, 
-			_flags=Flags(cwr=0, ece=0, ack=1, syn=0,fin=0), 
-			rcvwd=10)
+			src_port=src_port,
+			dst_port=self.ack_addr[1],
+			seq_num=self.__seq_num,
+			ack_num=self.__ack_num,
+			_flags=Flags(cwr=0, ece=int(self.__ece), ack=1, syn=0,fin=0),
+			rcvwd=self.__rcvwd,
+			options=self.__ack_options())
 		packet = Packet(header, payload)
 		packet.compute_checksum()
+		return packet
 
-		# 2. send packet
-		self.send_packet(packet, client_address)
+	def write(self, data):
+		"""Byte stream send to the client: buffers @data and sends it in MSS segments, as many as
+		the window takes. The rest goes out as ACKs open room (see :attr:self.free_window), and
+		segments not ACKed in time are retransmitted on their own timer.
 
-		# 3. update seq_num, etc
-		self.__post_send(packet)
+		Every segment carries the ACK of what was received so far, so that no pure ACK is
+		needed along with it (see :attr:self.ack_due).
+
+		Args:
+			data (bytes): data to send
+
+		Returns:
+			int: number of bytes accepted, i.e. len(@data)
+
+		Raises:
+			Exception: if there is no connection, or after :func:self.shutdown
+		"""
+		with self.__state_lock:
+			if self.__state not in (TCP_SERVER.ESTABLISHED, TCP_SERVER.CLOSE_WAIT) or self.__write_shutdown:
+				raise Exception('Connection closed for writing')
+			self.__send_buffer += data
+			self.__push()
+		return len(data)
+
+	def shutdown(self):
+		"""Done writing: our FIN follows what :func:self.write took, once the client's FIN is in
+		"""
+		with self.__state_lock:
+			self.__write_shutdown = True
+			self.__maybe_fin()
+		return
+
+	def __push(self):
+		"""Sends as much of the send buffer as the window takes, to be called with the state lock held
+		"""
+		buffer = self.__send_buffer
+		room = min(self.__peer_window, TCP_SERVER.RCVWD) - len(self.__send_window)
+		sent = 0
+		while sent < len(buffer) and room > 0:
+			packet = self.__data_packet(bytes(buffer[sent:sent + self.__mss]))
+			wire = structure.packet.serialize(packet)
+			self.send_wire(wire, self.ack_addr)
+			if packet.header.ack_num > self.__ack_sent:
+				self.stats.incr('acks_piggybacked')
+			self.__post_send(packet)
+			self.__send_window.append(packet.header.seq_num, self.__seq_num, wire, self.__clock.time())
+			self.__ack_due = False
+			sent += len(packet.payload)
+			room -= 1
+		del buffer[:sent]
+		if len(self.__send_window) > 0 and not self.__send_timer.is_alive():
+			self.__send_timer.restart(new_interval=self.__rtt_sampling.get_interval())
+		self.stats.set('bytes_in_flight', self.__seq_num - self.__send_base)
+		return
+
+	def __post_recv_ack(self, header:TCPHeader):
+		"""Takes the ACK and window of a packet from the client, for the data we sent
+		"""
+		self.__peer_window = max(header.rcvwd, 1)
+		if not header.is_ack() or not self.__send_base < header.ack_num <= self.__seq_num:
+			if len(self.__send_buffer) > 0:
+				self.__push() # the window may have grown
+			return
+		self.__send_base = header.ack_num
+		_, rtt_sample = self.__send_window.ack(header.ack_num, self.__clock.time())
+		self.__rtt_sampling.double_interval(enabled=False)
+		if rtt_sample is not None: # not retransmitted
+			self.__rtt_sampling.update_interval(rtt_sample)
+			self.stats.set('srtt', round(self.__rtt_sampling.estimated_rtt, 6))
+			self.stats.set('rto', self.__rtt_sampling.timeout_interval)
+		if len(self.__send_window) > 0:
+			self.__send_timer.restart(new_interval=self.__rtt_sampling.get_interval())
+		else:
+			self.__send_timer.cancel()
+		self.__push()
+		self.__maybe_fin()
+		return
+
+	def __delay_ack(self):
+		"""Delayed ACK of an in-order segment while we are sending data, which carries it: it waits
+		for the next segments (up to every fourth), or :attr:DELAYED_ACK at most. Otherwise every segment is ACKed right away.
+		"""
+		if len(self.__send_window) == 0 and len(self.__send_buffer) == 0:
+			return
+		if self.__ack_num - self.__ack_sent >= 4 * self.__mss:
+			return
+		self.__ack_due = False
+		if not self.__delayed_ack.is_alive():
+			self.__delayed_ack.restart(new_interval=TCP_SERVER.DELAYED_ACK)
+		return
+
+	def __send_delayed_ack(self):
+		"""Delayed ACK timer expired: sends the ACK no data carried meanwhile
+		"""
+		with self.__state_lock:
+			if self.__state in (TCP_SERVER.ESTABLISHED, TCP_SERVER.CLOSE_WAIT) and self.__ack_num > self.__ack_sent:
+				self.send('')
+		return
+
+	def __retransmit_data(self):
+		"""Send timer expired: re-sends the oldest unacked segment, with a doubled timeout
+		"""
+		with self.__state_lock:
+			if self.__state not in (TCP_SERVER.ESTABLISHED, TCP_SERVER.CLOSE_WAIT) or len(self.__send_window) == 0:
+				return
+			segment = self.__send_window.first()
+			self.send_wire(segment.wire, self.ack_addr, event=trace.RETRANSMIT)
+			self.__send_window.mark_retransmit()
+			self.__send_window.invalidate_samples() # Karn's algorithm
+			self.stats.incr('retransmits_timeout')
+			self.__rtt_sampling.double_interval()
+			self.__send_timer.restart(new_interval=self.__rtt_sampling.get_interval())
+		return
+
+	def __ack_options(self):
+		options = ()
+		if self.__crc:
+			options += ((tcp_options.CHECKSUM_DATA, bytes(4)),) # first, see Packet.compute_checksum
+		if self.__fec is not None:
+			# lets the client count the losses that parity masked
+			options += ((tcp_options.FEC, RECOVERED.pack(self.__fec.recovered)),)
+		if self.__path_echo is not None:
+			path, number = self.__path_echo
+			options += ((tcp_options.MULTIPATH, ECHO.pack(path, number, self.__path_received[path])),)
+		if self.__sack:
+			# a duplicate is reported once, the segments queued out of order (past the ACK) until the hole fills
+			blocks = [self.__dsack] if self.__dsack is not None else []
+			self.__dsack = None
+			blocks += tcp_sack.blocks(
+				((pkt.header.seq_num, pkt.header.seq_num + (len(pkt.payload) or 1))
+					for pkt in self.__received_seqs if pkt.header.seq_num > self.__ack_num),
+				latest=self.__sack_latest)
+			if len(blocks) > 0:
+				room = tcp_options.MAX_LEN - tcp_options.encoded_len(options) - 2
+				options += ((tcp_options.SACK, tcp_sack.pack(blocks, room)),)
+		return options
+
+	def __send_syn_ack(self):
+		"""Sends (or re-sends, for a retransmitted SYN) the SYN-ACK of the current connection
+		"""
+		client_address = self.ack_addr
+		_, src_port = self.get_info()
+		header = TCPHeader(
+			src_port=src_port,
+			dst_port=client_address[1],
+			seq_num=self.__iss,
+			ack_num=self.__ack_num,
+			_flags=Flags(cwr=0, ece=int(self.__ecn), ack=1, syn=1, fin=0),
+			rcvwd=self.__rcvwd,
+			options=self.__syn_ack_options)
+		packet = Packet(header, b'')
+		packet.compute_checksum()
+		self.send_packet(packet, client_address)
+		self.__seq_num = self.__iss + 1
 		return packet
 
+	def __handle_syn(self, packet:Packet, client_address):
+		"""Passive open: answers the SYN of a (new) client with a SYN-ACK
+
+		The client's MSS option is honored, and a fast open cookie is handed out when asked for.
+		If the SYN carries data along with a valid cookie, that data is accepted right away.
+
+		Returns:
+			Packet: the data carried by the SYN as a regular data packet, None if there is none
+		"""
+		if self.__state in (TCP_SERVER.SYN_RCVD, TCP_SERVER.ESTABLISHED) and packet.header.seq_num == self.__irs:
+			# retransmitted SYN, our SYN-ACK got lost
+			self.__send_syn_ack()
+			self.__syn_ack_time = None # Karn's algorithm, no sample from a retransmitted SYN-ACK
+			return None
+
+		# a new connection
+		self.reset()
+		self.stats.reset()
+		self.__connections += 1
+		self.__irs = packet.header.seq_num
+		self.__ack_num = self.__irs + 1
+		self.__iss = self.__isn if self.__isn is not None else util.random_isn()
+		self.__send_base = self.__iss + 1
+		self.__ack_sent = 0
+		self.__peer_window = max(packet.header.rcvwd, 1)
+		self.__write_shutdown = False
+		peer_mss = packet.header.option(tcp_options.MSS)
+		self.__mss = min(globals.MSS, struct.unpack('H', peer_mss)[0]) if peer_mss is not None else globals.MSS
+		self.__tuner = WindowTuner(TCP_SERVER.RCVWD, self.__max_rcvwd, self.__mss)
+		options = [(tcp_options.MSS, struct.pack('H', globals.MSS))]
+		self.__sack = self.__sack_enabled and packet.header.option(tcp_options.SACK_PERMITTED) is not None
+		if self.__sack:
+			options.append((tcp_options.SACK_PERMITTED, b''))
+		self.__multipath = self.__multipath_enabled and packet.header.option(tcp_options.MULTIPATH) is not None
+		if self.__multipath:
+			options.append((tcp_options.MULTIPATH, b''))
+
+		data_packet = None
+		cookie = packet.header.option(tcp_options.FASTOPEN)
+		if cookie is not None and self.__cookies is not None:
+			client_ip = client_address[0] if client_address is not None else ''
+			if self.__cookies.is_valid(client_ip, cookie):
+				if len(packet.payload) > 0:
+					# data in SYN, occupying the seq nums right after the client's ISN. Copied, as the
+					# SYN's receive buffer goes back to the pool before the data is written
+					data_packet = Packet(TCPHeader(
+						src_port=packet.header.src_port,
+						dst_port=packet.header.dst_port,
+						seq_num=self.__irs + 1,
+						ack_num=packet.header.ack_num,
+						_flags=Flags(cwr=0, ece=0, ack=0, syn=0, fin=0),
+						rcvwd=packet.header.rcvwd), bytes(packet.payload))
+					self.__ack_num = self.__next_ack(data_packet)
+					self.stats.incr('bytes_delivered', len(packet.payload))
+					logging.info('accepted %s bytes of fast open data', len(packet.payload))
+			else:
+				# cookie request, or a stale cookie
+				options.append((tcp_options.FASTOPEN, self.__cookies.make(client_ip)))
+		# ECN setup SYN (RFC 3168): ECE and CWR, answered with ECE alone
+		self.__ecn = self.__ecn_enabled and packet.header.flags.ece == 1 and packet.header.flags.cwr == 1
+		self.__ece = False
+		self.__fec = None
+		if self.__fec_enabled and packet.header.option(tcp_options.FEC) is not None:
+			self.__fec = FecDecoder()
+			options.append((tcp_options.FEC, b''))
+		self.__crc = self.__crc_enabled and packet.header.option(tcp_options.CHECKSUM_REQUEST) == bytes([tcp_options.CRC32])
+		if self.__crc:
+			options.append((tcp_options.CHECKSUM_REQUEST, bytes([tcp_options.CRC32])))
+		self.__compression = None
+		offered = packet.header.option(tcp_options.COMPRESS)
+		if self.__compress and offered:
+			self.__compression = next((method for method in offered if method in METHODS.values()), None)
+			if self.__compression is not None:
+				options.append((tcp_options.COMPRESS, bytes([self.__compression])))
+		self.__session = self.__session_enabled and packet.header.option(tcp_options.SESSION) is not None
+		if self.__session:
+			options.append((tcp_options.SESSION, b''))
+		self.__resume = None
+		self.__digest = None
+		identity = packet.header.option(tcp_options.RESUME)
+		if self.__checkpoint is not None and identity is not None and len(identity) == resume.IDENTITY.size:
+			# as many ranges received as the room left takes, the client sends the rest
+			size, fingerprint = resume.IDENTITY.unpack(identity)
+			room = tcp_options.MAX_LEN - sum(len(value) + 2 for _, value in options) - 2
+			ranges = resume.pack_ranges(self.__checkpoint.ranges_for(size, fingerprint), room)
+			options.append((tcp_options.RESUME, ranges))
+			self.__resume = (size, resume.unpack_ranges(ranges))
+		self.__syn_ack_options = tuple(options)
+
+		self.__send_syn_ack()
+		self.__syn_ack_time = self.__clock.time()
+		self.__state = TCP_SERVER.SYN_RCVD
+		logging.info('SYN from %s, irs=%s iss=%s mss=%s', client_address, self.__irs, self.__iss, self.__mss)
+		return data_packet
+
+	def __in_window(self, packet:Packet):
+		"""Whether @packet belongs to the current connection's receive window. Rejects e.g. datagrams of a previous connection
+		"""
+		return self.stream_base <= packet.header.seq_num <= self.__ack_num + self.__tuner.window * self.__mss
+
 	def __next_ack(self, packet:Packet):
 		# 1. add the received packet to list of received_seqs
 		if packet.header.seq_num < self.__ack_num:
+			self.__report_duplicate(packet)
+			return self.__ack_num
+		if any(pkt.header.seq_num == packet.header.seq_num for pkt in self.__received_seqs):
+			# queued already, e.g. rebuilt from parity and then retransmitted: not the same packet (checksum, ...)
+			self.__report_duplicate(packet)
 			return self.__ack_num
 		
 		self.__received_seqs.add(packet)
+		self.__sack_latest = packet.header.seq_num
 		rcvd_min_seq = min([pkt.header.seq_num for pkt in self.__received_seqs])
-		logging.debug(f"rcvd_min_seq={rcvd_min_seq} and self.__ack_num={self.__ack_num}")
+		logging.debug("rcvd_min_seq=%s and self.__ack_num=%s", rcvd_min_seq, self.__ack_num)
 		if rcvd_min_seq > self.__ack_num:
 			return self.__ack_num # the first packet is out of order
 		
@@ -148,23 +732,113 @@ class TCP_SERVER(UDP_SERVER):
 			sort_key=lambda pkt: pkt.header.seq_num,
 			next_diff=lambda pkt: len(pkt.payload) or 1,
 			pop=True)
+		# only segments past the ACK stay queued, see header prediction in :func:self.__post_recv
+		self.__received_seqs.discard(largest_seq_pkt)
 
 		# 3. ACK = last_recvned_packet.seq_num + len
 		num_bytes = len(largest_seq_pkt.payload) or 1
-		logging.debug(f"new_ack_cumu={largest_seq_pkt.header.seq_num + num_bytes}")
+		logging.debug("new_ack_cumu=%s", largest_seq_pkt.header.seq_num + num_bytes)
 		return largest_seq_pkt.header.seq_num + num_bytes
 	
-	def __post_recv(self, packet:Packet):
-		logging.debug(f"current seq_num={self.__seq_num}, old_ack_num={self.__ack_num}")
+	def __report_duplicate(self, packet:Packet):
+		"""A segment came in twice: the next ACK says so (D-SACK), e.g. for the client to tell a spurious retransmission
+		"""
+		if self.__sack:
+			self.__dsack = (packet.header.seq_num, packet.header.seq_num + (len(packet.payload) or 1))
+		return
+
+	def __post_recv(self, packet:Packet, client_address=None):
+		header = packet.header
+		num_bytes = len(packet.payload)
+		if header.seq_num == self.__ack_num and self.__state == TCP_SERVER.ESTABLISHED and num_bytes > 0 \
+			and not header.flags.syn and not header.flags.fin and len(self.__received_seqs) == 0:
+			# header prediction: the next in-order data segment with nothing queued out of order,
+			# so the ACK just moves past it
+			self.__ack_num += num_bytes
+			self.stats.incr('bytes_delivered', num_bytes)
+			self.__autotune()
+			self.__post_recv_ack(header)
+			self.__delay_ack()
+			return packet
+
+		logging.debug("current seq_num=%s, old_ack_num=%s", self.__seq_num, self.__ack_num)
+		if packet.header.is_syn():
+			return self.__handle_syn(packet, client_address)
+		if self.__state == TCP_SERVER.SYN_RCVD:
+			# 3rd step of the handshake, or data whose ACK field does the same
+			if not packet.header.is_ack() or packet.header.ack_num != self.__iss + 1:
+				logging.debug('dropping segment not acking our SYN: %s', packet.header)
+				return None
+			self.__state = TCP_SERVER.ESTABLISHED
+			if self.__syn_ack_time is not None:
+				sample = self.__clock.time() - self.__syn_ack_time
+				self.__rtt_sampling.update_interval(sample)
+				self.__tuner.sample_rtt(sample)
+			logging.info('connection established')
+		if self.__state == TCP_SERVER.LAST_ACK:
+			return self.__post_recv_last_ack(packet)
+		if self.__state == TCP_SERVER.LISTEN:
+			if packet.header.is_fin() and packet.header.seq_num + 1 == self.__ack_num and self.__fin_packet is not None:
+				# the FIN of the previous connection again, our FIN+ACK got lost
+				self.send_packet(self.__fin_packet, self.ack_addr, event=trace.RETRANSMIT)
+				return None
+			logging.debug('dropping segment of no connection: %s', packet.header)
+			return None
+		if not self.__in_window(packet):
+			logging.debug('dropping out of window segment: %s', packet.header)
+			return None
+		self.__post_recv_ack(header)
+		if len(packet.payload) == 0 and not packet.header.is_fin():
+			# pure ACK, nothing to deliver nor to ACK
+			self.__ack_due = False
+			return None
 		
+		old_ack_num = self.__ack_num
 		self.__ack_num = self.__next_ack(packet) # position of next byte
-		logging.debug(f'sender new cumu ack {self.__ack_num}')
-		if packet.header.is_fin() and packet.header.seq_num + 1 >= self.__ack_num:
-			logging.info('closing connection')
-			logging.info(packet)
-			packet = self.close_connection(packet)
+		logging.debug('sender new cumu ack %s', self.__ack_num)
+		self.stats.incr('bytes_delivered', self.__ack_num - old_ack_num)
+		self.stats.set('ooo_queue_depth', len(self.__received_seqs))
+		if self.__ack_num > old_ack_num:
+			self.__autotune()
+		if packet.header.is_fin():
+			self.__rcvd_fin_seq = packet.header.seq_num
+			if self.__resume is not None:
+				self.__digest = packet.header.option(tcp_options.RESUME)
+		if self.__rcvd_fin_seq is not None and self.__ack_num >= self.__rcvd_fin_seq + 1 and self.__state == TCP_SERVER.ESTABLISHED:
+			# everything up to and including the FIN is in, whichever packet filled the last gap
+			logging.info('client done sending')
+			self.__state = TCP_SERVER.CLOSE_WAIT
+			self.__maybe_fin(packet)
+		return None if packet.header.is_fin() else packet
+
+	def __maybe_fin(self, packet:Packet=None):
+		"""Answers the client's FIN with ours, once everything written is ACKed (and, if
+		:attr:self.duplex, once we are done writing)
+		"""
+		if self.__state != TCP_SERVER.CLOSE_WAIT or len(self.__send_buffer) > 0 or len(self.__send_window) > 0:
+			return
+		if self.__duplex and not self.__write_shutdown:
+			return
+		logging.info('closing connection')
+		self.close_connection(packet)
+		return
+
+	def __post_recv_last_ack(self, packet:Packet):
+		"""Handles a packet while waiting for the client to ACK our FIN
+
+		Returns:
+			None: nothing is delivered anymore
+		"""
+		fin_seq = self.__fin_packet.header.seq_num
+		if packet.header.is_ack() and packet.header.ack_num >= fin_seq + 1:
+			if self.__fin_retries == 0:
+				self.__rtt_sampling.update_interval(self.__clock.time() - self.__fin_time)
 			logging.info('connection closed')
-		return packet
+			self.reset()
+		elif packet.header.is_fin():
+			# the client did not get our FIN+ACK
+			self.send_packet(self.__fin_packet, self.ack_addr, event=trace.RETRANSMIT)
+		return None
 
 	def receive(self):
 		"""Blocking receive a packet
@@ -175,17 +849,109 @@ class TCP_SERVER(UDP_SERVER):
 		"""
 		# 1. receive packet
 		packet, client_address = self.receive_packet()
+		received = self.process(packet, client_address, ce=self.__ecn and self.__congested())
+		if received is not packet and packet is not None:
+			self.release(packet) # nothing to deliver, or a parity packet that got a segment rebuilt
+		return received, client_address
+
+	def __fec_receive(self, packet:Packet):
+		"""Passes data packets through, and turns a parity packet into the segment of its group
+		that was lost, None if no segment is missing or it cannot be rebuilt
+		"""
+		option = packet.header.option(tcp_options.FEC)
+		if option is None or packet.header.is_syn():
+			return packet # e.g. the SYN of the next client, asking for FEC
+		if len(option) != PARITY.size:
+			return None
+		recovered = self.__fec.recover(option, packet.payload)
+		if recovered is None:
+			return None
+		seq_num, payload = recovered
+		self.stats.incr('fec_recovered')
+		logging.debug('rebuilt %s bytes at %s from parity', len(payload), seq_num)
+		header = TCPHeader(
+			src_port=packet.header.src_port,
+			dst_port=packet.header.dst_port,
+			seq_num=seq_num,
+			ack_num=packet.header.ack_num,
+			_flags=Flags(cwr=0, ece=0, ack=1, syn=0, fin=0),
+			rcvwd=packet.header.rcvwd)
+		return Packet(header, payload)
+
+	def __congested(self):
+		"""Whether the packet just received counts as CE-marked: by the network, or by the backlog
+		of datagrams waiting in our socket
+		"""
+		if self.ce_marked:
+			return True
+		if self.__ecn_threshold <= 0:
+			return False
+		queued = self.queued()
+		if queued is None:
+			self.__ecn_threshold = 0 # unknown here, do not ask again
+			return False
+		return queued >= self.__ecn_threshold
+
+	def __ecn_receive(self, packet:Packet, ce):
+		"""ECN receiver side: ECE goes on every header from a CE-marked data segment on, until
+		a segment with CWR says the client reduced its window
+		"""
+		if packet.header.flags.cwr:
+			self.__ece = False
+		if ce and len(packet.payload) > 0:
+			self.__ece = True
+			self.stats.incr('ce_marks')
+		return
+
+	def __multipath_receive(self, packet:Packet):
+		"""Counts a data segment of a multipath client over the path it came, for the next ACK to echo
+		"""
+		value = packet.header.option(tcp_options.MULTIPATH)
+		if value is None or len(value) != PATH.size:
+			return
+		path, number = PATH.unpack(value)
+		self.__path_received[path] = self.__path_received.get(path, 0) + 1
+		self.__path_echo = (path, number)
+		return
+
+	def process(self, packet:Packet, client_address=None, ce=False):
+		"""Processes a packet received from client, e.g. one replayed from a trace
+
+		Args:
+			packet (Packet): packet received, None if it could not be deserialized
+			client_address (tuple, optional): where the packet came from. Defaults to None.
+			ce (bool, optional): the packet was marked Congestion Experienced. Defaults to False.
+
+		Returns:
+			Packet: the packet if it is not corrupt, else None. For a parity packet, the segment it
+			rebuilt, if any
+		"""
 		# 2. check if packet is corrupt
+		self.__ack_due = True
 		if packet is not None and not packet.is_corrupt():
 			# 3. if not, update ack_num
-			packet = self.__post_recv(packet)
+			with self.__state_lock:
+				if self.__ecn and not packet.header.flags.syn:
+					self.__ecn_receive(packet, ce)
+				if self.__multipath and not packet.header.flags.syn:
+					self.__multipath_receive(packet)
+				if self.__fec is not None:
+					packet = self.__fec_receive(packet)
+				if packet is not None:
+					packet = self.__post_recv(packet, client_address)
+				if self.__fec is not None and packet is not None and len(packet.payload) > 0:
+					self.__fec.add(packet.header.seq_num, packet.payload)
 		else:
+			self.stats.incr('corrupt_drops')
+			if packet is not None and self.tracer is not None:
+				self.tracer.record(trace.DROP, trace.RX, packet)
 			packet = None
-		return packet, client_address
+		return packet
 
 	def __send_fin(self):
-		logging.debug('sending fin')
-		logging.debug(f"current seq_num={self.__seq_num}, old_ack_num={self.__ack_num}")
+		"""Sends our FIN, which also ACKs the client's, and arms its retransmission timer
+		"""
+		logging.debug("current seq_num=%s, old_ack_num=%s", self.__seq_num, self.__ack_num)
 		# 1. construct packet
 		client_address = self.ack_addr
 		_, src_port = self.get_info()
@@ -194,84 +960,82 @@ class TCP_SERVER(UDP_SERVER):
 			dst_port=client_address[1], 
 			seq_num=self.__seq_num, 
 			ack_num=self.__ack_num, 
-			_flags=Flags(cwr=0, ece=0, ack=0, syn=0, fin=1), 
-			rcvwd=10)
+			_flags=Flags(cwr=0, ece=0, ack=1, syn=0, fin=1), 
+			rcvwd=self.__rcvwd,
+			options=self.__ack_options())
 		packet = Packet(header, '')
 		packet.compute_checksum()
 
-		# 2. send packet
-		self.send_packet(packet, client_address)
+		# 2. send packet, keeping it for retransmission
+		self.__fin_packet = packet
+		self.__fin_time = self.__clock.time()
+		self.__fin_retries = 0
 		self.__state = TCP_SERVER.LAST_ACK
-		logging.info(f'sent {packet}')
-		# store for potential retransmit
-		self.__fin_packets[packet.header.seq_num] = packet
+		self.send_packet(packet, client_address)
+		logging.info('sent %s', packet)
+		self.__fin_timer = timer.TCPTimer(self.__rtt_sampling.timeout_interval, self.__retransmit_fin, clock=self.__clock)
+		self.__fin_timer.start()
 
 		# 3. update seq_num, etc
 		self.__post_send(packet)
 		return packet
 
-	def __wait_fin_ack(self, fin_packet:Packet):
-		logging.debug('wait fin ack')
-		
-		fin_seq = fin_packet.header.seq_num
-		while self.__state == TCP_SERVER.LAST_ACK:
-			packet, client_address = self.receive_packet()
-			# check if packet is corrupt
-			if packet is not None and not packet.is_corrupt():
-				# check if is the ACK for fin
-				logging.debug(f'sent {fin_packet.header} need fin ack wait: {packet.header}')
-				if packet.header.ack_num >= fin_seq + 1 and packet.header.is_ack():
-					self.send('')
-					self.__state = TCP_SERVER.CLOSED
-					logging.debug(f"sent: {packet}")
-					return packet
-				else:
-					packet = self.__fin_packets.get(packet.header.ack_num)
-					if packet is None:
-						logging.error(f"No fix for packet {packet}, I have {self.__fin_packets}")
-					else:
-						self.send_packet(packet, client_address)
-			# wait
-			time.sleep(0.2)
+	def __retransmit_fin(self):
+		"""FIN timer expired: re-sends our FIN with a doubled timeout, or gives up
+		after :attr:MAX_FIN_RETRIES and goes back to LISTEN
+		"""
+		with self.__state_lock:
+			if self.__state != TCP_SERVER.LAST_ACK:
+				return
+			if self.__fin_retries >= TCP_SERVER.MAX_FIN_RETRIES:
+				logging.warning('no ACK for our FIN after %s retransmissions, closing anyway', self.__fin_retries)
+				self.reset()
+				return
+			self.__fin_retries += 1
+			self.send_packet(self.__fin_packet, self.ack_addr, event=trace.RETRANSMIT)
+			self.stats.incr('retransmits_timeout')
+			self.__fin_timer.restart(self.__fin_timer.interval * 2)
 		return
 
 	def reset(self):
 		"""Resets the server's state. Waiting for a new client
+
+		Sequence numbers and our last FIN are kept until the next SYN, so that a
+		retransmitted FIN of the finished connection can still be answered.
 		"""
-		self.__seq_num = 0
-		self.__ack_num = 0 # assumes both sides start with seq=0
+		if self.__fin_timer is not None:
+			self.__fin_timer.cancel()
+		self.__send_timer.cancel()
+		self.__delayed_ack.cancel()
+		self.__send_buffer.clear()
+		self.__send_window.clear()
 		self.__state = TCP_SERVER.LISTEN
 		self.__received_seqs = set()
+		self.__sack_latest = None
+		self.__dsack = None
+		self.__path_received = {}
+		self.__path_echo = None
+		self.__rcvd_fin_seq = None
+		self.__tuner = WindowTuner(TCP_SERVER.RCVWD, self.__max_rcvwd, self.__mss)
+		self.set_rcvwd(None)
 		pass
 
-	def close_connection(self, packet:Packet):
+	def close_connection(self, packet:Packet=None):
 		"""Inner helper function when client intiates FIN requests. 
 		
-		Essentially performs the FIN handshake with the client and does 
-		:func:self.reset when done.
+		Answers the client's FIN with our own FIN (carrying the ACK), once what we wrote is
+		all ACKed: the client's ACK of it is handled by :func:self.process like any other
+		packet, and :func:self.reset is done once it arrives (or the FIN timer gives up).
 
 		Args:
-			packet (Packet): FIN packet received from client
+			packet (Packet, optional): packet that completed the stream up to the client's FIN
 
 		Returns:
 			None: None
 		"""
-		# 1. send ack for fin
-		packet = self.send('')
-		logging.info(f'sent {packet}')
-		# store for potential retransmit
-		self.__fin_packets[packet.header.seq_num] = packet
 		self.__state = TCP_SERVER.CLOSE_WAIT
-
-		# 2. sned fin
-		fin_packet = self.__send_fin()
-
-		# 3. wait for ack
-		# fin_ack = self.__wait_fin_ack(fin_packet) #TODO
-		# 4. reset
-		self.reset()
-		
-		logging.debug(f"reset to {self.__seq_num} and {self.__ack_num}")
+		self.__send_fin()
+		logging.debug("waiting for the ACK of our FIN, seq_num=%s ack_num=%s", self.__seq_num, self.__ack_num)
 		return None
 
 	def start(self, args):
@@ -284,35 +1048,198 @@ class TCP_SERVER(UDP_SERVER):
 		"""
 		server = self._socket
 		server.bind(self._serveraddress)
-		# other application related init
-		init(args)
+		# other application related init, unless there is a transfer to resume on file
+		if self.__checkpoint is None or len(self.__checkpoint.ranges) == 0:
+			init(args)
 		self.__state = TCP_SERVER.LISTEN
 		print("The server is ready to receive")
 
 		while True:
 			try:
-				self.__state = TCP_SERVER.ESTABLISHED
 				service_client(self, args)
-				self.__state = TCP_SERVER.LISTEN
 			except Exception as err:
 				print(err)
 				pass
 		return
 
 
-def init(args):
-	if not Path(args.file).exists():
+def init(args, compression=None, resume=None, checkpoint=None, session=False):
+	"""Prepares the output file for a new client (truncating it, unless the client resumes a
+	transfer), and its write-behind thread with --write-queue. The files of a session go to
+	the --session directory instead. With --reply, the file sent back is opened from the start.
+
+	Args:
+		args (namespace): command line arguments
+		compression (int, optional): compression method of the client's stream. Defaults to None.
+		resume (tuple, optional): file size and ranges received, see :attr:TCP_SERVER.resume. Defaults to None.
+		checkpoint (Checkpoint, optional): where the ranges written go, when resuming. Defaults to None.
+		session (bool, optional): the client sends a session of files. Defaults to False.
+	"""
+	global rcvd, last_wrote, decompressor, inflated, stream_map, resume_checkpoint, verified
+	global session_reader, session_root, session_file, reply
+	resume_checkpoint = None # the previous client's writes left are not the new client's ranges
+	close_sink() # the previous client's data goes out before the file is truncated
+	stream_map = None
+	session_reader = SessionReader() if session else None
+	session_root = args.session if session else None
+	session_file = None
+	if not session and not Path(args.file).exists():
 		Path(args.file).touch()
+	if session:
+		logging.info('session of files to %s', session_root)
+	elif resume is not None:
+		# what is there already stays, the client sends what is missing back to back
+		size, received = resume
+		os.truncate(args.file, size)
+		stream_map = StreamMap(size, received)
+		resume_checkpoint = checkpoint
+		logging.info('resuming a transfer of %s bytes, %s left', size, stream_map.length)
 	else:
 		with open(args.file, 'r+') as f:
 			f.truncate(0)
+	verified = None
+	rcvd_seq.clear()
+	rcvd = []
+	last_wrote = None
+	decompressor = StreamDecompressor(compression) if compression is not None else None
+	inflated = 0
+	if reply is not None:
+		reply.close()
+	reply = open(args.reply, 'rb') if args.reply else None
+	if args.write_queue > 0:
+		open_sink(args.file if not session else None, capacity=args.write_queue, sync_every=args.fsync_batch,
+			flushed=resume_checkpoint.commit if resume_checkpoint is not None else None)
 	return
 
-def __to_file(packets:Packet, dst:str):
-	with open(dst, 'ab+') as openfile:
+def open_sink(dst:str, capacity=256, sync_every=0, flushed=None):
+	"""Makes :func:to_file hand its writes to @dst over to a :class:WriteBehind thread,
+	instead of writing them before returning
+	"""
+	global writer
+	close_sink()
+	writer = WriteBehind(dst, capacity=capacity, sync_every=sync_every, flushed=flushed)
+	return writer
+
+def close_sink():
+	"""Waits for every pending write, then stops the write-behind thread, if any, and
+	saves the ranges written when resuming
+	"""
+	global writer
+	if writer is not None:
+		writer.close()
+		writer = None
+	if resume_checkpoint is not None:
+		resume_checkpoint.commit(force=True)
+	return
+
+def verify(dst:str, digest):
+	"""Checks a resumed transfer, once the whole stream is in, against the digest of the file
+	the client sent along with its FIN. Its checkpoint is done with either way: after a
+	mismatch, the next transfer starts over.
+
+	Returns:
+		bool: whether the file matches
+	"""
+	global verified
+	close_sink() # everything is on file first
+	verified = resume.file_digest(dst, stream_map.size) == digest
+	if verified:
+		logging.info('%s verified, %s bytes', dst, stream_map.size)
+	else:
+		logging.error('%s does not match the digest of the file sent', dst)
+	if resume_checkpoint is not None:
+		resume_checkpoint.remove()
+	return verified
+
+def __pieces(offset, data):
+	"""Where @data, at @offset of the stream, goes in the file: (position, data) pieces, a single
+	one unless resuming
+	"""
+	if stream_map is None:
+		return [(offset, data)]
+	return [(position, data[start:end]) for position, start, end in stream_map.spans(offset, len(data))]
+
+def __written(position, length, done=None):
+	"""Completion of a write at @position of the file, when resuming
+	"""
+	if resume_checkpoint is not None:
+		resume_checkpoint.add(position, position + length)
+	if done is not None:
+		done()
+	return
+
+def __write(openfile, offset, data, done=None):
+	"""Writes @data at @offset of the stream to @openfile, or queues it to the writer thread
+	if @openfile is None, and calls @done once it is written
+	"""
+	if stream_map is None and openfile is None:
+		writer.write(offset, data, done)
+		return
+	pieces = __pieces(offset, data)
+	for i, (position, piece) in enumerate(pieces):
+		then = done if i == len(pieces) - 1 else None
+		if openfile is None:
+			writer.write(position, piece, functools.partial(__written, position, len(piece), then))
+			continue
+		openfile.seek(position)
+		openfile.write(piece)
+		__written(position, len(piece), then)
+	if len(pieces) == 0 and done is not None:
+		done() # past the end of the file
+	return
+
+def __session_write(data, done=None):
+	"""Writes the next @data of a session's stream to the files it belongs to, and calls @done
+	once it is written
+	"""
+	global session_file
+	# 1. where each piece goes
+	actions = []
+	for kind, key, value in session_reader.feed(data):
+		if kind == session.OPEN:
+			session_file = session.destination(session_root, key)
+			if session_file is None:
+				logging.error('ignoring file %s, outside of %s', key, session_root)
+				continue
+			os.makedirs(os.path.dirname(session_file), exist_ok=True)
+			actions.append((session.OPEN, session_file, value))
+		elif kind == session.DATA and session_file is not None:
+			actions.append((session.DATA, session_file, (key, value)))
+		elif kind == session.CLOSE:
+			logging.info('received %s, %s bytes', key, value)
+	# 2. in order, @done along with the last write
+	last = max((i for i, action in enumerate(actions) if action[0] == session.DATA), default=-1)
+	for i, (kind, path, value) in enumerate(actions):
+		if kind == session.OPEN and writer is not None:
+			writer.reopen(path, truncate=value)
+		elif kind == session.OPEN:
+			with open(path, 'r+b' if os.path.exists(path) else 'w+b') as openfile:
+				openfile.truncate(value)
+		elif writer is not None:
+			writer.write(*value, done if i == last else None)
+		else:
+			with open(path, 'r+b') as openfile:
+				openfile.seek(value[0])
+				openfile.write(value[1])
+	if done is not None and (writer is None or last == -1):
+		done()
+	return
+
+def __to_file(packets:Packet, dst:str, base:int, release):
+	if decompressor is not None:
+		__inflate_to_file(packets, dst, release)
+		return
+	if session_reader is not None:
+		for packet in packets:
+			__session_write(packet.payload, functools.partial(release, packet))
+		return
+	if writer is not None:
+		for packet in packets:
+			__write(None, packet.header.seq_num - base, packet.payload, functools.partial(release, packet))
+		return
+	with open(dst, 'r+b') as openfile:
 		for packet in packets:
-			logging.debug(f'writing {packet.payload} to {packet.header.seq_num}')
-			openfile.seek(packet.header.seq_num)
+			logging.debug('writing %s to %s', packet.payload, packet.header.seq_num - base)
 			"""
 			content = openfile.read()
 			# insert new content
@@ -322,21 +1249,72 @@ def __to_file(packets:Packet, dst:str):
 			openfile.write(content)
 			openfile.truncate()
 			"""
-			openfile.write(packet.payload)
+			__write(openfile, packet.header.seq_num - base, packet.payload)
+	if resume_checkpoint is not None:
+		resume_checkpoint.commit()
+	for packet in packets:
+		release(packet)
+
+def __inflate_to_file(packets:Packet, dst:str, release):
+	"""A compressed stream comes in order: appends what its packets decompress to
+	"""
+	global inflated
+	output = b''.join(decompressor.decompress(packet.payload) for packet in packets)
+	for packet in packets:
+		release(packet)
+	if len(output) == 0:
+		return
+	if session_reader is not None:
+		__session_write(output)
+	elif writer is not None:
+		__write(None, inflated, output)
+	else:
+		with open(dst, 'r+b') as openfile:
+			__write(openfile, inflated, output)
+		if resume_checkpoint is not None:
+			resume_checkpoint.commit()
+	inflated += len(output)
+	return
 
 rcvd_seq = set()
 rcvd = []
-last_wrote = 0
-def to_file(packet:Packet, dst:str):
+last_wrote = None
+writer = None
+decompressor = None # of the current client's stream, if compressed
+inflated = 0 # bytes written by :func:__inflate_to_file
+stream_map = None # where the stream goes in the file, when resuming
+resume_checkpoint = None # ranges of the file written, when resuming
+verified = None # whether the file of a resumed transfer matches its digest, once complete
+session_reader = None # splits the stream of a session into files
+session_root = None # directory the files of a session go to
+session_file = None # where the current file of the session goes
+reply = None # the rest of the --reply file, for the current client
+def to_file(packet:Packet, dst:str, base=0, release=None):
 	"""Writes the content of a packet to a file
 
 	Args:
 		packet (Packet): a non-corrupt packet received
 		dst (str): destination file to write to
+		base (int, optional): seq num of the first byte of the file, see :func:TCP_SERVER.stream_base. Defaults to 0.
+		release (Callable, optional): called with every packet whose payload is written or discarded,
+			e.g. :func:TCP_SERVER.release. With a write-behind thread (see :func:open_sink), possibly
+			from that thread, after this returns. Defaults to None.
 	"""
 	global rcvd, last_wrote
 
+	release = release or (lambda packet: None)
+	if last_wrote is None:
+		last_wrote = base
+	if packet.header.seq_num < last_wrote:
+		release(packet)
+		return # already written
+	if packet.header.seq_num == last_wrote and len(rcvd) == 0:
+		# in order with nothing queued, e.g. after header prediction: append right away
+		__to_file([packet], dst, base, release)
+		last_wrote += len(packet.payload) or 1
+		return
 	if packet.header.seq_num in rcvd_seq:
+		release(packet)
 		return
 	
 	rcvd.append(packet)
@@ -358,7 +1336,7 @@ def to_file(packet:Packet, dst:str):
 
 	# 3. write the consecutive ones to file
 	ready_packets = sorted(ready_packets, key=lambda pkt: pkt.header.seq_num)
-	__to_file(ready_packets, dst)
+	__to_file(ready_packets, dst, base, release)
 	last_wrote = largest_seq_pkt.header.seq_num + (len(largest_seq_pkt.payload) or 1)
 
 	# 4. clean up
@@ -369,26 +1347,59 @@ def to_file(packet:Packet, dst:str):
 	rcvd = new_rcvd
 	return
 
+def __send_reply(server:TCP_SERVER):
+	"""Writes the next part of the --reply file to the connection, as much as the window takes
+	right away, and shuts our side down once all of it is written
+	"""
+	global reply
+	room = server.free_window
+	if room == 0:
+		return
+	data = reply.read(room)
+	if len(data) > 0:
+		server.write(data)
+		return
+	reply.close()
+	reply = None
+	server.shutdown()
+	return
+
 def service_client(server:TCP_SERVER, args):
 	"""Specifies what to do when received something from client
 	
 	Essentially does 1) receive 2) check packet received 
 	3) write to file 4) send ACK
 
+	With a write-behind thread, 3) only queues the data, and the ACK advertises the room left
+	in that queue (at most the autotuned window) as receive window. With --reply, the
+	file sent back tops up the window in between, and its segments carry the ACK.
+
 	Args:
 		server (TCP_SERVER): running instance of TCP_SERVER
 		args (namespace): command line arguments
 	"""
 	# receive packet
+	connections = server.connections
 	received, client_address = server.receive()
-	logging.info(f"[LOG] serviced {client_address}")
-	logging.info(f"{received or 'Discarded or Residual'}")
+	if server.connections != connections:
+		# a new client, start over
+		init(args, compression=server.compression, resume=server.resume, checkpoint=server.checkpoint, session=server.session)
+	logging.info("[LOG] serviced %s", client_address)
+	logging.info("%s", received or 'Discarded or Residual')
 
 	if received is not None:
 		# write to file
-		to_file(received, dst=args.file)
+		to_file(received, dst=args.file, base=server.stream_base, release=server.release)
+		if writer is not None:
+			server.set_rcvwd(writer.free)
+	if server.digest is not None and server.state != TCP_SERVER.ESTABLISHED and verified is None:
+		# the whole stream is in
+		verify(args.file, server.digest)
+
+	if reply is not None and server.state in (TCP_SERVER.ESTABLISHED, TCP_SERVER.CLOSE_WAIT):
+		__send_reply(server)
 
-	# send ACK
-	if server.state == TCP_SERVER.ESTABLISHED:
+	# send ACK, unless a data segment carried it already
+	if server.state in (TCP_SERVER.ESTABLISHED, TCP_SERVER.CLOSE_WAIT) and server.ack_due:
 		server.send('')
 	return
\ No newline at end of file
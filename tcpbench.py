@@ -0,0 +1,230 @@
+import globals
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import structure.packet
+import tcp.server
+
+from structure.packet import Packet
+from structure.header import TCPHeader, Flags
+from structure import options as tcp_options
+from utils import util
+from utils.sendqueue import SendQueue
+
+
+def make_packet(seq_num, size, crc=False):
+	"""Builds a checksummed data packet carrying @size bytes of payload, with a CRC32 if @crc
+	"""
+	header = TCPHeader(
+		src_port=globals.ACK_LSTN_PORT,
+		dst_port=globals.SERVER_LSTN_PORT,
+		seq_num=seq_num,
+		ack_num=0,
+		_flags=Flags(cwr=0, ece=0, ack=0, syn=0, fin=0),
+		rcvwd=10,
+		options=((tcp_options.CHECKSUM_DATA, bytes(4)),) if crc else ())
+	packet = Packet(header, bytes(i % 256 for i in range(size)))
+	packet.compute_checksum()
+	return packet
+
+def ooo_queue(depth, size):
+	"""Builds an out-of-order queue of @depth packets: a contiguous run with one hole in the middle
+	"""
+	size = size or 1
+	return set(make_packet(i * size, size) for i in range(depth + 1) if i != depth // 2 or depth < 2)
+
+
+class Benchmark(object):
+	"""A single microbenchmark case
+
+	@setup is called (untimed) and returns the argument passed to @op. It runs once per batch,
+	or before every call when @fresh is set, so that stateful functions (e.g. the file sink)
+	start from the same state each time.
+	"""
+
+	def __init__(self, name, op, setup=None, ops_per_call=1, fresh=False) -> None:
+		self.__name = name
+		self.__op = op
+		self.__setup = setup or (lambda: None)
+		self.__ops_per_call = ops_per_call
+		self.__fresh = fresh
+
+	@property
+	def name(self):
+		return self.__name
+
+	def time_ns(self, iterations, repeat):
+		"""Best-of-@repeat nanoseconds per packet
+		"""
+		best = None
+		op = self.__op
+		for _ in range(repeat):
+			if self.__fresh:
+				elapsed = 0
+				for _ in range(iterations):
+					arg = self.__setup()
+					start = time.perf_counter_ns()
+					op(arg)
+					elapsed += time.perf_counter_ns() - start
+			else:
+				arg = self.__setup()
+				start = time.perf_counter_ns()
+				for _ in range(iterations):
+					op(arg)
+				elapsed = time.perf_counter_ns() - start
+			elapsed /= iterations * self.__ops_per_call
+			best = elapsed if best is None else min(best, elapsed)
+		return best
+
+	def alloc_bytes(self, iterations):
+		"""Average peak of transient memory allocated by one call, measured by tracemalloc
+		"""
+		arg = self.__setup()
+		op = self.__op
+		total = 0
+		tracemalloc.start()
+		try:
+			for _ in range(iterations):
+				if self.__fresh:
+					arg = self.__setup()
+				tracemalloc.reset_peak()
+				base, _ = tracemalloc.get_traced_memory()
+				op(arg)
+				_, peak = tracemalloc.get_traced_memory()
+				total += peak - base
+		finally:
+			tracemalloc.stop()
+		return total / (iterations * self.__ops_per_call)
+
+
+def codec_benchmarks(sizes):
+	cases = []
+	for size in sizes:
+		packet = make_packet(0, size)
+		wire = structure.packet.serialize(packet)
+		cases.append(Benchmark(f'serialize/{size}', lambda _, p=packet: structure.packet.serialize(p)))
+		cases.append(Benchmark(f'deserialize/{size}', lambda _, w=wire: structure.packet.deserialize(w)))
+		cases.append(Benchmark(f'compute_checksum/{size}', lambda _, p=packet: p.compute_checksum()))
+		cases.append(Benchmark(f'is_corrupt/{size}', lambda _, p=packet: p.is_corrupt()))
+		crc_packet = make_packet(0, size, crc=True)
+		cases.append(Benchmark(f'compute_crc/{size}', lambda _, p=crc_packet: p.compute_checksum()))
+		cases.append(Benchmark(f'is_corrupt_crc/{size}', lambda _, p=crc_packet: p.is_corrupt()))
+	return cases
+
+def reassembly_benchmarks(depths):
+	cases = []
+	for depth in depths:
+		queue = ooo_queue(depth, globals.MSS)
+		cases.append(Benchmark(
+			f'largest_contionus/{depth}',
+			lambda _, q=queue: util.largest_contionus(
+				q,
+				sort_key=lambda pkt: pkt.header.seq_num,
+				next_diff=lambda pkt: len(pkt.payload) or 1,
+				pop=True)))
+	return cases
+
+def sink_benchmarks(depths, workdir):
+	"""Feeds @depth packets into server.to_file, in reverse order so every packet but the last is queued,
+	and in order, which the sink appends right away
+	"""
+	cases = []
+	dst = os.path.join(workdir, 'sink.bin')
+
+	def reset_sink(packets):
+		tcp.server.rcvd_seq.clear()
+		tcp.server.rcvd = []
+		tcp.server.last_wrote = 0
+		with open(dst, 'wb'):
+			pass
+		return packets
+
+	def feed(packets):
+		for packet in packets:
+			tcp.server.to_file(packet, dst)
+
+	for depth in depths:
+		packets = [make_packet(i * globals.MSS, globals.MSS) for i in range(depth)]
+		cases.append(Benchmark(
+			f'to_file/{depth}', feed,
+			setup=lambda p=packets[::-1]: reset_sink(p),
+			ops_per_call=depth,
+			fresh=True))
+		cases.append(Benchmark(
+			f'to_file_in_order/{depth}', feed,
+			setup=lambda p=packets: reset_sink(p),
+			ops_per_call=depth,
+			fresh=True))
+	return cases
+
+def window_benchmarks(depths):
+	"""Fills a client send window with @depth segments, then ACKs them one at a time
+	"""
+	cases = []
+	wire = structure.packet.serialize(make_packet(0, globals.MSS))
+
+	def fill_and_ack(depth):
+		window = SendQueue()
+		for i in range(depth):
+			window.append(i * globals.MSS, (i + 1) * globals.MSS, wire, 0.0)
+		for i in range(depth):
+			window.ack((i + 1) * globals.MSS, 0.0)
+
+	for depth in depths:
+		cases.append(Benchmark(f'send_window/{depth}', lambda _, d=depth: fill_and_ack(d), ops_per_call=depth))
+	return cases
+
+def run(cases, iterations, repeat):
+	results = {}
+	for case in cases:
+		results[case.name] = {
+			'ns': round(case.time_ns(iterations, repeat), 1),
+			'alloc_bytes': round(case.alloc_bytes(max(1, iterations // 10)), 1),
+		}
+		print(f"{case.name:<28} {results[case.name]['ns']:>12.1f} ns/pkt {results[case.name]['alloc_bytes']:>10.1f} B/pkt")
+	return results
+
+def regressions(results, baseline, threshold):
+	"""Returns the names of benchmarks slower (or allocating more) than @baseline by more than @threshold
+	"""
+	failed = []
+	for name, result in results.items():
+		expected = baseline.get(name)
+		if expected is None:
+			continue
+		for metric in ('ns', 'alloc_bytes'):
+			limit = expected[metric] * (1 + threshold)
+			if result[metric] > limit and result[metric] - expected[metric] > 1:
+				failed.append(f'{name} {metric}: {result[metric]} > {expected[metric]} (+{threshold:.0%})')
+	return failed
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser('TCP hot path microbenchmarks')
+	parser.add_argument('--sizes', type=int, nargs='+', default=[0, 64, 256, globals.MSS], help='payload sizes in bytes')
+	parser.add_argument('--depths', type=int, nargs='+', default=[1, 8, 64, 256], help='out-of-order queue and send window depths')
+	parser.add_argument('--iterations', type=int, default=200, help='calls per timed batch')
+	parser.add_argument('--repeat', type=int, default=5, help='timed batches per benchmark, the best one is kept')
+	parser.add_argument('--baseline', type=str, help='JSON results of a previous run to compare against')
+	parser.add_argument('--threshold', type=float, default=0.25, help='allowed relative regression against the baseline')
+	parser.add_argument('--save', type=str, help='write JSON results to this file')
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as workdir:
+		cases = codec_benchmarks(args.sizes) + reassembly_benchmarks(args.depths) + sink_benchmarks(args.depths, workdir) \
+			+ window_benchmarks(args.depths)
+		results = run(cases, args.iterations, args.repeat)
+
+	if args.save:
+		with open(args.save, 'w') as f:
+			json.dump(results, f, indent=2)
+	if args.baseline:
+		with open(args.baseline) as f:
+			failed = regressions(results, json.load(f), args.threshold)
+		for failure in failed:
+			print(f'REGRESSION {failure}')
+		sys.exit(1 if failed else 0)
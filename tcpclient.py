@@ -1,57 +1,158 @@
 import globals
+import io
 import logging
 import argparse
-import time
+import os
 import threading
 import os.path as path
 
 from tcp.client import TCP_CLIENT
+from utils.stats import StatsExporter
+from utils.trace import PacketTracer
+from utils.cookies import CookieJar
+from utils.metrics import MetricsCache
+from utils import resume, session
 
 
 def __receive(client:TCP_CLIENT):
-	while client.state == TCP_CLIENT.ESTABLISHED:
-		# check again
-		client.rcv_lock.acquire()
-		if client.state == TCP_CLIENT.ESTABLISHED:
+	"""Receives every packet from the server (ACKs, data, and its FIN) until the connection is closed
+	"""
+	while client.state != TCP_CLIENT.CLOSED:
+		try:
 			received = client.receive() # blocking
-			logging.info(f'state {client.state}')
-			if client.state != TCP_CLIENT.ESTABLISHED:
-				client.update_fin_packets(received)
-			logging.info(f'thread recevied: {received}')
-		
-		client.rcv_lock.release()
-		time.sleep(0.1)
+		except OSError:
+			break # socket closed
+		logging.debug('state %s', client.state)
+		logging.debug('thread recevied: %s', received)
+	return
+
+def __read_reply(client:TCP_CLIENT, dst):
+	"""Reads what the server sends back until it is done, into file @dst if given (see
+	tcpserver.py --reply), discarding it otherwise
+	"""
+	openfile = open(dst, 'wb') if dst else None
+	try:
+		data = client.read()
+		while data:
+			if openfile is not None:
+				openfile.write(data)
+			data = client.read()
+	finally:
+		if openfile is not None:
+			openfile.close()
 	return
 
 def send_file(client:TCP_CLIENT, args):
 	"""Send (any type of) file to server
 
-	This will do two things: 1) start a thread to do BLOCKING receive 2) start a loop,
-	read MSS=512 bytes, and send to server.
+	This will do three things: 1) connect to server, which may already carry the first MSS=512 bytes
+	2) start a thread to do BLOCKING receive 3) start a loop, read the file in chunks, and write them
+	to the connection, which segments them and blocks whenever the window is full. Meanwhile, another
+	thread reads what the server sends back, see --save-reply.
+
+	With --resume, only the ranges the server does not have yet are written, and the whole file
+	is hashed on the way for the server to check it.
 
 	Args:
 		client (TCP_CLIENT): a configured TCP_CLIENT, which knows where to send data to
 		args (namespace): command line arguments for the program
 	"""
 	receiv_thread = threading.Thread(target=__receive, args=(client,))
+	reply_thread = threading.Thread(target=__read_reply, args=(client, args.save_reply))
+	digest = resume.new_digest() if args.resume else None
 	with open(args.file, 'rb') as openfile:
-		receiv_thread.start()
 		data = openfile.read(globals.MSS)
+		sent = client.connect(data)
+		receiv_thread.start()
+		reply_thread.start()
+		size = os.fstat(openfile.fileno()).st_size
+		# past what the SYN carried, or what the server is missing
+		ranges = [(sent, size)] if client.resumed is None else resume.missing(client.resumed, size)
+		position = 0
 		while data != b'':
-			ret = client.send(data)
-			while ret == -1:
-				time.sleep(1)
-				ret = client.send(data)
-			data = openfile.read(globals.MSS)
+			if digest is not None:
+				digest.update(data)
+			for start, end in resume.clip(ranges, position, position + len(data)):
+				client.write(data[start - position:end - position])
+			position += len(data)
+			data = openfile.read(io.DEFAULT_BUFFER_SIZE)
+		client.terminate(digest=digest.digest() if digest is not None else None)
+		receiv_thread.join()
+		reply_thread.join()
+	return
+
+def session_files(args):
+	"""Files of a --session: (path, name) pairs, a directory standing for every file under it,
+	named relative to it
+
+	Returns:
+		list: the files of @args.file, then those of --files-from
+	"""
+	paths = [args.file]
+	if args.files_from:
+		with open(args.files_from) as f:
+			paths += [line.strip() for line in f if line.strip()]
+	files = []
+	for file_path in paths:
+		if not path.isdir(file_path):
+			files.append((file_path, path.basename(file_path)))
+			continue
+		for root, dirs, names in os.walk(file_path):
+			dirs.sort()
+			for name in sorted(names):
+				full_path = path.join(root, name)
+				files.append((full_path, path.relpath(full_path, file_path)))
+	return files
+
+def send_session(client:TCP_CLIENT, args):
+	"""Send several files to the server over one connection
+
+	Each file is written to the connection behind a frame (see utils.session) telling the server
+	its name and size, so the files follow each other with no new handshake or slow start.
+
+	Args:
+		client (TCP_CLIENT): a configured TCP_CLIENT, asking for a session
+		args (namespace): command line arguments for the program
+	"""
+	receiv_thread = threading.Thread(target=__receive, args=(client,))
+	reply_thread = threading.Thread(target=__read_reply, args=(client, args.save_reply))
+	client.connect()
+	receiv_thread.start()
+	reply_thread.start()
+	if not client.session:
 		client.terminate()
 		receiv_thread.join()
+		reply_thread.join()
+		raise Exception('The server does not take sessions, start it with --session DIR')
+	try:
+		for file_path, name in session_files(args):
+			with open(file_path, 'rb') as openfile:
+				size = os.fstat(openfile.fileno()).st_size
+				client.write(session.frame(name, size))
+				sent = 0
+				data = openfile.read(io.DEFAULT_BUFFER_SIZE)
+				while data != b'' and sent < size:
+					data = data[:size - sent] # as announced, should it grow meanwhile
+					client.write(data)
+					sent += len(data)
+					data = openfile.read(io.DEFAULT_BUFFER_SIZE)
+			if sent < size:
+				raise Exception(f"File: '{file_path}' shrank while being sent")
+			logging.info('sent %s as %s, %s bytes', file_path, name, size)
+	finally:
+		# also when a file shrank, after its frame went out: the connection and its threads go down
+		client.terminate()
+		receiv_thread.join()
+		reply_thread.join()
 	return
 
 def init_args(args):
 	"""Check whether if arguments specified are expected
 	"""
 	# check window size
-	if args.window_size >= globals.MSS and args.window_size % globals.MSS == 0:
+	if args.window_size == 0:
+		pass # no limit of our own, the server's autotuned window and the congestion window only
+	elif args.window_size >= globals.MSS and args.window_size % globals.MSS == 0:
 		args.window_size = args.window_size / globals.MSS
 	else:
 		raise Exception(f"Please specify to be '{args.window_size}' to be integer multiple of MSS={globals.MSS}")
@@ -59,25 +160,93 @@ def init_args(args):
 	# check file existence
 	if not path.exists(args.file):
 		raise Exception(f"File: '{args.file}' does not exist!")
+	if path.isdir(args.file) and not args.session:
+		raise Exception(f"'{args.file}' is a directory, use --session to send the files in there")
+	if args.session and args.resume:
+		raise Exception('--resume takes a single file, not a --session')
+
+	# check paths
+	paths = []
+	for value in args.path or []:
+		try:
+			ip, port, local_port = value.split(':')
+			paths.append((ip, int(port), int(local_port)))
+		except ValueError:
+			raise Exception(f"Please specify --path '{value}' as IP:PORT:LOCAL_PORT")
+	args.path = paths
 	return args
 
 
 if __name__ == "__main__":
 	parser = argparse.ArgumentParser('TCP data sender')
-	parser.add_argument('file', type=str, help='output file to send')
+	parser.add_argument('file', type=str, help='output file to send (with --session, possibly a directory)')
 	parser.add_argument('udpl_addr', type=str, help='IP address of UDPL to send to')
 	parser.add_argument('udpl_port', type=int, help='Port number of UDPL to send to')
-	parser.add_argument('window_size', type=int, help='Sender window size in bytes. (multiple of MSS=512B)')
+	parser.add_argument('window_size', type=int, help='Sender window size in bytes. (multiple of MSS=512B, 0: as large as the server and the congestion window allow)')
 	parser.add_argument('ack_port', type=int, help='Port number to listen on, for receiving ACK from server')
+	parser.add_argument('--stats-file', type=str, help='periodically dump connection statistics to this file')
+	parser.add_argument('--stats-format', type=str, default='json', choices=StatsExporter.FORMATS, help='format of --stats-file')
+	parser.add_argument('--stats-interval', type=float, default=1.0, help='seconds between two dumps to --stats-file')
+	parser.add_argument('--stats-port', type=int, help='serve statistics at http://127.0.0.1:<port>/metrics and /stats')
+	parser.add_argument('--trace', type=str, help='record every packet event and write them to this file on exit')
+	parser.add_argument('--trace-format', type=str, default='bin', choices=['bin', 'pcap'], help='format of --trace')
+	parser.add_argument('--trace-capacity', type=int, default=65536, help='number of most recent packet events kept by --trace')
+	parser.add_argument('--fastopen', type=str, metavar='COOKIE_FILE', help='enable fast open, caching server cookies in this file')
+	parser.add_argument('--metrics', type=str, metavar='METRICS_FILE', help='start from the RTT, slow start threshold and delivery rate of earlier connections to the server, cached in this file')
+	parser.add_argument('--ecn', action='store_true', help='halve the congestion window on the congestion marks the server echoes, rather than waiting for a loss')
+	parser.add_argument('--no-sack', action='store_true', help='detect losses from duplicate ACKs only, without SACK, RACK or tail loss probes')
+	parser.add_argument('--path', type=str, action='append', metavar='IP:PORT:LOCAL_PORT', help='another path to the server (e.g. another newudpl), sent to from LOCAL_PORT: segments are spread over every path, weighted by their RTT and loss rate. Repeatable')
+	parser.add_argument('--fec', action='store_true', help='send XOR parity packets so that the server rebuilds lost segments without retransmission')
+	parser.add_argument('--compress', type=str, choices=['zlib', 'lzma'], help='compress the file on the fly, if the server agrees')
+	parser.add_argument('--crc', action='store_true', help='protect packets with a CRC32 rather than the 16 bit checksum, if the server agrees')
+	parser.add_argument('--resume', action='store_true', help='only send what the server is missing of the file from an earlier transfer, and have it check the whole file')
+	parser.add_argument('--session', action='store_true', help='send several files over one connection: FILE (every file under it, for a directory) and those of --files-from')
+	parser.add_argument('--files-from', type=str, metavar='LIST', help='with --session, also send the files listed in LIST, one per line')
+	parser.add_argument('--save-reply', type=str, metavar='OUT', help='write what the server sends back (see tcpserver.py --reply) to this file')
+	parser.add_argument('--gso', action='store_true', help='Linux: send runs of full segments in one syscall (UDP GSO), if supported')
+	parser.add_argument('--sndbuf', type=int, help='SO_SNDBUF of the UDP socket, in bytes')
+	parser.add_argument('--rcvbuf', type=int, help='SO_RCVBUF of the UDP socket, in bytes')
+	parser.add_argument('--nodelay', action='store_true', help='send partial segments right away instead of coalescing them (Nagle)')
+	parser.add_argument('--log-level', type=str, default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], help='logging level')
 	args = parser.parse_args()
 	args = init_args(args)
 
-	logging.basicConfig(level=logging.DEBUG)
+	logging.basicConfig(level=args.log_level)
 
+	tracer = PacketTracer(args.trace_capacity) if args.trace else None
 	client = TCP_CLIENT(
 		udpl_ip=args.udpl_addr,
 		udpl_port=args.udpl_port,
 		window_size=args.window_size,
-		ack_lstn_port=args.ack_port)
+		ack_lstn_port=args.ack_port,
+		tracer=tracer,
+		cookie_jar=CookieJar(args.fastopen) if args.fastopen else None,
+		nodelay=args.nodelay,
+		fec=args.fec,
+		compress=args.compress,
+		crc=args.crc,
+		resume=resume.identify(args.file) if args.resume else None,
+		session=args.session,
+		gso=args.gso,
+		sndbuf=args.sndbuf,
+		rcvbuf=args.rcvbuf,
+		metrics=MetricsCache(args.metrics) if args.metrics else None,
+		ecn=args.ecn,
+		sack=not args.no_sack,
+		paths=args.path)
+	exporter = StatsExporter(
+		client.stats,
+		interval=args.stats_interval,
+		path=args.stats_file,
+		fmt=args.stats_format,
+		http_port=args.stats_port).start()
 	
-	send_file(client, args)
\ No newline at end of file
+	try:
+		if args.session:
+			send_session(client, args)
+		else:
+			send_file(client, args)
+	finally:
+		exporter.stop()
+		if tracer is not None:
+			tracer.dump(args.trace, fmt=args.trace_format)
\ No newline at end of file
@@ -0,0 +1,118 @@
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from structure.packet import Packet
+from structure.header import TCPHeader, Flags
+from tcp.client import TCP_CLIENT
+from tcp.server import TCP_SERVER, to_file
+from utils import trace
+
+
+def to_packet(record:trace.TraceRecord):
+	"""Rebuilds a (checksummed) packet from a trace record. The payload is not recorded, so it is zero-filled.
+	"""
+	header = TCPHeader(
+		src_port=record.src_port,
+		dst_port=record.dst_port,
+		seq_num=record.seq_num,
+		ack_num=record.ack_num,
+		_flags=Flags(
+			cwr=record.flags >> 3 & 1,
+			ece=record.flags >> 2 & 1,
+			ack=record.flags >> 4 & 1,
+			syn=record.flags & 1,
+			fin=record.flags >> 1 & 1),
+		rcvwd=record.rcvwd)
+	packet = Packet(header, bytes(record.length))
+	packet.compute_checksum()
+	return packet
+
+def recorded_isn(records, direction):
+	"""ISN of the first SYN sent in @direction, so that the replayed endpoint picks the same one
+	"""
+	for rec in records:
+		if rec.direction == direction and rec.flags & 1:
+			return rec.seq_num
+	return None
+
+def replay_server(records, args):
+	"""Feeds every received data packet of the trace through TCP_SERVER, as :func:service_client would
+
+	Returns:
+		(TCP_SERVER, int, int): the server, number of packets replayed, nanoseconds spent
+	"""
+	server = TCP_SERVER(lsten_port=0, ack_addr='127.0.0.1', ack_port=args.discard_port, isn=recorded_isn(records, trace.TX))
+	packets = [to_packet(rec) for rec in records if rec.direction == trace.RX and rec.event == trace.RECV]
+	elapsed = 0
+	with tempfile.TemporaryDirectory() as workdir:
+		dst = args.output or os.path.join(workdir, 'replay.bin')
+		with open(dst, 'wb'):
+			pass
+		for packet in packets:
+			start = time.perf_counter_ns()
+			received = server.process(packet)
+			if received is not None and not args.no_sink:
+				to_file(received, dst=dst, base=server.stream_base)
+			if args.acks:
+				server.send('')
+			elapsed += time.perf_counter_ns() - start
+	server.reset() # stops the FIN timer of a replayed close
+	return server, len(packets), elapsed
+
+def replay_client(records, args):
+	"""Re-sends every data packet of the trace and feeds every received ACK through TCP_CLIENT, in trace order.
+	Retransmissions are left to the client's own timer.
+
+	Returns:
+		(TCP_CLIENT, int, int): the client, number of packets replayed, nanoseconds spent
+	"""
+	client = TCP_CLIENT(
+		udpl_ip='127.0.0.1',
+		udpl_port=args.discard_port,
+		window_size=len(records) + 1,
+		ack_lstn_port=0,
+		isn=recorded_isn(records, trace.TX),
+		congestion=False) # the trace already follows the congestion window it was recorded with
+	events = []
+	for rec in records:
+		if rec.direction == trace.TX and rec.event == trace.SEND and rec.flags & 1:
+			events.append((client.open, b''))
+		elif rec.direction == trace.TX and rec.event == trace.SEND and rec.length > 0:
+			# never blocks on a full window: no ACK would come, e.g. after sends that were FEC parity
+			events.append((lambda payload: client.send(payload, block=False), bytes(rec.length)))
+		elif rec.direction == trace.RX and rec.event == trace.RECV:
+			events.append((client.process, to_packet(rec)))
+	elapsed = 0
+	for action, item in events:
+		start = time.perf_counter_ns()
+		action(item)
+		elapsed += time.perf_counter_ns() - start
+	client.reset()
+	return client, len(events), elapsed
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser('Replay a packet trace through the TCP client or server logic')
+	parser.add_argument('trace', type=str, help='binary trace recorded with --trace')
+	parser.add_argument('side', type=str, choices=['client', 'server'], help='which end of the connection to replay')
+	parser.add_argument('--output', type=str, help='(server) file to write the replayed data to, a temporary file by default')
+	parser.add_argument('--no-sink', action='store_true', help='(server) do not write the replayed data at all')
+	parser.add_argument('--acks', action='store_true', help='(server) send an ACK for every packet, as the live server does')
+	parser.add_argument('--discard-port', type=int, default=9, help='local port that packets sent during the replay go to')
+	parser.add_argument('--log-level', type=str, default='WARNING', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], help='logging level')
+	args = parser.parse_args()
+
+	logging.basicConfig(level=args.log_level)
+
+	records = trace.load(args.trace)
+	if args.side == 'server':
+		endpoint, count, elapsed = replay_server(records, args)
+	else:
+		endpoint, count, elapsed = replay_client(records, args)
+
+	print(f'replayed {count} packets through the {args.side} in {elapsed / 1e6:.3f} ms '
+		f'({elapsed / max(count, 1):.0f} ns/pkt, {count / max(elapsed / 1e9, 1e-9):.0f} pkt/s)')
+	print(endpoint.stats.to_json())
@@ -1,8 +1,13 @@
 import globals
 import logging
 import argparse
+import signal
+import sys
 
-from tcp.server import TCP_SERVER
+from tcp.server import TCP_SERVER, close_sink
+from utils.resume import Checkpoint
+from utils.stats import StatsExporter
+from utils.trace import PacketTracer
 
 
 if __name__ == "__main__":
@@ -11,12 +16,67 @@ if __name__ == "__main__":
 	parser.add_argument('lstn_port', type=int, help='server listening port')
 	parser.add_argument('ack_addr', type=str, help='IP address for reaching client for ACK')
 	parser.add_argument('ack_port', type=int, help='Port address for reaching client for ACK ')
+	parser.add_argument('--stats-file', type=str, help='periodically dump connection statistics to this file')
+	parser.add_argument('--stats-format', type=str, default='json', choices=StatsExporter.FORMATS, help='format of --stats-file')
+	parser.add_argument('--stats-interval', type=float, default=1.0, help='seconds between two dumps to --stats-file')
+	parser.add_argument('--stats-port', type=int, help='serve statistics at http://127.0.0.1:<port>/metrics and /stats')
+	parser.add_argument('--trace', type=str, help='record every packet event and write them to this file on exit')
+	parser.add_argument('--trace-format', type=str, default='bin', choices=['bin', 'pcap'], help='format of --trace')
+	parser.add_argument('--trace-capacity', type=int, default=65536, help='number of most recent packet events kept by --trace')
+	parser.add_argument('--write-queue', type=int, default=256, help='segments queued for a writer thread, so that ACKs never wait for the disk (0: write before ACKing)')
+	parser.add_argument('--fsync-batch', type=int, default=0, help='fdatasync the output after as many queued writes, or when the queue drains (0: never)')
+	parser.add_argument('--max-rcvwd', type=int, default=TCP_SERVER.MAX_RCVWD, metavar='SEGMENTS', help=f'the receive window grows from {TCP_SERVER.RCVWD} segments toward twice the bandwidth-delay product, up to this (memory cap)')
+	parser.add_argument('--no-ecn', action='store_true', help='ignore the ECN requests of clients using --ecn')
+	parser.add_argument('--ecn-threshold', type=int, default=TCP_SERVER.ECN_THRESHOLD, metavar='BYTES', help='mark the segments received while more than this waits in the socket (0: only marks of the network)')
+	parser.add_argument('--no-sack', action='store_true', help='ACK cumulatively only, even to clients asking for SACK')
+	parser.add_argument('--no-multipath', action='store_true', help='take the segments of clients using --path as usual, without echoing their path in ACKs')
+	parser.add_argument('--no-fec', action='store_true', help='ignore parity packets of clients using --fec')
+	parser.add_argument('--no-compress', action='store_true', help='refuse compressed streams of clients using --compress')
+	parser.add_argument('--no-crc', action='store_true', help='refuse CRC32 checksums of clients using --crc')
+	parser.add_argument('--session', type=str, metavar='DIR', help='write the files of clients using --session under this directory')
+	parser.add_argument('--reply', type=str, metavar='REPLY_FILE', help='send this file back to every client over the same connection, while receiving')
+	parser.add_argument('--no-resume', action='store_true', help='do not checkpoint the ranges received (to FILE.resume) for clients using --resume')
+	parser.add_argument('--gro', action='store_true', help='Linux: receive runs of datagrams coalesced by the kernel in one syscall (UDP GRO), if supported')
+	parser.add_argument('--sndbuf', type=int, help='SO_SNDBUF of the UDP socket, in bytes')
+	parser.add_argument('--rcvbuf', type=int, help='SO_RCVBUF of the UDP socket, in bytes')
+	parser.add_argument('--no-fastopen', action='store_true', help='do not accept data in SYNs')
+	parser.add_argument('--log-level', type=str, default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], help='logging level')
 	args = parser.parse_args()
 
-	logging.basicConfig(level=logging.DEBUG)
+	logging.basicConfig(level=args.log_level)
 	
+	tracer = PacketTracer(args.trace_capacity) if args.trace else None
 	server = TCP_SERVER(
 		lsten_port=args.lstn_port,
 		ack_addr=args.ack_addr,
-		ack_port=args.ack_port)
-	server.start(args)
+		ack_port=args.ack_port,
+		tracer=tracer,
+		fastopen=not args.no_fastopen,
+		fec=not args.no_fec,
+		compress=not args.no_compress,
+		crc=not args.no_crc,
+		checkpoint=Checkpoint(args.file) if not args.no_resume else None,
+		session=args.session is not None,
+		duplex=args.reply is not None,
+		gro=args.gro,
+		sndbuf=args.sndbuf,
+		rcvbuf=args.rcvbuf,
+		max_rcvwd=args.max_rcvwd,
+		ecn=not args.no_ecn,
+		ecn_threshold=args.ecn_threshold,
+		sack=not args.no_sack,
+		multipath=not args.no_multipath)
+	# exit through the finally clause below when killed, so that the trace gets written
+	signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+	StatsExporter(
+		server.stats,
+		interval=args.stats_interval,
+		path=args.stats_file,
+		fmt=args.stats_format,
+		http_port=args.stats_port).start()
+	try:
+		server.start(args)
+	finally:
+		close_sink()
+		if tracer is not None:
+			tracer.dump(args.trace, fmt=args.trace_format)
@@ -0,0 +1,77 @@
+import argparse
+import json
+import logging
+import random
+import statistics
+import sys
+import time
+
+from utils.sim import Simulation
+
+
+def scenario(args):
+	"""Arguments of the links, client and server of every run, from the command line
+	"""
+	forward = dict(delay=args.delay, rate=args.rate, queue=args.queue, loss=args.loss, reorder=args.reorder,
+		duplicate=args.duplicate, corrupt=args.corrupt, mark=args.mark)
+	reverse = dict(delay=args.delay, loss=args.ack_loss, reorder=args.reorder)
+	client = dict(sack=not args.no_sack, congestion=not args.no_congestion, ecn=args.ecn, fec=args.fec, nodelay=args.nodelay)
+	return forward, reverse, client
+
+def summarize(results, elapsed):
+	durations = sorted(result['duration'] for result in results if result['completed'])
+	failed = [result['seed'] for result in results if not result['ok']]
+	total = lambda side, name: sum(result[side][name] for result in results)
+	return {
+		'runs': len(results),
+		'ok': len(results) - len(failed),
+		'failed_seeds': failed,
+		'duration_median': round(statistics.median(durations), 6) if durations else None,
+		'duration_p95': round(durations[int(0.95 * (len(durations) - 1))], 6) if durations else None,
+		'goodput_mean': round(statistics.mean(result['goodput'] for result in results), 3),
+		'retransmits_timeout': total('client', 'retransmits_timeout'),
+		'retransmits_fast': total('client', 'retransmits_fast'),
+		'tail_loss_probes': total('client', 'tail_loss_probes'),
+		'events': sum(result['events'] for result in results),
+		'elapsed': round(elapsed, 3),
+	}
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser('Simulate transfers between the TCP client and server over lossy links, in virtual time')
+	parser.add_argument('--runs', type=int, default=100, help='number of scenarios, each with its own seed')
+	parser.add_argument('--seed', type=int, default=0, help='seed of the first scenario, the next ones count up from it')
+	parser.add_argument('--size', type=int, default=64 * 1024, help='bytes the client sends in every scenario')
+	parser.add_argument('--delay', type=float, default=0.02, help='one-way delay of either link, in seconds')
+	parser.add_argument('--rate', type=float, default=1000, help='bottleneck of the data link in datagrams/s, 0 for none')
+	parser.add_argument('--queue', type=int, default=64, help='datagrams queued at the bottleneck at most, 0 for no limit')
+	parser.add_argument('--loss', type=float, default=0.05, help='probability a data datagram is lost')
+	parser.add_argument('--ack-loss', type=float, default=0, help='probability an ACK datagram is lost')
+	parser.add_argument('--reorder', type=float, default=0, help='probability a datagram is held back by up to another delay')
+	parser.add_argument('--duplicate', type=float, default=0, help='probability a data datagram arrives twice')
+	parser.add_argument('--corrupt', type=float, default=0, help='probability a bit of a data datagram is flipped')
+	parser.add_argument('--mark', type=int, default=0, help='queued datagrams from which on the bottleneck marks CE, 0 for never')
+	parser.add_argument('--no-sack', action='store_true', help='the client does not ask for SACK')
+	parser.add_argument('--no-congestion', action='store_true', help='no congestion window on the client')
+	parser.add_argument('--ecn', action='store_true', help='the client asks for ECN, see --mark')
+	parser.add_argument('--fec', action='store_true', help='the client sends FEC parity packets')
+	parser.add_argument('--nodelay', action='store_true', help='the client sends partial segments right away')
+	parser.add_argument('--limit', type=float, default=3600, help='simulated seconds after which a transfer is deemed stuck')
+	parser.add_argument('--json', action='store_true', help='print the result of every scenario, as a JSON line')
+	parser.add_argument('--log-level', type=str, default='ERROR', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], help='logging level')
+	args = parser.parse_args()
+
+	logging.basicConfig(level=args.log_level)
+
+	forward, reverse, client = scenario(args)
+	results = []
+	start = time.perf_counter()
+	for seed in range(args.seed, args.seed + args.runs):
+		data = random.Random(seed).randbytes(args.size)
+		result = Simulation(data, seed=seed, forward=forward, reverse=reverse, client=client, limit=args.limit).run()
+		results.append(result)
+		if args.json:
+			print(json.dumps(result))
+	summary = summarize(results, time.perf_counter() - start)
+	print(json.dumps(summary))
+	sys.exit(0 if summary['ok'] == summary['runs'] else 1)
@@ -0,0 +1,88 @@
+import random
+import unittest
+
+from tcp.client import TCP_CLIENT
+from utils.sim import Simulation, to_packet
+
+
+class TestWrite(unittest.TestCase):
+
+	def test_write_returns_input_length_when_compressed(self):
+		# compressible data: a block is buffered by the compressor, which outputs little or nothing yet
+		sim = Simulation(b'', client={'compress': 'zlib'})
+		client = sim.client
+		try:
+			client.open()
+			sim.clock.run(until=10, done=lambda: client.state == TCP_CLIENT.ESTABLISHED)
+			self.assertIsNotNone(client.compression)
+			data = b'a' * 1000
+			self.assertEqual(client.write(data), len(data))
+		finally:
+			client.close()
+			sim.server.close()
+
+
+class TestTailLossProbe(unittest.TestCase):
+
+	def test_lost_tail_repaired_without_timeout(self):
+		data = random.Random(0).randbytes(20 * 1000)
+		sim = Simulation(data)
+		link = sim._Simulation__forward
+		send = link.send
+		dropped = set()
+		def drop_tail(wire):
+			# the first transmission of the last data segment, and of the FIN right behind it
+			packet = to_packet(wire)
+			tail = packet.header.is_fin() or bytes(packet.payload).endswith(data[-16:])
+			key = (packet.header.seq_num, packet.header.is_fin())
+			if tail and key not in dropped:
+				dropped.add(key)
+				return
+			send(wire)
+		link.send = drop_tail
+		result = sim.run()
+		self.assertTrue(result['ok'])
+		self.assertEqual(len(dropped), 2)
+		self.assertEqual(result['client']['tail_loss_probes'], 1)
+		self.assertEqual(result['client']['retransmits_timeout'], 0)
+
+
+class TestFastRetransmit(unittest.TestCase):
+
+	def test_third_duplicate_ack(self):
+		data = random.Random(0).randbytes(30 * 1000)
+		sim = Simulation(data, client={'sack': False})
+		client = sim.client
+		link = sim._Simulation__forward
+		send = link.send
+		sent = []
+		def drop_fifth(wire):
+			packet = to_packet(wire)
+			if len(packet.payload) > 0:
+				sent.append(packet.header.seq_num)
+				if len(sent) == 5:
+					return
+			send(wire)
+		link.send = drop_fifth
+		calls = []
+		fast_retransmit = client._TCP_CLIENT__fast_retransmit
+		def record(partial=False):
+			window = client._TCP_CLIENT__window
+			calls.append((partial, client.stats.get('dup_acks'), window.first().seq_num, len(window)))
+			fast_retransmit(partial)
+			calls[-1] += (client._TCP_CLIENT__congestion.cwnd,)
+		client._TCP_CLIENT__fast_retransmit = record
+		result = sim.run()
+		self.assertTrue(result['ok'])
+		(partial, dup_acks, seq_num, in_flight, cwnd), = calls
+		self.assertFalse(partial)
+		self.assertEqual(dup_acks, TCP_CLIENT.DUP_ACK_THRESHOLD)
+		self.assertEqual(seq_num, sent[4])
+		self.assertEqual(sent.count(seq_num), 2)
+		self.assertEqual(cwnd, in_flight / 2)
+		self.assertEqual(result['client']['retransmits_fast'], 1)
+		self.assertEqual(result['client']['retransmits_timeout'], 0)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,109 @@
+import random
+import unittest
+
+from utils import compress
+from utils.compress import StreamCompressor, StreamDecompressor
+
+
+def kinds(stream):
+	"""Kind of every frame of @stream
+	"""
+	result = []
+	offset = 0
+	while offset < len(stream):
+		kind, length = compress.FRAME.unpack_from(stream, offset)
+		result.append(kind)
+		offset += compress.FRAME.size + length
+	return result
+
+
+def split(stream, rng):
+	"""@stream cut in pieces of random sizes, most of them cutting frames in two
+	"""
+	pieces = []
+	offset = 0
+	while offset < len(stream):
+		size = rng.randint(1, 2 * compress.FRAME.size + 100)
+		pieces.append(stream[offset:offset + size])
+		offset += size
+	return pieces
+
+
+class TestRoundTrip(unittest.TestCase):
+
+	def setUp(self):
+		self.rng = random.Random(0)
+		self.text = b''.join(b'line %d of some compressible text\n' % i for i in range(8000)) # several blocks
+
+	def round_trip(self, method, data, pieces=None):
+		compressor = StreamCompressor(method)
+		stream = b''
+		for piece in pieces or [data]:
+			stream += compressor.compress(piece)
+		stream += compressor.flush()
+		decompressor = StreamDecompressor(method)
+		output = b''.join(decompressor.decompress(piece) for piece in split(stream, self.rng))
+		self.assertEqual(output, data)
+		return stream
+
+	def test_compressed_frames(self):
+		for method in compress.METHODS.values():
+			with self.subTest(method=method):
+				stream = self.round_trip(method, self.text)
+				self.assertLess(len(stream), len(self.text))
+				self.assertEqual(set(kinds(stream)), {method})
+				self.assertEqual(len(kinds(stream)), -(-len(self.text) // compress.BLOCK_SIZE))
+
+	def test_raw_frames(self):
+		data = self.rng.randbytes(3 * compress.BLOCK_SIZE + 10)
+		for method in compress.METHODS.values():
+			with self.subTest(method=method):
+				stream = self.round_trip(method, data)
+				self.assertEqual(set(kinds(stream)), {compress.RAW})
+
+	def test_raw_and_compressed_frames(self):
+		noise = self.rng.randbytes(compress.BLOCK_SIZE)
+		data = self.text[:compress.BLOCK_SIZE] + noise + self.text
+		for method in compress.METHODS.values():
+			with self.subTest(method=method):
+				stream = self.round_trip(method, data)
+				self.assertEqual(set(kinds(stream)), {compress.RAW, method})
+
+	def test_input_in_small_writes(self):
+		pieces = [self.text[i:i + 1000] for i in range(0, len(self.text), 1000)]
+		for method in compress.METHODS.values():
+			with self.subTest(method=method):
+				self.round_trip(method, self.text, pieces)
+
+	def test_flush_ends_block_early(self):
+		compressor = StreamCompressor(compress.ZLIB)
+		decompressor = StreamDecompressor(compress.ZLIB)
+		self.assertEqual(compressor.compress(b'hello '), b'')
+		self.assertEqual(decompressor.decompress(compressor.flush()), b'hello ')
+		self.assertEqual(compressor.flush(), b'')
+		compressor.compress(b'world')
+		self.assertEqual(decompressor.decompress(compressor.flush()), b'world')
+
+	def test_partial_frame_waits(self):
+		compressor = StreamCompressor(compress.ZLIB)
+		compressor.compress(self.text[:1000])
+		frame = compressor.flush()
+		decompressor = StreamDecompressor(compress.ZLIB)
+		self.assertEqual(decompressor.decompress(frame[:compress.FRAME.size - 1]), b'')
+		self.assertEqual(decompressor.decompress(frame[compress.FRAME.size - 1:-1]), b'')
+		self.assertEqual(decompressor.decompress(frame[-1:]), self.text[:1000])
+
+
+class TestErrors(unittest.TestCase):
+
+	def test_unknown_method(self):
+		with self.assertRaises(Exception):
+			StreamCompressor(99)
+
+	def test_unknown_frame_kind(self):
+		with self.assertRaises(Exception):
+			StreamDecompressor(compress.ZLIB).decompress(compress.FRAME.pack(99, 1) + b'x')
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+
+from utils.congestion import CongestionControl
+
+
+class TestOnAck(unittest.TestCase):
+
+	def test_slow_start_grows_a_segment_per_segment(self):
+		congestion = CongestionControl()
+		self.assertEqual(congestion.cwnd, CongestionControl.INIT_CWND)
+		self.assertIsNone(congestion.ssthresh)
+		congestion.on_ack(10)
+		self.assertEqual(congestion.cwnd, 20)
+
+	def test_slow_start_stops_at_threshold(self):
+		congestion = CongestionControl(cwnd=10, ssthresh=12)
+		congestion.on_ack(4) # 2 segments of slow start, then 2 of congestion avoidance
+		self.assertAlmostEqual(congestion.cwnd, 12 + 2 / 12)
+
+	def test_congestion_avoidance_grows_a_segment_per_window(self):
+		congestion = CongestionControl(cwnd=10, ssthresh=5)
+		congestion.on_ack(10)
+		self.assertAlmostEqual(congestion.cwnd, 11)
+
+	def test_capped_at_max_cwnd(self):
+		self.assertEqual(CongestionControl(cwnd=20, max_cwnd=16).cwnd, 16)
+		congestion = CongestionControl(cwnd=10, max_cwnd=16)
+		congestion.on_ack(10)
+		self.assertEqual(congestion.cwnd, 16)
+
+
+class TestOnLoss(unittest.TestCase):
+
+	def test_halves_window(self):
+		congestion = CongestionControl(cwnd=40)
+		congestion.on_loss(20)
+		self.assertEqual(congestion.ssthresh, 10)
+		self.assertEqual(congestion.cwnd, 10)
+		congestion.on_ack(10) # congestion avoidance from there
+		self.assertAlmostEqual(congestion.cwnd, 11)
+
+	def test_threshold_floor(self):
+		congestion = CongestionControl()
+		congestion.on_loss(1)
+		self.assertEqual(congestion.ssthresh, CongestionControl.MIN_SSTHRESH)
+		self.assertEqual(congestion.cwnd, CongestionControl.MIN_SSTHRESH)
+
+
+class TestOnTimeout(unittest.TestCase):
+
+	def test_starts_over_from_one_segment(self):
+		congestion = CongestionControl(cwnd=40)
+		congestion.on_timeout(20)
+		self.assertEqual(congestion.ssthresh, 10)
+		self.assertEqual(congestion.cwnd, 1)
+		congestion.on_ack(1) # slow start again
+		self.assertEqual(congestion.cwnd, 2)
+
+	def test_threshold_floor(self):
+		congestion = CongestionControl()
+		congestion.on_timeout(3)
+		self.assertEqual(congestion.ssthresh, CongestionControl.MIN_SSTHRESH)
+		self.assertEqual(congestion.cwnd, 1)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,109 @@
+import random
+import unittest
+
+from utils.fec import FecDecoder, FecEncoder
+
+
+def segments(count, start=5000, size=100, last=None, seed=0):
+	"""(seq num, payload) of @count consecutive segments of @size random bytes, the last one of @last bytes
+	"""
+	rng = random.Random(seed)
+	result = []
+	seq = start
+	for i in range(count):
+		length = last if last is not None and i == count - 1 else size
+		payload = rng.randbytes(length)
+		result.append((seq, payload))
+		seq += length
+	return result
+
+
+def encode(group):
+	"""The parity packet of @group, closed early with :func:FecEncoder.flush
+	"""
+	encoder = FecEncoder()
+	for seq, payload in group:
+		encoder.add(seq, payload)
+	return encoder.flush()
+
+
+class TestFecEncoder(unittest.TestCase):
+
+	def test_parity_after_every_group(self):
+		encoder = FecEncoder()
+		parities = [encoder.add(seq, payload) for seq, payload in segments(2 * FecEncoder.MAX_GROUP)]
+		closed = [i for i, parity in enumerate(parities) if parity is not None]
+		self.assertEqual(closed, [FecEncoder.MAX_GROUP - 1, 2 * FecEncoder.MAX_GROUP - 1])
+		self.assertIsNone(encoder.flush())
+
+	def test_group_shrinks_with_losses(self):
+		encoder = FecEncoder()
+		self.assertEqual(encoder.group_size, FecEncoder.MAX_GROUP)
+		encoder.lost(4)
+		self.assertEqual(encoder.group_size, round(FecEncoder.TARGET_LOSSES / (4 * FecEncoder.ALPHA)))
+		encoder.lost(1000)
+		self.assertEqual(encoder.loss_rate, 1)
+		self.assertEqual(encoder.group_size, FecEncoder.MIN_GROUP)
+
+	def test_gap_restarts_group(self):
+		encoder = FecEncoder()
+		(seq, payload), = segments(1)
+		encoder.add(seq, payload)
+		encoder.add(seq + 1000, payload) # the one in between was not added
+		option, _ = encoder.flush()
+		group = segments(1, start=seq + 1000, seed=0)
+		self.assertEqual(option, encode(group)[0])
+
+
+class TestFecDecoder(unittest.TestCase):
+
+	def test_recovers_any_single_loss(self):
+		group = segments(5, last=37)
+		option, parity = encode(group)
+		for missing in range(len(group)):
+			decoder = FecDecoder()
+			for i, (seq, payload) in enumerate(group):
+				if i != missing:
+					decoder.add(seq, payload)
+			self.assertEqual(decoder.recover(option, parity), group[missing])
+			self.assertEqual(decoder.recovered, 1)
+			self.assertIsNone(decoder.recover(option, parity)) # rebuilt, nothing missing anymore
+
+	def test_payload_ending_in_zeros(self):
+		group = [(0, b'\x01\x00\x00'), (3, b'\xff' * 3)]
+		option, parity = encode(group)
+		decoder = FecDecoder()
+		decoder.add(*group[1])
+		self.assertEqual(decoder.recover(option, parity), group[0])
+
+	def test_nothing_missing(self):
+		group = segments(4)
+		option, parity = encode(group)
+		decoder = FecDecoder()
+		for seq, payload in group:
+			decoder.add(seq, payload)
+		self.assertIsNone(decoder.recover(option, parity))
+		self.assertEqual(decoder.recovered, 0)
+
+	def test_two_losses_are_unrecoverable(self):
+		group = segments(6)
+		option, parity = encode(group)
+		for missing in ((0, 1), (1, 4), (4, 5)):
+			decoder = FecDecoder()
+			for i, (seq, payload) in enumerate(group):
+				if i not in missing:
+					decoder.add(seq, payload)
+			self.assertIsNone(decoder.recover(option, parity))
+			self.assertEqual(decoder.recovered, 0)
+
+	def test_forgets_oldest_past_capacity(self):
+		group = segments(4)
+		option, parity = encode(group)
+		decoder = FecDecoder(capacity=2)
+		for seq, payload in group[1:]:
+			decoder.add(seq, payload) # the second one is forgotten
+		self.assertIsNone(decoder.recover(option, parity))
+
+
+if __name__ == '__main__':
+	unittest.main()
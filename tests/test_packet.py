@@ -0,0 +1,114 @@
+import random
+import struct
+import unittest
+
+import structure.packet
+import structure.options as tcp_options
+
+from structure.header import TCPHeader, Flags
+from structure.packet import Packet
+
+
+def make_packet(payload, crc, options=()):
+	"""A checksummed data packet carrying @payload, with a CRC32 if @crc, then @options
+	"""
+	if crc:
+		options = ((tcp_options.CHECKSUM_DATA, bytes(4)),) + tuple(options)
+	header = TCPHeader(
+		src_port=41198,
+		dst_port=50000,
+		seq_num=123456,
+		ack_num=654321,
+		_flags=Flags(cwr=0, ece=0, ack=1, syn=0, fin=0),
+		rcvwd=64,
+		options=options)
+	packet = Packet(header, payload)
+	packet.compute_checksum()
+	return packet
+
+
+def naive_ones_sum(data):
+	"""One's complement sum of @data, word by word with end-around carry
+	"""
+	if len(data) % 2 != 0:
+		data += b'\x00'
+	total = 0
+	for word in struct.unpack(f'={len(data) // 2}H', data):
+		total += word
+		total = (total & 0xffff) + (total >> 16)
+	return total % 0xffff
+
+
+class TestIsCorrupt(unittest.TestCase):
+
+	def setUp(self):
+		self.payload = random.Random(0).randbytes(101) # odd length
+
+	def flips_detected(self, packet):
+		"""Whether every single bit flip of the serialized @packet is detected, on the wire as received
+		"""
+		wire = structure.packet.serialize(packet)
+		for bit in range(8 * len(wire)):
+			flipped = bytearray(wire)
+			flipped[bit // 8] ^= 1 << (bit % 8)
+			try:
+				received = structure.packet.deserialize(bytes(flipped))
+			except Exception:
+				continue # unparsable, dropped all the same
+			if not received.is_corrupt():
+				return False
+		return True
+
+	def test_intact_packets(self):
+		for crc in (False, True):
+			with self.subTest(crc=crc):
+				packet = make_packet(self.payload, crc)
+				self.assertFalse(packet.is_corrupt())
+				self.assertFalse(structure.packet.deserialize(structure.packet.serialize(packet)).is_corrupt())
+				self.assertFalse(make_packet(b'', crc).is_corrupt())
+
+	def test_crc_is_first_option(self):
+		packet = make_packet(self.payload, True, options=((tcp_options.MSS, b'\x05\xb4'),))
+		wire = structure.packet.serialize(packet)
+		self.assertEqual(packet.header.checksum, 0)
+		self.assertEqual(wire[structure.packet.CRC_OFFSET - 2], tcp_options.CHECKSUM_DATA)
+		self.assertFalse(structure.packet.deserialize(wire).is_corrupt())
+
+	def test_bit_flips_with_ones_sum(self):
+		self.assertTrue(self.flips_detected(make_packet(self.payload, False)))
+
+	def test_bit_flips_with_crc(self):
+		self.assertTrue(self.flips_detected(make_packet(self.payload, True)))
+
+	def test_word_swap_caught_by_crc_only(self):
+		# the one's complement sum is the same whatever the order of the words, a CRC is not
+		for crc, corrupt in ((False, False), (True, True)):
+			with self.subTest(crc=crc):
+				wire = bytearray(structure.packet.serialize(make_packet(self.payload, crc)))
+				end = len(wire) - 1
+				wire[end - 4:end - 2], wire[end - 2:end] = wire[end - 2:end], wire[end - 4:end - 2]
+				self.assertEqual(structure.packet.deserialize(bytes(wire)).is_corrupt(), corrupt)
+
+	def test_modified_payload(self):
+		for crc in (False, True):
+			with self.subTest(crc=crc):
+				packet = make_packet(self.payload, crc)
+				packet.payload = self.payload[:-1] + b'\x00'
+				self.assertTrue(packet.is_corrupt())
+
+
+class TestOnesSum(unittest.TestCase):
+
+	def test_matches_word_by_word_sum(self):
+		rng = random.Random(0)
+		for length in (0, 1, 2, 3, 20, 63, 1500):
+			data = rng.randbytes(length)
+			with self.subTest(length=length):
+				self.assertEqual(structure.packet.ones_sum(data), naive_ones_sum(data))
+
+	def test_all_ones(self):
+		self.assertEqual(structure.packet.ones_sum(b'\xff' * 8), 0)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+
+from utils.rack import Rack
+from utils.sendqueue import SendQueue
+
+
+class TestDetect(unittest.TestCase):
+
+	def setUp(self):
+		# four segments of 100 bytes from seq num 1000, sent every 0.1s
+		self.queue = SendQueue()
+		for i in range(4):
+			self.queue.append(1000 + 100 * i, 1100 + 100 * i, b'%d' % i, 0.1 * i)
+		self.rack = Rack()
+
+	def deliver(self, left, right, now):
+		self.queue.sack(left, right)
+		self.rack.on_delivered(*self.queue.take_delivered(), now)
+
+	def test_nothing_delivered(self):
+		self.assertEqual(self.rack.detect(self.queue, 0.25, 5.0), (0, None))
+
+	def test_earlier_segments_lost_after_reordering_window(self):
+		self.deliver(1200, 1300, 1.2) # third segment, RTT 1s
+		lost, timeout = self.rack.detect(self.queue, 0.25, 1.2)
+		self.assertEqual(lost, 0)
+		self.assertAlmostEqual(timeout, 0.15) # the second one, sent at 0.1, is lost at 1.35
+		self.assertEqual(self.rack.detect(self.queue, 0.25, 1.4), (2, None))
+		self.assertEqual(self.queue.in_flight, 1) # the fourth one, sent after
+		self.assertEqual([segment.seq_num for segment in self.queue.retransmit_lost(1.4)], [1000, 1100])
+		self.assertEqual(self.queue.in_flight, 3)
+
+	def test_retransmission_not_lost_again_before_its_rtt(self):
+		self.deliver(1200, 1300, 1.2)
+		self.rack.detect(self.queue, 0, 1.2)
+		self.queue.retransmit_lost(1.2)
+		self.deliver(1300, 1400, 1.3)
+		self.assertEqual(self.rack.detect(self.queue, 0, 1.3), (0, None))
+
+	def test_late_ack_of_original_is_not_an_rtt_sample(self):
+		self.deliver(1200, 1300, 1.2)
+		self.rack.detect(self.queue, 0, 1.2)
+		self.queue.retransmit_lost(2.0)
+		self.deliver(1000, 1100, 2.1) # too soon for the retransmission
+		# taken as an RTT of 0.1s, the other retransmission would be deemed lost already
+		self.assertEqual(self.rack.detect(self.queue, 0, 2.1), (0, None))
+		self.assertEqual(self.rack.reo_wnd(2.0, False, 0), 0.25)
+
+
+class TestReorderingWindow(unittest.TestCase):
+
+	def setUp(self):
+		self.rack = Rack()
+		self.rack.on_delivered((0.0, 1100, False), 1100, 1.0) # min RTT 1s
+
+	def test_quarter_of_min_rtt(self):
+		self.assertEqual(Rack().reo_wnd(1.0, False, 0), 0)
+		self.assertEqual(self.rack.reo_wnd(2.0, False, 0), 0.25)
+		self.assertEqual(self.rack.reo_wnd(0.1, False, 0), 0.1) # capped by the smoothed RTT
+
+	def test_none_in_recovery_until_reordering_seen(self):
+		self.assertEqual(self.rack.reo_wnd(2.0, True, 0), 0)
+		self.assertEqual(self.rack.reo_wnd(2.0, False, 3), 0)
+		self.rack.on_delivered((0.5, 1300, False), 1050, 1.6) # delivered below the highest so far
+		self.assertEqual(self.rack.reo_wnd(2.0, True, 3), 0.25)
+
+	def test_dsack_widens_once_per_round_trip(self):
+		self.rack.on_dsack(1000, 2000)
+		self.rack.on_dsack(1500, 2500)
+		self.assertEqual(self.rack.reo_wnd_mult, 2)
+		self.assertEqual(self.rack.reo_wnd(2.0, True, 3), 0.5)
+		self.rack.on_dsack(2000, 3000)
+		self.assertEqual(self.rack.reo_wnd_mult, 3)
+
+	def test_widened_window_persists_for_recoveries(self):
+		self.rack.on_dsack(1000, 2000)
+		for _ in range(Rack.REO_WND_PERSIST - 1):
+			self.rack.on_recovery()
+		self.assertEqual(self.rack.reo_wnd_mult, 2)
+		self.rack.on_recovery()
+		self.assertEqual(self.rack.reo_wnd_mult, 1)
+
+
+if __name__ == '__main__':
+	unittest.main()
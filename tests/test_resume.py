@@ -0,0 +1,126 @@
+import json
+import os
+import tempfile
+import unittest
+
+from utils import resume
+from utils.resume import Checkpoint, StreamMap
+
+
+class TestMissing(unittest.TestCase):
+
+	def test_nothing_received(self):
+		self.assertEqual(resume.missing([], 100), [(0, 100)])
+
+	def test_gaps_between_ranges(self):
+		self.assertEqual(resume.missing([(10, 20), (30, 40)], 50), [(0, 10), (20, 30), (40, 50)])
+
+	def test_everything_received(self):
+		self.assertEqual(resume.missing([(0, 100)], 100), [])
+		self.assertEqual(resume.missing([(0, 40), (40, 100)], 100), [])
+
+	def test_ranges_past_the_end(self):
+		self.assertEqual(resume.missing([(10, 20), (90, 150), (200, 300)], 100), [(0, 10), (20, 90)])
+		self.assertEqual(resume.missing([(150, 200)], 100), [(0, 100)])
+
+	def test_empty_file(self):
+		self.assertEqual(resume.missing([], 0), [])
+
+	def test_ranges_round_trip(self):
+		ranges = [(0, 10), (20, 25), (40, 100)]
+		self.assertEqual(resume.unpack_ranges(resume.pack_ranges(ranges, 100)), ranges)
+		# without room for all, the largest ones
+		self.assertEqual(resume.unpack_ranges(resume.pack_ranges(ranges, 2 * resume.RANGE.size)), [(0, 10), (40, 100)])
+
+	def test_merge(self):
+		self.assertEqual(resume.merge([(30, 40), (0, 10), (10, 20), (35, 50)]), [(0, 20), (30, 50)])
+
+
+class TestStreamMap(unittest.TestCase):
+
+	def setUp(self):
+		# missing, i.e. in the stream: [0, 10) at 0, [20, 30) at 10, [40, 50) at 20
+		self.stream = StreamMap(50, [(10, 20), (30, 40)])
+
+	def test_length(self):
+		self.assertEqual(self.stream.size, 50)
+		self.assertEqual(self.stream.length, 30)
+		self.assertEqual(StreamMap(50, []).length, 50)
+		self.assertEqual(StreamMap(50, [(0, 50)]).length, 0)
+
+	def test_span_within_range(self):
+		self.assertEqual(self.stream.spans(12, 5), [(22, 0, 5)])
+
+	def test_span_across_ranges(self):
+		self.assertEqual(self.stream.spans(5, 20), [(5, 0, 5), (20, 5, 15), (40, 15, 20)])
+
+	def test_span_past_the_end(self):
+		self.assertEqual(self.stream.spans(25, 100), [(45, 0, 5)])
+		self.assertEqual(self.stream.spans(30, 10), [])
+
+	def test_spans_cover_the_file_gaps(self):
+		written = bytearray(50)
+		for offset in range(0, self.stream.length, 7):
+			for position, start, end in self.stream.spans(offset, 7):
+				written[position:position + end - start] = b'x' * (end - start)
+		self.assertEqual([i for i, byte in enumerate(written) if byte], list(range(10)) + list(range(20, 30)) + list(range(40, 50)))
+
+
+class TestCheckpoint(unittest.TestCase):
+
+	def setUp(self):
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+		self.path = os.path.join(directory.name, 'out.bin')
+		with open(self.path, 'wb') as f:
+			f.write(bytes(100))
+
+	def test_save_and_load(self):
+		checkpoint = Checkpoint(self.path)
+		self.assertEqual(checkpoint.ranges_for(100, 42), [])
+		checkpoint.add(0, 10)
+		checkpoint.add(30, 40)
+		checkpoint.add(10, 20)
+		checkpoint.commit(force=True)
+		self.assertEqual(Checkpoint(self.path).ranges_for(100, 42), [(0, 20), (30, 40)])
+
+	def test_pending_ranges_not_saved(self):
+		checkpoint = Checkpoint(self.path)
+		checkpoint.ranges_for(100, 42)
+		checkpoint.add(0, 10)
+		self.assertEqual(Checkpoint(self.path).ranges_for(100, 42), [])
+
+	def test_other_file_starts_over(self):
+		checkpoint = Checkpoint(self.path)
+		checkpoint.ranges_for(100, 42)
+		checkpoint.add(0, 10)
+		checkpoint.commit(force=True)
+		self.assertEqual(Checkpoint(self.path).ranges_for(100, 43), [])
+		self.assertEqual(Checkpoint(self.path).ranges_for(100, 42), [])
+
+	def test_truncated_output_starts_over(self):
+		checkpoint = Checkpoint(self.path)
+		checkpoint.ranges_for(200, 42)
+		checkpoint.add(0, 150) # more than the output holds
+		checkpoint.commit(force=True)
+		self.assertEqual(Checkpoint(self.path).ranges_for(200, 42), [])
+
+	def test_unreadable_checkpoint_ignored(self):
+		with open(f'{self.path}.resume', 'w') as f:
+			f.write('{not json')
+		with self.assertLogs(level='ERROR'):
+			checkpoint = Checkpoint(self.path)
+		self.assertEqual(checkpoint.ranges_for(100, 42), [])
+		with open(f'{self.path}.resume') as f:
+			self.assertEqual(json.load(f), {'size': 100, 'fingerprint': 42, 'ranges': []})
+
+	def test_remove(self):
+		checkpoint = Checkpoint(self.path)
+		checkpoint.ranges_for(100, 42)
+		checkpoint.remove()
+		self.assertFalse(os.path.exists(f'{self.path}.resume'))
+		self.assertEqual(checkpoint.ranges, [])
+
+
+if __name__ == '__main__':
+	unittest.main()
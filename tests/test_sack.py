@@ -0,0 +1,54 @@
+import unittest
+
+from utils import sack
+
+
+class TestBlocks(unittest.TestCase):
+
+	def setUp(self):
+		self.segments = [(80, 90), (10, 20), (50, 60), (20, 30)]
+
+	def test_merged_highest_first(self):
+		self.assertEqual(sack.blocks(self.segments), [(80, 90), (50, 60), (10, 30)])
+
+	def test_latest_first(self):
+		self.assertEqual(sack.blocks(self.segments, latest=55), [(50, 60), (80, 90), (10, 30)])
+		self.assertEqual(sack.blocks(self.segments, latest=20), [(10, 30), (80, 90), (50, 60)])
+
+	def test_latest_not_in_any_block(self):
+		self.assertEqual(sack.blocks(self.segments, latest=40), [(80, 90), (50, 60), (10, 30)])
+
+	def test_overlapping_segments(self):
+		self.assertEqual(sack.blocks([(10, 30), (20, 40), (15, 25)]), [(10, 40)])
+
+	def test_nothing_received(self):
+		self.assertEqual(sack.blocks([], latest=10), [])
+
+	def test_pack_as_many_as_fit(self):
+		blocks = sack.blocks(self.segments)
+		self.assertEqual(sack.unpack(sack.pack(blocks, 100)), blocks)
+		self.assertEqual(sack.unpack(sack.pack(blocks, 2 * sack.BLOCK.size + 1)), blocks[:2])
+		self.assertEqual(sack.pack(blocks, -4), b'')
+
+
+class TestIsDsack(unittest.TestCase):
+
+	def test_no_blocks(self):
+		self.assertFalse(sack.is_dsack([], 100))
+
+	def test_below_cumulative_ack(self):
+		self.assertTrue(sack.is_dsack([(50, 60)], 100))
+		self.assertTrue(sack.is_dsack([(50, 100), (120, 130)], 100))
+
+	def test_within_second_block(self):
+		self.assertTrue(sack.is_dsack([(120, 130), (110, 140)], 100))
+		self.assertTrue(sack.is_dsack([(110, 140), (110, 140)], 100))
+
+	def test_plain_sack(self):
+		self.assertFalse(sack.is_dsack([(120, 130)], 100))
+		self.assertFalse(sack.is_dsack([(120, 130), (140, 150)], 100))
+		self.assertFalse(sack.is_dsack([(90, 130)], 100)) # partly above the ACK
+
+
+if __name__ == '__main__':
+	unittest.main()
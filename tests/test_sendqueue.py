@@ -0,0 +1,136 @@
+import unittest
+
+from utils.sendqueue import Segment, SendQueue
+
+
+def filled(count, size=100, start=1000):
+	"""A SendQueue of @count segments of @size bytes from seq num @start, the i-th sent at time i
+	"""
+	queue = SendQueue()
+	for i in range(count):
+		seq = start + i * size
+		queue.append(seq, seq + size, b'%d' % i, float(i))
+	return queue
+
+
+class TestAck(unittest.TestCase):
+
+	def test_cumulative_ack_drops_prefix(self):
+		queue = filled(5)
+		self.assertEqual(queue.ack(1300, 10.0), (3, 8.0))
+		self.assertEqual(len(queue), 2)
+		self.assertEqual(queue.first(), Segment(1300, 1400, b'3'))
+		self.assertEqual(queue.last(), Segment(1400, 1500, b'4'))
+
+	def test_old_ack_drops_nothing(self):
+		queue = filled(3)
+		queue.ack(1100, 1.0)
+		self.assertEqual(queue.ack(1100, 2.0), (0, None))
+		self.assertEqual(queue.ack(1000, 2.0), (0, None))
+		self.assertEqual(len(queue), 2)
+
+	def test_ack_within_segment_gives_no_sample(self):
+		queue = filled(3)
+		self.assertEqual(queue.ack(1150, 5.0), (2, None))
+		self.assertEqual(queue.first(), Segment(1200, 1300, b'2'))
+
+	def test_retransmitted_segment_gives_no_sample(self):
+		queue = filled(2)
+		queue.mark_retransmit(now=4.0)
+		self.assertEqual(queue.ack(1100, 5.0), (1, None))
+		self.assertEqual(queue.ack(1200, 5.0), (1, 4.0))
+
+	def test_invalidated_samples(self):
+		queue = filled(2)
+		queue.invalidate_samples()
+		queue.append(1200, 1300, b'2', 3.0)
+		self.assertEqual(queue.ack(1200, 5.0), (2, None))
+		self.assertEqual(queue.ack(1300, 5.0), (1, 2.0))
+
+	def test_ack_everything_empties(self):
+		queue = filled(4)
+		self.assertEqual(queue.ack(1400, 4.0)[0], 4)
+		self.assertEqual(len(queue), 0)
+		self.assertIsNone(queue.first())
+		self.assertIsNone(queue.last())
+
+
+class TestCompaction(unittest.TestCase):
+
+	def test_compacts_once_half_is_dropped(self):
+		queue = filled(10)
+		queue.ack(1400, 10.0)
+		self.assertEqual(queue._SendQueue__head, 4)
+		self.assertEqual(len(queue._SendQueue__seqs), 10)
+		queue.ack(1500, 10.0)
+		self.assertEqual(queue._SendQueue__head, 0)
+		self.assertEqual(len(queue._SendQueue__seqs), 5)
+		self.assertEqual(len(queue), 5)
+		self.assertEqual(queue.first(), Segment(1500, 1600, b'5'))
+
+	def test_acks_after_compaction(self):
+		queue = filled(10)
+		for ack in range(1100, 2100, 100):
+			queue.append(ack + 900, ack + 1000, b'', 10.0) # keeps the window full as it slides
+			self.assertEqual(queue.ack(ack, 11.0)[0], 1)
+			self.assertEqual(queue.first().seq_num, ack)
+			self.assertEqual(len(queue), 10)
+		self.assertLessEqual(len(queue._SendQueue__seqs), 20)
+
+
+class TestSack(unittest.TestCase):
+
+	def test_sack_block(self):
+		queue = filled(5)
+		self.assertEqual(queue.sack(1200, 1400), 2)
+		self.assertEqual(queue.sack(1200, 1400), 0) # already SACKed
+		self.assertEqual(queue.sacked, 2)
+		self.assertEqual(queue.in_flight, 3)
+		self.assertEqual(queue.take_delivered(), ((3.0, 1400, False), 1300))
+		self.assertEqual(queue.take_delivered(), (None, None))
+
+	def test_partial_segments_not_sacked(self):
+		queue = filled(3)
+		self.assertEqual(queue.sack(1150, 1250), 0)
+		self.assertEqual(queue.sack(1100, 1250), 1)
+
+	def test_ack_over_sacked_segments(self):
+		queue = filled(4)
+		queue.sack(1100, 1200)
+		queue.take_delivered()
+		self.assertEqual(queue.ack(1200, 5.0), (2, None)) # no RTT sample off a SACKed segment
+		self.assertEqual(queue.sacked, 0)
+		self.assertEqual(queue.take_delivered(), ((0.0, 1100, False), 1100))
+
+
+class TestMarkLost(unittest.TestCase):
+
+	def test_lost_before_cutoff(self):
+		queue = filled(5)
+		queue.sack(1300, 1400)
+		self.assertEqual(queue.mark_lost(3.0, 1400, 1.0), (2, 2.0))
+		self.assertEqual(queue.in_flight, 2) # the third one is pending, the fifth was sent after
+		self.assertEqual(queue.mark_lost(3.0, 1400, 1.0), (0, 2.0)) # not twice
+
+	def test_retransmit_lost(self):
+		queue = filled(4)
+		queue.sack(1300, 1400)
+		queue.mark_lost(3.0, 1400, 2.0)
+		self.assertEqual(queue.retransmit_lost(5.0), [Segment(1000, 1100, b'0'), Segment(1100, 1200, b'1'), Segment(1200, 1300, b'2')])
+		self.assertEqual(queue.retransmit_lost(5.0), [])
+		self.assertEqual(queue.in_flight, 3)
+		# retransmitted at 5.0, after the segment delivered: not lost until a later one is
+		self.assertEqual(queue.mark_lost(3.0, 1400, 10.0), (0, None))
+		self.assertEqual(queue.ack(1100, 6.0), (1, None))
+
+	def test_delivery_clears_loss(self):
+		queue = filled(3)
+		queue.sack(1200, 1300)
+		queue.mark_lost(2.0, 1300, 2.0)
+		queue.sack(1100, 1200) # the original came through late
+		self.assertEqual(queue.in_flight, 0) # the first one is still deemed lost
+		self.assertEqual(queue.retransmit_lost(5.0), [Segment(1000, 1100, b'0')])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+
+from structure.header import TCPHeader, Flags
+from structure.packet import Packet
+from tcp.server import TCP_SERVER
+from utils.clock import VirtualClock
+from utils.sim import Link, SimServer
+
+import random
+
+CLIENT_ISN = 5000
+SERVER_ISN = 1000
+SIZE = 100
+
+
+def make_packet(seq_num, payload=b'', syn=0, ack=1, fin=0):
+	header = TCPHeader(
+		src_port=41198,
+		dst_port=41194,
+		seq_num=seq_num,
+		ack_num=SERVER_ISN + 1 if ack else 0,
+		_flags=Flags(cwr=0, ece=0, ack=ack, syn=syn, fin=fin),
+		rcvwd=64)
+	packet = Packet(header, payload)
+	packet.compute_checksum()
+	return packet
+
+
+class TestHeaderPrediction(unittest.TestCase):
+
+	def setUp(self):
+		clock = VirtualClock()
+		link = Link(clock, lambda wire, ce: None, random.Random(0))
+		self.server = SimServer(link, isn=SERVER_ISN, clock=clock)
+		self.slow_path = 0
+		next_ack = self.server._TCP_SERVER__next_ack
+		def counted(packet):
+			self.slow_path += 1
+			return next_ack(packet)
+		self.server._TCP_SERVER__next_ack = counted
+		self.server.process(make_packet(CLIENT_ISN, syn=1, ack=0), ('127.0.0.1', 41198))
+		self.server.process(make_packet(CLIENT_ISN + 1), ('127.0.0.1', 41198))
+		self.assertEqual(self.server.state, TCP_SERVER.ESTABLISHED)
+
+	def tearDown(self):
+		self.server.close()
+
+	def segment(self, index):
+		return make_packet(CLIENT_ISN + 1 + index * SIZE, bytes(SIZE))
+
+	def test_in_order_segments_take_the_fast_path(self):
+		for i in range(4):
+			self.assertIsNotNone(self.server.process(self.segment(i)))
+		self.assertEqual(self.slow_path, 0)
+
+	def test_fast_path_comes_back_after_a_hole_is_filled(self):
+		self.server.process(self.segment(0))
+		self.server.process(self.segment(2)) # out of order
+		self.server.process(self.segment(1)) # fills the hole
+		self.assertEqual(self.slow_path, 2)
+		for i in range(3, 6):
+			self.server.process(self.segment(i))
+		self.assertEqual(self.slow_path, 2)
+		self.assertEqual(self.server.stats.get('bytes_delivered'), 6 * SIZE)
+
+
+if __name__ == '__main__':
+	unittest.main()
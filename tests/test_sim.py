@@ -0,0 +1,87 @@
+import random
+import time
+import unittest
+
+from tcp.client import TCP_CLIENT
+from utils.sim import Simulation
+
+SIZE = 32 * 1024
+LINK = dict(delay=0.02, rate=1000, queue=64)
+
+
+def data(seed):
+	return random.Random(seed).randbytes(SIZE)
+
+
+class TestScenarios(unittest.TestCase):
+	"""Transfers over lossy links with fixed seeds, each of which must deliver the data exactly
+	"""
+
+	SEEDS = range(3)
+
+	def check(self, forward=None, reverse=None, client=None):
+		for seed in self.SEEDS:
+			with self.subTest(seed=seed):
+				result = Simulation(data(seed), seed=seed, forward=dict(LINK, **(forward or {})),
+					reverse=reverse, client=client).run()
+				self.assertTrue(result['ok'], result)
+		return result
+
+	def test_clean(self):
+		result = self.check()
+		self.assertEqual(result['client']['retransmits_timeout'], 0)
+
+	def test_loss(self):
+		self.check(forward=dict(loss=0.05), reverse=dict(loss=0.05))
+
+	def test_reorder(self):
+		self.check(forward=dict(loss=0.02, reorder=0.3), reverse=dict(reorder=0.3))
+
+	def test_duplicate(self):
+		self.check(forward=dict(duplicate=0.1), reverse=dict(duplicate=0.1))
+
+	def test_corrupt(self):
+		self.check(forward=dict(corrupt=0.05), reverse=dict(corrupt=0.05))
+
+	def test_no_sack(self):
+		self.check(forward=dict(loss=0.05), client=dict(sack=False))
+
+	def test_fec(self):
+		self.check(forward=dict(loss=0.05), client=dict(fec=True))
+
+	def test_ecn(self):
+		result = self.check(forward=dict(rate=300, mark=8), client=dict(ecn=True))
+		self.assertGreater(result['client']['ecn_reductions'], 0)
+
+	def test_compression(self):
+		self.check(forward=dict(loss=0.05), client=dict(compress='zlib'))
+
+
+class TestSimulation(unittest.TestCase):
+
+	def test_same_seed_same_run(self):
+		runs = [Simulation(data(1), seed=1, forward=dict(LINK, loss=0.05, reorder=0.2)).run() for _ in range(2)]
+		self.assertEqual(runs[0], runs[1])
+
+	def test_stuck_transfer_is_not_completed(self):
+		start = time.perf_counter()
+		result = Simulation(data(0), forward=dict(loss=1), limit=60).run()
+		self.assertFalse(result['completed'])
+		self.assertFalse(result['ok'])
+		self.assertEqual(result['goodput'], 0)
+		self.assertLess(time.perf_counter() - start, 5)
+
+	def test_terminate_waits_in_virtual_time(self):
+		sim = Simulation(b'', forward=dict(loss=1))
+		try:
+			sim.client.open()
+			start = time.perf_counter()
+			sim.client.terminate() # no answer ever comes
+			self.assertLess(time.perf_counter() - start, 5)
+			self.assertGreaterEqual(sim.clock.time(), TCP_CLIENT.CLOSE_WAIT_TIME)
+		finally:
+			sim.server.close()
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+
+from utils.timer import TCPTimer
+
+
+class ManualClock(object):
+	"""Hands the calls of the timers over to the test rather than making them
+	"""
+
+	def __init__(self) -> None:
+		self.calls = []
+
+	def call_later(self, interval, function):
+		self.calls.append(function)
+		return ManualCall()
+
+
+class ManualCall(object):
+
+	def is_alive(self):
+		return False
+
+	def cancel(self):
+		return
+
+
+class TestTCPTimer(unittest.TestCase):
+
+	def setUp(self):
+		self.clock = ManualClock()
+		self.fired = []
+		self.timer = TCPTimer(1, lambda: self.fired.append(True), clock=self.clock)
+
+	def test_stale_expiry_keeps_restarted_timer_pending(self):
+		self.timer.start()
+		self.timer.restart()
+		stale, current = self.clock.calls
+		stale() # the first timer's thread was already running when it got cancelled
+		self.assertTrue(self.timer.is_alive())
+		self.assertEqual(self.fired, [])
+		current()
+		self.assertFalse(self.timer.is_alive())
+		self.assertEqual(self.fired, [True])
+
+	def test_expiry_after_cancel_is_ignored(self):
+		self.timer.start()
+		self.timer.cancel()
+		self.clock.calls[0]()
+		self.assertFalse(self.timer.is_alive())
+		self.assertEqual(self.fired, [])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,65 @@
+import socket
+import struct
+import unittest
+
+from utils import udpio
+
+
+class TestGsoBatches(unittest.TestCase):
+
+	def test_equal_sizes_make_one_run(self):
+		wires = [b'a' * 100] * 5
+		self.assertEqual(udpio.gso_batches(wires), [(100, wires)])
+
+	def test_shorter_last_segment_ends_run(self):
+		wires = [b'a' * 100, b'b' * 100, b'c' * 40, b'd' * 100]
+		self.assertEqual(udpio.gso_batches(wires), [(100, wires[:3]), (100, wires[3:])])
+
+	def test_longer_segment_starts_run(self):
+		wires = [b'a' * 40, b'b' * 100, b'c' * 100]
+		self.assertEqual(udpio.gso_batches(wires), [(40, wires[:1]), (100, wires[1:])])
+
+	def test_runs_capped_at_max_segments(self):
+		wires = [b'a' * 10] * (udpio.MAX_SEGMENTS + 1)
+		batches = udpio.gso_batches(wires)
+		self.assertEqual([len(run) for _, run in batches], [udpio.MAX_SEGMENTS, 1])
+
+	def test_runs_capped_at_max_datagram(self):
+		size = 1500
+		wires = [b'a' * size] * udpio.MAX_SEGMENTS
+		batches = udpio.gso_batches(wires)
+		self.assertEqual(sum(len(run) for _, run in batches), len(wires))
+		for _, run in batches:
+			self.assertLessEqual(len(run) * size, udpio.MAX_DATAGRAM)
+
+	def test_nothing_to_send(self):
+		self.assertEqual(udpio.gso_batches([]), [])
+
+
+class TestGro(unittest.TestCase):
+
+	def test_segment_size_from_ancdata(self):
+		ancdata = [(udpio.SOL_UDP, udpio.UDP_GRO, struct.pack('i', 1200))]
+		self.assertEqual(udpio.gro_segment_size(ancdata), 1200)
+		self.assertIsNone(udpio.gro_segment_size([]))
+
+	def test_gso_send_arrives_as_datagrams(self):
+		sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		self.addCleanup(sender.close)
+		self.addCleanup(receiver.close)
+		if not udpio.supports_gso(sender):
+			self.skipTest('no UDP GSO here')
+		receiver.bind(('127.0.0.1', 0))
+		receiver.settimeout(1)
+		wires = [b'a' * 100, b'b' * 100, b'c' * 30]
+		(size, run), = udpio.gso_batches(wires)
+		try:
+			udpio.send_gso(sender, run, size, receiver.getsockname())
+		except OSError as err:
+			self.skipTest(f'GSO send failed: {err}')
+		self.assertEqual([receiver.recv(2048) for _ in wires], wires)
+
+
+if __name__ == '__main__':
+	unittest.main()
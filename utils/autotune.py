@@ -0,0 +1,72 @@
+import math
+
+
+class WindowTuner(object):
+	"""Receive window autotuning, in the spirit of Linux dynamic right-sizing (DRS)
+
+	Once per RTT, the bytes delivered in order during that RTT tell the rate the sender achieves,
+	and the window grows to twice that much (2x the bandwidth-delay product), so that it is never
+	what holds the sender back while the sender speeds up. It never shrinks, and stays within
+	@maximum segments.
+
+	The receiver takes the time a window's worth of data takes to come in as an RTT sample (an
+	upper bound, as the sender may not fill the window), along with those given to :func:self.sample_rtt,
+	e.g. of the handshake. The smallest recent ones count.
+	"""
+
+	def __init__(self, initial, maximum, mss) -> None:
+		"""
+		Args:
+			initial (int): window to start from, in segments
+			maximum (int): window never grows past this, in segments
+			mss (int): segment size in bytes
+		"""
+		self.__window = initial
+		self.__maximum = max(maximum, initial)
+		self.__mss = mss
+		self.__rtt = None # seconds
+		self.__rtt_mark = None # (time, seq num) of the window's worth of data being timed
+		self.__space_mark = None # (time, seq num) the RTT of data being counted started at
+
+	@property
+	def window(self):
+		"""Current window, in segments
+		"""
+		return self.__window
+
+	@property
+	def rtt(self):
+		return self.__rtt
+
+	def sample_rtt(self, sample):
+		"""Takes an RTT measured otherwise into account
+		"""
+		if self.__rtt is None or sample < self.__rtt:
+			self.__rtt = sample # follows decreases right away
+		else:
+			self.__rtt = 0.875 * self.__rtt + 0.125 * sample
+		return
+
+	def on_deliver(self, ack_num, now):
+		"""Data was delivered in order up to @ack_num at @now
+
+		Returns:
+			bool: whether the window grew
+		"""
+		if self.__rtt_mark is None:
+			self.__rtt_mark = (now, ack_num + self.__window * self.__mss)
+			self.__space_mark = (now, ack_num)
+			return False
+		since, seq = self.__rtt_mark
+		if ack_num >= seq:
+			self.sample_rtt(now - since)
+			self.__rtt_mark = (now, ack_num + self.__window * self.__mss)
+		since, base = self.__space_mark
+		if self.__rtt is None or now - since < self.__rtt:
+			return False
+		self.__space_mark = (now, ack_num)
+		target = min(math.ceil(2 * (ack_num - base) / self.__mss), self.__maximum)
+		if target <= self.__window:
+			return False
+		self.__window = target
+		return True
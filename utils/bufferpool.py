@@ -0,0 +1,46 @@
+import threading
+
+
+class BufferPool(object):
+	"""Preallocated receive buffers, reused across datagrams
+
+	A datagram is received with recv_into into a buffer taken by :func:self.acquire, and the
+	packet deserialized from it keeps a memoryview of its payload, so nothing is copied until the
+	sink writes it out. Whoever consumes the payload hands the buffer back with :func:self.release.
+	At most @count idle buffers are kept, more of them are left to the garbage collector.
+	"""
+
+	def __init__(self, size, count=128) -> None:
+		"""Constructs a pool of @count buffers of @size bytes
+
+		Args:
+			size (int): bytes per buffer, i.e. the largest datagram
+			count (int, optional): number of idle buffers kept. Defaults to 128.
+		"""
+		self.__size = size
+		self.__count = count
+		self.__lock = threading.Lock()
+		self.__free = {id(buffer): buffer for buffer in (bytearray(size) for _ in range(count))}
+
+	@property
+	def size(self):
+		return self.__size
+
+	def __len__(self):
+		"""Number of idle buffers
+		"""
+		return len(self.__free)
+
+	def acquire(self):
+		with self.__lock:
+			if self.__free:
+				return self.__free.popitem()[1]
+		return bytearray(self.__size)
+
+	def release(self, buffer):
+		"""Returns @buffer to the pool. Releasing a buffer that is already idle is harmless
+		"""
+		with self.__lock:
+			if len(self.__free) < self.__count:
+				self.__free[id(buffer)] = buffer
+		return
@@ -0,0 +1,146 @@
+import heapq
+import itertools
+import time
+
+from threading import Timer
+
+class Clock(object):
+	"""Time and timers of the real world, which :class:TCP_CLIENT, :class:TCP_SERVER and
+	:class:TCPTimer run on unless given another clock, e.g. a :class:VirtualClock
+	"""
+
+	def time(self):
+		"""Seconds since the epoch, as time.time()
+		"""
+		return time.time()
+
+	def call_later(self, interval, function):
+		"""Calls @function after @interval seconds, from a thread of its own
+
+		Returns:
+			Timer: the started timer, with cancel() and is_alive()
+		"""
+		timer = Timer(interval, function)
+		timer.start()
+		return timer
+
+	def wait(self, event, timeout):
+		"""Waits up to @timeout seconds for @event (a threading.Event) to be set
+
+		Returns:
+			bool: whether it is set
+		"""
+		return event.wait(timeout)
+
+
+SYSTEM = Clock()
+
+
+class VirtualTimer(object):
+	"""Pending call of a :class:VirtualClock, the counterpart of a started threading.Timer
+	"""
+
+	def __init__(self, when, function) -> None:
+		self.__when = when
+		self.__function = function
+		self.__pending = True
+
+	@property
+	def when(self):
+		return self.__when
+
+	def is_alive(self):
+		return self.__pending
+
+	def cancel(self):
+		self.__pending = False
+		return
+
+	def fire(self):
+		if not self.__pending:
+			return False
+		self.__pending = False
+		self.__function()
+		return True
+
+
+class VirtualClock(Clock):
+	"""Discrete-event clock: time only moves when :func:self.run jumps to the next call due,
+	and every call is made on the thread running it, one at a time, in order of due time
+	(then of scheduling). A run is thus the same every time, and takes no longer than the
+	calls themselves, however many seconds it spans.
+	"""
+
+	def __init__(self, start=0.0) -> None:
+		"""
+		Args:
+			start (float, optional): time to start from, in seconds. Defaults to 0.0.
+		"""
+		self.__now = start
+		self.__events = [] # heap of (due time, order, VirtualTimer)
+		self.__order = itertools.count()
+		self.__fired = 0
+
+	@property
+	def fired(self):
+		"""Number of calls made so far
+		"""
+		return self.__fired
+
+	def time(self):
+		return self.__now
+
+	def call_later(self, interval, function):
+		timer = VirtualTimer(self.__now + max(interval, 0), function)
+		heapq.heappush(self.__events, (timer.when, next(self.__order), timer))
+		return timer
+
+	def pending(self):
+		"""Number of calls scheduled and not cancelled yet
+		"""
+		return sum(1 for _, _, timer in self.__events if timer.is_alive())
+
+	def wait(self, event, timeout):
+		"""Makes the calls due until @event is set, for @timeout seconds at most: what sets it has
+		to be one of them, as nothing else runs meanwhile
+		"""
+		self.run(until=self.__now + timeout, done=event.is_set)
+		return event.is_set()
+
+	def step(self):
+		"""Moves to the next call due and makes it, skipping cancelled ones
+
+		Returns:
+			bool: whether a call was made, False once there are none left
+		"""
+		while len(self.__events) > 0:
+			when, _, timer = heapq.heappop(self.__events)
+			if not timer.is_alive():
+				continue
+			self.__now = when
+			timer.fire()
+			self.__fired += 1
+			return True
+		return False
+
+	def run(self, until=None, done=None):
+		"""Makes the calls due, in order, until none are left, the next one is due after
+		@until, or @done returns True
+
+		Args:
+			until (float, optional): time to stop at, in seconds. Defaults to None (no limit).
+			done (Callable, optional): checked after every call. Defaults to None.
+
+		Returns:
+			bool: whether @done returned True
+		"""
+		while done is None or not done():
+			while len(self.__events) > 0 and not self.__events[0][2].is_alive():
+				heapq.heappop(self.__events)
+			if len(self.__events) == 0:
+				return False
+			if until is not None and self.__events[0][0] > until:
+				self.__now = until
+				return False
+			self.step()
+		return True
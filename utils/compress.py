@@ -0,0 +1,122 @@
+import lzma
+import struct
+import zlib
+
+# methods, as announced in the COMPRESS option
+ZLIB = 1
+LZMA = 2
+METHODS = {'zlib': ZLIB, 'lzma': LZMA}
+
+# the compressed stream is a sequence of frames: kind (RAW or the method) and length of what follows
+FRAME = struct.Struct('!BI')
+RAW = 0
+
+BLOCK_SIZE = 64 * 1024 # input compressed at once
+MAX_BACKOFF = 64 # blocks sent raw without trying, after blocks that did not shrink
+
+
+class StreamCompressor(object):
+	"""Sender side of a compressed stream: input is cut in blocks of :attr:BLOCK_SIZE, each sent as
+	a frame, compressed or raw
+
+	zlib keeps a single deflate stream across blocks, sync flushed at the end of each so that
+	every frame can be inflated on arrival. lzma, which cannot flush mid-stream, compresses every
+	block on its own. A block that does not shrink goes out raw, and the following blocks are not
+	even tried for a while (doubling up to :attr:MAX_BACKOFF blocks), as for already compressed data.
+	"""
+
+	def __init__(self, method) -> None:
+		"""Constructs a compressor
+
+		Args:
+			method (int): :attr:ZLIB or :attr:LZMA
+		"""
+		if method not in METHODS.values():
+			raise Exception(f'unknown compression method {method}')
+		self.__method = method
+		self.__deflate = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS) if method == ZLIB else None
+		self.__pending = bytearray()
+		self.__backoff = 0
+		self.__skip = 0
+
+	@property
+	def method(self):
+		return self.__method
+
+	def compress(self, data):
+		"""Feeds @data to the stream
+
+		Returns:
+			bytes: frames of the blocks completed, possibly empty
+		"""
+		self.__pending += data
+		frames = b''
+		while len(self.__pending) >= BLOCK_SIZE:
+			frames += self.__frame(bytes(self.__pending[:BLOCK_SIZE]))
+			del self.__pending[:BLOCK_SIZE]
+		return frames
+
+	def flush(self):
+		"""Ends the current block early, e.g. before the data is needed on the other side
+
+		Returns:
+			bytes: its frame, empty if there is no input pending
+		"""
+		if len(self.__pending) == 0:
+			return b''
+		frame = self.__frame(bytes(self.__pending))
+		self.__pending.clear()
+		return frame
+
+	def __frame(self, block):
+		if self.__skip > 0:
+			self.__skip -= 1
+			return FRAME.pack(RAW, len(block)) + block
+		if self.__method == ZLIB:
+			# on a copy, so that a block sent raw leaves no trace in the history of the stream
+			deflate = self.__deflate.copy()
+			compressed = deflate.compress(block) + deflate.flush(zlib.Z_SYNC_FLUSH)
+		else:
+			compressed = lzma.compress(block)
+		if len(compressed) >= len(block):
+			self.__backoff = min(max(self.__backoff * 2, 1), MAX_BACKOFF)
+			self.__skip = self.__backoff
+			return FRAME.pack(RAW, len(block)) + block
+		if self.__method == ZLIB:
+			self.__deflate = deflate
+		self.__backoff = 0
+		return FRAME.pack(self.__method, len(compressed)) + compressed
+
+
+class StreamDecompressor(object):
+	"""Receiver side of :class:StreamCompressor: takes the stream in order, in pieces of any size
+	"""
+
+	def __init__(self, method) -> None:
+		self.__inflate = zlib.decompressobj(-zlib.MAX_WBITS) if method == ZLIB else None
+		self.__pending = bytearray()
+
+	def decompress(self, data):
+		"""Feeds the next @data of the stream
+
+		Returns:
+			bytes: output of the frames completed, possibly empty
+		"""
+		self.__pending += data
+		output = []
+		while len(self.__pending) >= FRAME.size:
+			kind, length = FRAME.unpack_from(self.__pending)
+			end = FRAME.size + length
+			if len(self.__pending) < end:
+				break
+			body = bytes(self.__pending[FRAME.size:end])
+			del self.__pending[:end]
+			if kind == RAW:
+				output.append(body)
+			elif kind == ZLIB and self.__inflate is not None:
+				output.append(self.__inflate.decompress(body))
+			elif kind == LZMA:
+				output.append(lzma.decompress(body))
+			else:
+				raise Exception(f'unexpected frame of kind {kind}')
+		return b''.join(output)
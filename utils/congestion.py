@@ -0,0 +1,62 @@
+class CongestionControl(object):
+	"""Reno congestion window of a sender, in segments
+
+	Slow start grows the window by a segment per segment ACKed (doubling it every RTT) up to
+	the slow start threshold, then congestion avoidance adds about a segment per RTT. A loss
+	detected from duplicate ACKs halves the window (fast recovery), a timeout sets the threshold
+	to half of what was in flight, and starts over from a single segment.
+	"""
+
+	INIT_CWND = 10 # segments, as RFC 6928
+	MIN_SSTHRESH = 2
+
+	def __init__(self, cwnd=INIT_CWND, ssthresh=None, max_cwnd=None) -> None:
+		"""
+		Args:
+			cwnd (float, optional): initial window in segments. Defaults to :attr:INIT_CWND.
+			ssthresh (float, optional): initial slow start threshold in segments, e.g. from an earlier
+				connection. Defaults to None (slow start until the first loss).
+			max_cwnd (float, optional): the window never grows past this, e.g. the sender's own window.
+				Defaults to None (unbounded).
+		"""
+		self.__max_cwnd = max_cwnd if max_cwnd is not None else float('inf')
+		self.__cwnd = min(cwnd, self.__max_cwnd)
+		self.__ssthresh = ssthresh if ssthresh is not None else float('inf')
+
+	@property
+	def cwnd(self):
+		return self.__cwnd
+
+	@property
+	def ssthresh(self):
+		"""Slow start threshold in segments, None until a loss (or a cached value) set it
+		"""
+		return self.__ssthresh if self.__ssthresh != float('inf') else None
+
+	def on_ack(self, segments):
+		"""@segments were newly ACKed
+		"""
+		if self.__cwnd < self.__ssthresh:
+			# slow start, switching to congestion avoidance for what is past the threshold
+			grown = min(self.__cwnd + segments, self.__ssthresh)
+			segments -= grown - self.__cwnd
+			self.__cwnd = grown
+		if segments > 0:
+			self.__cwnd += segments / self.__cwnd
+		self.__cwnd = min(self.__cwnd, self.__max_cwnd)
+		return
+
+	def on_loss(self, in_flight):
+		"""A loss was detected from duplicate ACKs with @in_flight segments unACKed: halves the
+		window, and continues in congestion avoidance from there
+		"""
+		self.__ssthresh = max(in_flight / 2, CongestionControl.MIN_SSTHRESH)
+		self.__cwnd = self.__ssthresh
+		return
+
+	def on_timeout(self, in_flight):
+		"""The retransmission timer expired with @in_flight segments unACKed
+		"""
+		self.__ssthresh = max(in_flight / 2, CongestionControl.MIN_SSTHRESH)
+		self.__cwnd = 1
+		return
@@ -0,0 +1,67 @@
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import threading
+
+
+class CookieJar(object):
+	"""Client side cache of fast open cookies, one per server address
+
+	Cookies are kept in memory and, when @path is given, persisted as JSON so that
+	the next run of the client can put data in its very first SYN.
+	"""
+
+	def __init__(self, path=None) -> None:
+		self.__path = path
+		self.__lock = threading.Lock()
+		self.__cookies = {}
+		if path is not None and os.path.exists(path):
+			try:
+				with open(path) as f:
+					self.__cookies = json.load(f)
+			except (OSError, ValueError) as err:
+				logging.error("ignoring unreadable cookie jar '%s': %s", path, err)
+
+	@staticmethod
+	def __key(address):
+		return f'{address[0]}:{address[1]}'
+
+	def get(self, address):
+		"""Returns the cookie for server @address (ip, port), None if there is none
+		"""
+		cookie = self.__cookies.get(CookieJar.__key(address))
+		return bytes.fromhex(cookie) if cookie is not None else None
+
+	def set(self, address, cookie):
+		with self.__lock:
+			self.__cookies[CookieJar.__key(address)] = cookie.hex()
+			if self.__path is not None:
+				tmp_path = f'{self.__path}.tmp'
+				with open(tmp_path, 'w') as f:
+					json.dump(self.__cookies, f)
+				os.replace(tmp_path, self.__path)
+		return
+
+	def remove(self, address):
+		with self.__lock:
+			self.__cookies.pop(CookieJar.__key(address), None)
+		return
+
+
+class CookieFactory(object):
+	"""Server side fast open cookies: a truncated HMAC of the client IP under a secret key
+	"""
+
+	COOKIE_LEN = 8
+
+	def __init__(self, key=None) -> None:
+		self.__key = key or secrets.token_bytes(16)
+
+	def make(self, client_ip):
+		return hmac.new(self.__key, client_ip.encode(), hashlib.sha256).digest()[:CookieFactory.COOKIE_LEN]
+
+	def is_valid(self, client_ip, cookie):
+		return cookie is not None and hmac.compare_digest(self.make(client_ip), cookie)
@@ -0,0 +1,168 @@
+import struct
+
+# value of the FEC option of a parity packet: seq nums covered [start, end), number of data
+# segments in there, and the XOR of their lengths
+PARITY = struct.Struct('IIHH')
+# value of the FEC option of an ACK: number of segments the receiver rebuilt so far
+RECOVERED = struct.Struct('I')
+
+
+def _to_int(payload):
+	# XOR over arbitrary lengths: little endian, so that shorter payloads are zero-padded at the end
+	return int.from_bytes(payload, 'little')
+
+
+class FecEncoder(object):
+	"""Sender side XOR parity over groups of consecutive data segments
+
+	After every :attr:self.group_size segments added, :func:self.add returns a parity packet
+	from which the receiver can rebuild any single segment of the group it lost. The group size
+	follows an estimate of the loss rate (a moving average over the segments sent, fed by
+	:func:self.lost), so that a group loses about :attr:TARGET_LOSSES segments on average:
+	redundancy grows with the loss rate, and stays at 1/:attr:MAX_GROUP on a clean link.
+	"""
+
+	MIN_GROUP = 2
+	MAX_GROUP = 32
+	TARGET_LOSSES = 0.25 # expected losses per group, a second one makes the group unrecoverable
+	ALPHA = 1 / 128 # weight of a segment in the loss rate estimate
+
+	def __init__(self) -> None:
+		self.__loss_rate = 0
+		self.__group_size = FecEncoder.MAX_GROUP
+		self.__reset_group(None)
+
+	@property
+	def loss_rate(self):
+		return self.__loss_rate
+
+	@property
+	def group_size(self):
+		"""Number of data segments per parity packet
+		"""
+		return self.__group_size
+
+	def __reset_group(self, start):
+		self.__start = start
+		self.__end = start
+		self.__count = 0
+		self.__xor_len = 0
+		self.__parity = 0
+		self.__parity_len = 0
+		return
+
+	def add(self, seq_num, payload):
+		"""Adds a data segment sent for the first time, in seq num order
+
+		Returns:
+			(bytes, bytes): value of the FEC option and payload of the parity packet that closes the
+			group, None if the group is not complete yet
+		"""
+		self.__loss_rate *= 1 - FecEncoder.ALPHA
+		if self.__start is None or seq_num != self.__end:
+			self.__reset_group(seq_num) # e.g. a segment was not added, start over
+		self.__end = seq_num + len(payload)
+		self.__count += 1
+		self.__xor_len ^= len(payload)
+		self.__parity ^= _to_int(payload)
+		self.__parity_len = max(self.__parity_len, len(payload))
+		if self.__count >= self.__group_size:
+			return self.flush()
+		return None
+
+	def flush(self):
+		"""Closes the current group early, e.g. at the end of the stream, where a lost segment
+		would otherwise wait for a timeout
+
+		Returns:
+			(bytes, bytes): as :func:self.add, None if the group is empty
+		"""
+		if self.__count == 0:
+			return None
+		option = PARITY.pack(self.__start, self.__end, self.__count, self.__xor_len)
+		parity = self.__parity.to_bytes(self.__parity_len, 'little')
+		self.__reset_group(self.__end)
+		return option, parity
+
+	def lost(self, segments=1):
+		"""Counts @segments lost, i.e. retransmitted or rebuilt by the receiver, and adapts the group size
+		"""
+		self.__loss_rate = min(self.__loss_rate + segments * FecEncoder.ALPHA, 1)
+		self.__group_size = FecEncoder.MAX_GROUP
+		if self.__loss_rate > 0:
+			self.__group_size = min(max(round(FecEncoder.TARGET_LOSSES / self.__loss_rate), FecEncoder.MIN_GROUP), FecEncoder.MAX_GROUP)
+		return
+
+
+class FecDecoder(object):
+	"""Receiver side of :class:FecEncoder: remembers the last @capacity data segments received,
+	and rebuilds the one segment of a group missing when its parity packet arrives
+	"""
+
+	def __init__(self, capacity=1024) -> None:
+		self.__capacity = capacity
+		self.__segments = {} # seq num -> (end seq num, length, payload as int), oldest first
+		self.__by_end = {} # end seq num -> seq num
+		self.__recovered = 0
+
+	@property
+	def recovered(self):
+		"""Number of segments rebuilt so far
+		"""
+		return self.__recovered
+
+	def add(self, seq_num, payload):
+		"""Remembers a data segment received. Its payload is copied, the buffer may be reused
+		"""
+		if seq_num in self.__segments:
+			return
+		if len(self.__segments) >= self.__capacity:
+			oldest = next(iter(self.__segments))
+			self.__by_end.pop(self.__segments.pop(oldest)[0], None)
+		end = seq_num + len(payload)
+		self.__segments[seq_num] = (end, len(payload), _to_int(payload))
+		self.__by_end[end] = seq_num
+		return
+
+	def recover(self, option, parity):
+		"""Rebuilds the segment missing from the group of a parity packet
+
+		The group is walked from both ends over the segments received: what is left in between is
+		the one segment missing, if the other count - 1 are there and the lengths add up.
+
+		Args:
+			option (bytes): value of the FEC option of the parity packet
+			parity (bytes): its payload
+
+		Returns:
+			(int, bytes): seq num and payload of the segment rebuilt, None if none is missing or
+			more than one is
+		"""
+		start, end, count, length = PARITY.unpack(option)
+		value = _to_int(parity)
+		seen = 0
+		seq = start
+		while seq < end and seq in self.__segments:
+			seq, seg_len, seg_value = self.__segments[seq]
+			length ^= seg_len
+			value ^= seg_value
+			seen += 1
+		if seq >= end:
+			return None # nothing missing
+		gap_start = seq
+		seq = end
+		while seq > gap_start and seq in self.__by_end:
+			seq = self.__by_end[seq]
+			_, seg_len, seg_value = self.__segments[seq]
+			length ^= seg_len
+			value ^= seg_value
+			seen += 1
+		if seen != count - 1 or seq - gap_start != length:
+			return None
+		try:
+			payload = value.to_bytes(length, 'little')
+		except OverflowError:
+			return None # not the segment the parity was computed over
+		self.__recovered += 1
+		self.add(gap_start, payload)
+		return gap_start, payload
@@ -0,0 +1,81 @@
+import json
+import logging
+import os
+import threading
+import time
+
+
+class MetricsCache(object):
+	"""Client side cache of path metrics, one entry per server address, in the spirit of Linux tcp_metrics
+
+	An entry holds what a connection learnt about the path: smoothed RTT and its variation,
+	slow start threshold and a recent delivery rate. The next connection to the same server
+	starts from them rather than from scratch. Entries are kept in memory and, when @path is
+	given, persisted as JSON. At most @capacity of them are kept, the least recently used go
+	first, and an entry older than @ttl seconds is not used anymore.
+	"""
+
+	CAPACITY = 256
+	TTL = 3600 # seconds
+
+	def __init__(self, path=None, capacity=CAPACITY, ttl=TTL) -> None:
+		self.__path = path
+		self.__capacity = capacity
+		self.__ttl = ttl
+		self.__lock = threading.Lock()
+		self.__entries = self.__load() # least recently used first
+
+	@staticmethod
+	def __key(address):
+		return f'{address[0]}:{address[1]}'
+
+	def __load(self):
+		if self.__path is None or not os.path.exists(self.__path):
+			return {}
+		try:
+			with open(self.__path) as f:
+				return json.load(f)
+		except (OSError, ValueError) as err:
+			logging.error("ignoring unreadable metrics cache '%s': %s", self.__path, err)
+			return {}
+
+	def __expired(self, entry, now):
+		return now - entry.get('updated', 0) > self.__ttl
+
+	def get(self, address):
+		"""Returns the metrics of server @address (ip, port) as a dict (srtt, rttvar in seconds, ssthresh
+		in segments or None, delivery_rate in bytes/s or None), None if there are none or they expired
+		"""
+		key = MetricsCache.__key(address)
+		with self.__lock:
+			entry = self.__entries.pop(key, None)
+			if entry is None or self.__expired(entry, time.time()):
+				return None
+			self.__entries[key] = entry # most recently used
+		return {name: entry.get(name) for name in ('srtt', 'rttvar', 'ssthresh', 'delivery_rate')}
+
+	def set(self, address, srtt, rttvar, ssthresh=None, delivery_rate=None):
+		"""Stores the metrics of server @address, evicting expired and least recently used entries.
+		Entries other clients saved to the file meanwhile are kept.
+		"""
+		key = MetricsCache.__key(address)
+		now = time.time()
+		with self.__lock:
+			entries = self.__load() if self.__path is not None else self.__entries
+			entries.pop(key, None)
+			entries[key] = {'srtt': srtt, 'rttvar': rttvar, 'ssthresh': ssthresh, 'delivery_rate': delivery_rate, 'updated': now}
+			entries = {name: entry for name, entry in entries.items() if not self.__expired(entry, now)}
+			while len(entries) > self.__capacity:
+				entries.pop(next(iter(entries)))
+			self.__entries = entries
+			if self.__path is not None:
+				tmp_path = f'{self.__path}.tmp'
+				with open(tmp_path, 'w') as f:
+					json.dump(entries, f)
+				os.replace(tmp_path, self.__path)
+		return
+
+	def remove(self, address):
+		with self.__lock:
+			self.__entries.pop(MetricsCache.__key(address), None)
+		return
@@ -0,0 +1,192 @@
+import collections
+import math
+import struct
+
+# value of the MULTIPATH option of a data segment: path it was sent on, and its number among
+# the datagrams sent on that path (from 1, a retransmission gets a new one)
+PATH = struct.Struct('BI')
+# value of the MULTIPATH option of an ACK: path and number of the latest data segment received,
+# and the number of data segments received on that path so far
+ECHO = struct.Struct('BII')
+
+
+class Path(object):
+	"""Estimates of a single path of a multipath sender, from the echoes of the receiver
+
+	Every echo gives an RTT sample of the datagram it names, and the number of datagrams that
+	path delivered, from which a loss rate is estimated over batches of :attr:LOSS_BATCH datagrams.
+	"""
+
+	ALPHA = 1 / 8 # weight of an RTT sample, as for the connection's RTT
+	BETA = 1 / 4 # weight of its deviation
+	LOSS_ALPHA = 1 / 4 # weight of a loss rate sample
+	LOSS_BATCH = 16 # datagrams per loss rate sample, at least
+	MAX_PENDING = 1024 # send times kept for RTT samples, the oldest go first
+
+	def __init__(self) -> None:
+		self.__sent = 0
+		self.__pending = collections.deque(maxlen=Path.MAX_PENDING) # (number, time sent) of the datagrams not echoed yet
+		self.__srtt = None
+		self.__rttvar = 0
+		self.__loss_rate = 0
+		self.__mark = (0, 0) # (datagrams sent, datagrams received) the current loss rate sample started at
+
+	@property
+	def sent(self):
+		return self.__sent
+
+	@property
+	def srtt(self):
+		"""Smoothed RTT in seconds, None until the first echo
+		"""
+		return self.__srtt
+
+	@property
+	def rttvar(self):
+		return self.__rttvar
+
+	@property
+	def loss_rate(self):
+		return self.__loss_rate
+
+	def on_send(self, now):
+		"""A datagram goes out on this path at @now
+
+		Returns:
+			int: its number on the path
+		"""
+		self.__sent += 1
+		self.__pending.append((self.__sent, now))
+		return self.__sent
+
+	def on_echo(self, number, received, now):
+		"""The receiver echoed datagram @number of this path, having received @received of them so far
+
+		Returns:
+			float: RTT sample of that datagram, None if it was echoed already
+		"""
+		pending = self.__pending
+		while len(pending) > 0 and pending[0][0] < number:
+			pending.popleft() # lost, or echoed in the same ACK as a later one
+		sample = None
+		if len(pending) > 0 and pending[0][0] == number:
+			_, sent_at = pending.popleft()
+			sample = now - sent_at
+			if self.__srtt is None:
+				self.__srtt, self.__rttvar = sample, sample / 2
+			else:
+				self.__rttvar = (1 - Path.BETA) * self.__rttvar + Path.BETA * abs(sample - self.__srtt)
+				self.__srtt = (1 - Path.ALPHA) * self.__srtt + Path.ALPHA * sample
+		sent, delivered = self.__mark
+		if number - sent >= Path.LOSS_BATCH:
+			rate = min(max(1 - (received - delivered) / (number - sent), 0), 1)
+			self.__loss_rate += Path.LOSS_ALPHA * (rate - self.__loss_rate)
+			self.__mark = (number, received)
+		return sample
+
+	def stalled(self, now, rtt):
+		"""Whether nothing sent on this path was echoed for :attr:Multipath.STALL_RTTS times @rtt
+		(its own RTT if known), e.g. the proxy went down
+		"""
+		if len(self.__pending) == 0:
+			return False
+		rtt = self.__srtt if self.__srtt is not None else rtt
+		return now - self.__pending[0][1] > max(Multipath.STALL_RTTS * rtt, Multipath.MIN_STALL)
+
+	def snapshot(self):
+		return {
+			'sent': self.__sent,
+			'srtt': round(self.__srtt, 6) if self.__srtt is not None else None,
+			'rttvar': round(self.__rttvar, 6),
+			'loss_rate': round(self.__loss_rate, 4),
+		}
+
+
+class Multipath(object):
+	"""Schedules the datagrams of a connection over several paths
+
+	Each path is weighted by the throughput a TCP flow would get over it alone, 1 / (RTT * sqrt(loss rate))
+	(Mathis et al.), with a floor of :attr:LOSS_FLOOR under the loss rate so that clean paths compare
+	by RTT. Datagrams are spread in proportion with a smooth weighted round robin, every path getting
+	at least :attr:MIN_SHARE of them to keep its estimates current. A path that stalled gets only that.
+	"""
+
+	LOSS_FLOOR = 0.01
+	MIN_SHARE = 1 / 32
+	STALL_RTTS = 4
+	MIN_STALL = 0.2 # seconds
+
+	def __init__(self, count) -> None:
+		"""
+		Args:
+			count (int): number of paths
+		"""
+		self.__paths = [Path() for _ in range(count)]
+		self.__credits = [0] * count
+
+	def __len__(self):
+		return len(self.__paths)
+
+	def __base_rtt(self):
+		rtts = [path.srtt for path in self.__paths if path.srtt is not None]
+		return min(rtts) if len(rtts) > 0 else None
+
+	def weights(self, now):
+		"""Share of the datagrams each path gets
+		"""
+		base = self.__base_rtt()
+		if base is None:
+			return [1 / len(self.__paths)] * len(self.__paths)
+		weights = []
+		for path in self.__paths:
+			if path.stalled(now, base):
+				weights.append(0)
+				continue
+			rtt = path.srtt if path.srtt is not None else base # unknown yet, as good as the best
+			weights.append(1 / (max(rtt, 1e-6) * math.sqrt(path.loss_rate + Multipath.LOSS_FLOOR)))
+		total = sum(weights)
+		if total == 0:
+			return [1 / len(self.__paths)] * len(self.__paths)
+		return [max(weight / total, Multipath.MIN_SHARE) for weight in weights]
+
+	def rtt_spread(self, default):
+		"""Seconds by which the RTTs of the paths differ at most, their variation included: datagrams
+		sent over the faster ones overtake the others by as much, which is not a loss. @default until
+		every path has an RTT
+		"""
+		if any(path.srtt is None for path in self.__paths):
+			return default
+		return max(path.srtt + 2 * path.rttvar for path in self.__paths) - min(path.srtt for path in self.__paths)
+
+	def route(self, now):
+		"""Picks the path of the next datagram
+
+		Returns:
+			(int, bytes): the path, and the value of the MULTIPATH option for the datagram
+		"""
+		weights = self.weights(now)
+		credits = self.__credits
+		for i, weight in enumerate(weights):
+			credits[i] += weight
+		index = max(range(len(credits)), key=credits.__getitem__)
+		credits[index] -= sum(weights)
+		number = self.__paths[index].on_send(now)
+		return index, PATH.pack(index, number)
+
+	def on_echo(self, value, now):
+		"""Takes the MULTIPATH option of an ACK
+
+		Returns:
+			float: RTT sample of the datagram it echoes, None if there is none
+		"""
+		if len(value) != ECHO.size:
+			return None
+		index, number, received = ECHO.unpack(value)
+		if index >= len(self.__paths):
+			return None
+		return self.__paths[index].on_echo(number, received, now)
+
+	def snapshot(self):
+		"""Estimates of every path, as a list of dicts
+		"""
+		return [path.snapshot() for path in self.__paths]
@@ -0,0 +1,90 @@
+class Rack(object):
+	"""RACK time-based loss detection of a sender (RFC 8985)
+
+	Rather than counting duplicate ACKs, a segment is deemed lost once a segment sent after it
+	was delivered (ACKed or SACKed) and a reordering window went by on top of the RTT. The window
+	is a quarter of the minimum RTT, none at all while in recovery with no reordering seen yet,
+	and it widens by as much each time a D-SACK reports a retransmission was spurious (once per
+	round trip, for 16 recoveries after the last one), up to the smoothed RTT.
+	"""
+
+	REO_WND_PERSIST = 16 # recoveries a widened reordering window lasts
+
+	def __init__(self) -> None:
+		self.__xmit_ts = None # time the latest sent segment delivered was sent
+		self.__end_seq = None # and its end seq num
+		self.__rtt = None # seconds, of that segment
+		self.__min_rtt = None
+		self.__fack = None # highest end seq num delivered
+		self.__reordering_seen = False
+		self.__reo_wnd_mult = 1
+		self.__reo_wnd_persist = 0
+		self.__dsack_round = None # seq num ending the round trip a D-SACK widened the window in
+
+	@property
+	def reo_wnd_mult(self):
+		return self.__reo_wnd_mult
+
+	def on_delivered(self, delivered, lowest, now):
+		"""Takes the segments an ACK delivered into account, as given by :func:SendQueue.take_delivered
+		"""
+		if lowest is not None and self.__fack is not None and lowest < self.__fack:
+			self.__reordering_seen = True # a segment never retransmitted came after a later one
+		if delivered is None:
+			return
+		sent_at, end_seq, retransmitted = delivered
+		rtt = now - sent_at
+		if retransmitted and self.__min_rtt is not None and rtt < self.__min_rtt:
+			return # too early to be the ACK of the retransmission, the original was late
+		if self.__min_rtt is None or rtt < self.__min_rtt:
+			self.__min_rtt = rtt
+		if self.__fack is None or end_seq > self.__fack:
+			self.__fack = end_seq
+		if self.__xmit_ts is None or (sent_at, end_seq) > (self.__xmit_ts, self.__end_seq):
+			self.__xmit_ts, self.__end_seq, self.__rtt = sent_at, end_seq, rtt
+		return
+
+	def on_dsack(self, snd_una, snd_nxt):
+		"""A D-SACK reports a retransmission was spurious: widens the reordering window, at most once
+		per round trip
+		"""
+		if self.__dsack_round is not None and snd_una >= self.__dsack_round:
+			self.__dsack_round = None
+		self.__reordering_seen = True
+		if self.__dsack_round is None:
+			self.__dsack_round = snd_nxt
+			self.__reo_wnd_mult += 1
+			self.__reo_wnd_persist = Rack.REO_WND_PERSIST
+		return
+
+	def on_recovery(self):
+		"""A recovery ended: a widened reordering window shrinks back after enough of them
+		"""
+		if self.__reo_wnd_persist > 0:
+			self.__reo_wnd_persist -= 1
+			if self.__reo_wnd_persist == 0:
+				self.__reo_wnd_mult = 1
+		return
+
+	def reo_wnd(self, srtt, recovering, sacked, dup_thresh=3):
+		"""Reordering window in seconds
+		"""
+		if self.__min_rtt is None:
+			return 0
+		if not self.__reordering_seen and (recovering or sacked >= dup_thresh):
+			return 0
+		return min(self.__reo_wnd_mult * self.__min_rtt / 4, srtt)
+
+	def detect(self, queue, reo_wnd, now):
+		"""Marks the segments of @queue (a SendQueue) deemed lost
+
+		Returns:
+			(int, float): number of segments newly lost, and the seconds after which the others sent
+			before the latest delivered are lost if still not delivered, None if there is none
+		"""
+		if self.__xmit_ts is None:
+			return 0, None
+		lost, pending = queue.mark_lost(self.__xmit_ts, self.__end_seq, now - self.__rtt - reo_wnd)
+		if pending is None:
+			return lost, None
+		return lost, max(pending + self.__rtt + reo_wnd - now, 0)
@@ -0,0 +1,237 @@
+import bisect
+import hashlib
+import json
+import logging
+import os
+import struct
+import threading
+import time
+
+# value of the RESUME option: in a SYN, identity of the file about to be sent (size and fingerprint),
+# in the SYN-ACK, (start, end) offsets of the ranges of it the server has already, and in the FIN,
+# digest of the whole file
+IDENTITY = struct.Struct('IQ')
+RANGE = struct.Struct('II')
+DIGEST_SIZE = 16
+
+FINGERPRINT_BYTES = 64 * 1024 # head of the file that goes into its fingerprint
+CHUNK_SIZE = 1024 * 1024 # read at once when hashing a whole file
+
+
+def new_digest():
+	"""Streaming hash of a whole file, see :func:file_digest
+	"""
+	return hashlib.blake2b(digest_size=DIGEST_SIZE)
+
+def identify(path):
+	"""Identity of the file @path, as announced in a SYN: its size, and a fingerprint of its
+	first :attr:FINGERPRINT_BYTES. The digest checked at the end covers the rest.
+
+	Returns:
+		(int, int): size and fingerprint
+	"""
+	size = os.path.getsize(path)
+	with open(path, 'rb') as f:
+		head = f.read(FINGERPRINT_BYTES)
+	fingerprint = hashlib.blake2b(head, digest_size=8, salt=size.to_bytes(8, 'little'))
+	return size, int.from_bytes(fingerprint.digest(), 'little')
+
+def file_digest(path, size):
+	"""Digest of the first @size bytes of @path, read :attr:CHUNK_SIZE bytes at a time
+	"""
+	digest = new_digest()
+	with open(path, 'rb') as f:
+		while size > 0:
+			chunk = f.read(min(CHUNK_SIZE, size))
+			if not chunk:
+				break
+			digest.update(chunk)
+			size -= len(chunk)
+	return digest.digest()
+
+def pack_ranges(ranges, room):
+	"""Value of the RESUME option of a SYN-ACK: as many of @ranges as @room bytes take, the
+	largest ones first. The ones left out are simply sent again.
+
+	Returns:
+		bytes: the ranges picked, in order
+	"""
+	count = max(room // RANGE.size, 0)
+	picked = sorted(sorted(ranges, key=lambda r: r[1] - r[0], reverse=True)[:count])
+	return b''.join(RANGE.pack(start, end) for start, end in picked)
+
+def unpack_ranges(value):
+	return [RANGE.unpack_from(value, i) for i in range(0, len(value) - len(value) % RANGE.size, RANGE.size)]
+
+def missing(ranges, size):
+	"""Ranges of [0, @size) not covered by @ranges (sorted, not overlapping), i.e. what is left to send
+	"""
+	gaps = []
+	position = 0
+	for start, end in ranges:
+		if start > position:
+			gaps.append((position, min(start, size)))
+		position = max(position, end)
+		if position >= size:
+			break
+	if position < size:
+		gaps.append((position, size))
+	return [(start, end) for start, end in gaps if start < end]
+
+def clip(ranges, start, end):
+	"""Parts of @ranges (sorted) within [@start, @end)
+	"""
+	return [(max(s, start), min(e, end)) for s, e in ranges if s < end and e > start]
+
+
+class StreamMap(object):
+	"""Maps offsets of a resumed stream, which carries the ranges of a file missing on the
+	receiving side back to back, to positions in the file
+	"""
+
+	def __init__(self, size, received) -> None:
+		"""
+		Args:
+			size (int): size of the file
+			received (list): (start, end) ranges of it received already, sorted
+		"""
+		self.__size = size
+		self.__ranges = missing(received, size)
+		self.__offsets = [] # stream offset of the first byte of each range
+		offset = 0
+		for start, end in self.__ranges:
+			self.__offsets.append(offset)
+			offset += end - start
+		self.__length = offset
+
+	@property
+	def size(self):
+		"""Size of the file
+		"""
+		return self.__size
+
+	@property
+	def length(self):
+		"""Number of bytes in the stream
+		"""
+		return self.__length
+
+	def spans(self, offset, length):
+		"""Where the @length bytes at @offset of the stream go
+
+		Returns:
+			list: (file position, start, end) pieces, start and end relative to @offset
+		"""
+		pieces = []
+		i = bisect.bisect_right(self.__offsets, offset) - 1
+		done = 0
+		while done < length and 0 <= i < len(self.__ranges):
+			start, end = self.__ranges[i]
+			skip = offset + done - self.__offsets[i]
+			size = min(end - start - skip, length - done)
+			if size > 0:
+				pieces.append((start + skip, done, done + size))
+				done += size
+			i += 1
+		return pieces
+
+
+class Checkpoint(object):
+	"""Ranges of an output file received so far, persisted next to it (@path.resume, as JSON)
+	so that a transfer cut short can be resumed by the next connection
+
+	Ranges are :func:self.add'ed once written, and only :func:self.commit'ed once the file is
+	flushed, so that the checkpoint never claims data still in a buffer of the process. Commits
+	are saved at most every :attr:SAVE_INTERVAL seconds.
+	"""
+
+	SAVE_INTERVAL = 1
+
+	def __init__(self, path) -> None:
+		self.__path = path
+		self.__checkpoint_path = f'{path}.resume'
+		self.__lock = threading.Lock()
+		self.__identity = None
+		self.__ranges = [] # committed, sorted and merged
+		self.__pending = [] # written, not flushed yet
+		self.__saved = 0
+		if os.path.exists(self.__checkpoint_path):
+			try:
+				with open(self.__checkpoint_path) as f:
+					saved = json.load(f)
+				self.__identity = (saved['size'], saved['fingerprint'])
+				self.__ranges = [tuple(r) for r in saved['ranges']]
+			except (OSError, ValueError, KeyError) as err:
+				logging.error("ignoring unreadable checkpoint '%s': %s", self.__checkpoint_path, err)
+
+	@property
+	def path(self):
+		"""Output file the checkpoint is about
+		"""
+		return self.__path
+
+	@property
+	def ranges(self):
+		return list(self.__ranges)
+
+	def ranges_for(self, size, fingerprint):
+		"""Ranges received of the file of identity (@size, @fingerprint), empty unless the
+		checkpoint is about that same file and the output still holds them. Otherwise, the
+		checkpoint starts over for that file.
+		"""
+		with self.__lock:
+			self.__pending = []
+			on_disk = os.path.getsize(self.__path) if os.path.exists(self.__path) else 0
+			if self.__identity == (size, fingerprint) and all(end <= on_disk for _, end in self.__ranges):
+				return list(self.__ranges)
+			self.__identity = (size, fingerprint)
+			self.__ranges = []
+		self.commit(force=True)
+		return []
+
+	def add(self, start, end):
+		"""Records that [@start, @end) of the file is written, see :func:self.commit
+		"""
+		with self.__lock:
+			self.__pending.append((start, end))
+		return
+
+	def commit(self, force=False):
+		"""Takes in the ranges added so far, the file being flushed. Saves the checkpoint if
+		the last save is :attr:SAVE_INTERVAL seconds old, or if @force
+		"""
+		with self.__lock:
+			pending, self.__pending = self.__pending, []
+			if pending:
+				self.__ranges = merge(self.__ranges + pending)
+			if self.__identity is None or not (force or time.time() - self.__saved >= Checkpoint.SAVE_INTERVAL):
+				return
+			tmp_path = f'{self.__checkpoint_path}.tmp'
+			with open(tmp_path, 'w') as f:
+				json.dump({'size': self.__identity[0], 'fingerprint': self.__identity[1], 'ranges': self.__ranges}, f)
+			os.replace(tmp_path, self.__checkpoint_path)
+			self.__saved = time.time()
+		return
+
+	def remove(self):
+		"""Forgets the file, e.g. once it is complete
+		"""
+		with self.__lock:
+			self.__identity = None
+			self.__ranges = []
+			self.__pending = []
+			if os.path.exists(self.__checkpoint_path):
+				os.remove(self.__checkpoint_path)
+		return
+
+
+def merge(ranges):
+	"""Sorts @ranges and merges the ones that overlap or touch
+	"""
+	merged = []
+	for start, end in sorted(ranges):
+		if merged and start <= merged[-1][1]:
+			merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+		else:
+			merged.append((start, end))
+	return merged
@@ -0,0 +1,48 @@
+import struct
+
+BLOCK = struct.Struct('II') # left edge, right edge (seq num right after the block)
+
+
+def blocks(segments, latest=None):
+	"""SACK blocks (RFC 2018) of segments received out of order: their ranges merged where they
+	touch, the block holding @latest (the segment received last) first, then the others from the
+	highest down, as the sender learns most from the recent ones
+
+	Args:
+		segments (iterable): (start, end) seq num ranges
+		latest (int, optional): seq num of the segment received last. Defaults to None.
+
+	Returns:
+		list: of (left, right) blocks
+	"""
+	merged = []
+	for start, end in sorted(segments):
+		if merged and start <= merged[-1][1]:
+			merged[-1][1] = max(merged[-1][1], end)
+		else:
+			merged.append([start, end])
+	merged.reverse()
+	if latest is not None and len(merged) > 0:
+		first = next((i for i, (left, right) in enumerate(merged) if left <= latest < right), 0)
+		merged.insert(0, merged.pop(first))
+	return [tuple(block) for block in merged]
+
+def pack(blocks, room):
+	"""Value of a SACK option: as many of @blocks as @room bytes take, in order
+	"""
+	count = max(room // BLOCK.size, 0)
+	return b''.join(BLOCK.pack(left, right) for left, right in blocks[:count])
+
+def unpack(value):
+	return [BLOCK.unpack_from(value, i) for i in range(0, len(value) - len(value) % BLOCK.size, BLOCK.size)]
+
+def is_dsack(blocks, ack_num):
+	"""Whether the first of @blocks reports a duplicate (D-SACK, RFC 2883): it lies below the cumulative
+	@ack_num, or within the second block
+	"""
+	if len(blocks) == 0:
+		return False
+	left, right = blocks[0]
+	if right <= ack_num:
+		return True
+	return len(blocks) > 1 and blocks[1][0] <= left and right <= blocks[1][1]
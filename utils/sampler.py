@@ -21,6 +21,20 @@ class RTTSampler(object):
 		# used for doubling timeout
 		self.__within_timeout = False
 		pass
+
+	@property
+	def estimated_rtt(self):
+		return self.__estimated_rtt
+
+	@property
+	def dev_rtt(self):
+		return self.__dev_rtt
+
+	@property
+	def timeout_interval(self):
+		"""Current TimeoutInterval, without the doubling side effect of :func:self.get_interval
+		"""
+		return self.__timeout_interval
 	
 	def double_interval(self, enabled=True, restore=True):
 		self.__within_timeout = enabled
@@ -28,6 +42,15 @@ class RTTSampler(object):
 			self.__timeout_interval = round(self.__estimated_rtt + self.__gamma * self.__dev_rtt, 3)
 		return
 		
+	def seed(self, estimated_rtt, dev_rtt):
+		"""Starts from the estimates of an earlier connection over the same path, rather than from
+		the initial interval
+		"""
+		self.__estimated_rtt = estimated_rtt
+		self.__dev_rtt = dev_rtt
+		self.__timeout_interval = round(estimated_rtt + self.__gamma * dev_rtt, 3)
+		return
+
 	def update_interval(self, sample_rtt):
 		# we received something, switch back to using normal timeout
 		self.__within_timeout = False
@@ -37,12 +60,12 @@ class RTTSampler(object):
 		self.__estimated_rtt = (1-alpha) * self.__estimated_rtt + alpha * sample_rtt
 		self.__dev_rtt = (1-beta) * self.__dev_rtt + beta * (abs(sample_rtt - self.__estimated_rtt))
 		self.__timeout_interval = round(self.__estimated_rtt + self.__gamma * self.__dev_rtt, 3)
-		logging.debug(f"""
-		sample with {sample_rtt}
-		new self.__estimated_rtt {self.__estimated_rtt}
-		new self.__dev_rtt {self.__dev_rtt}
-		rounded new timeout interval {self.__timeout_interval}
-		""")
+		logging.debug("""
+		sample with %s
+		new self.__estimated_rtt %s
+		new self.__dev_rtt %s
+		rounded new timeout interval %s
+		""", sample_rtt, self.__estimated_rtt, self.__dev_rtt, self.__timeout_interval)
 		return
 
 	def get_interval(self):
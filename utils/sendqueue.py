@@ -0,0 +1,217 @@
+import bisect
+
+from collections import namedtuple
+
+# an unacked packet in the send window: its seq num range and the checksummed bytes to retransmit
+Segment = namedtuple('Segment', ['seq_num', 'end_seq', 'wire'])
+
+
+class SendQueue(object):
+	"""Unacked segments of a sender, in seq num order
+
+	Segments live in parallel arrays (start and end seq nums, wire bytes, time of last
+	transmission, number of retransmissions, and whether they were SACKed or deemed lost) read
+	from a moving head index. A cumulative ACK bisects for the acked prefix and moves the head
+	past it, instead of rebuilding the window, and the RTT sample it carries is read off the
+	last acked segment. The arrays are compacted once the dropped prefix makes up half of them,
+	so all of this is amortized O(1) apart from the O(log n) bisection.
+	"""
+
+	def __init__(self) -> None:
+		self.clear()
+
+	def clear(self):
+		self.__head = 0
+		self.__seqs = []
+		self.__ends = []
+		self.__wires = []
+		self.__sent_at = []
+		self.__retransmits = []
+		self.__sacked = []
+		self.__lost = []
+		self.__sacked_count = 0
+		self.__lost_count = 0
+		self.__sample_from = None # segments ending at or below this seq num give no RTT sample
+		self.__delivered = None # (sent at, end seq num, retransmitted) of the latest sent segment delivered, see :func:self.take_delivered
+		self.__lowest_delivered = None # lowest end seq num of the segments delivered never retransmitted
+		return
+
+	def __len__(self):
+		return len(self.__seqs) - self.__head
+
+	@property
+	def sacked(self):
+		"""Number of segments the receiver SACKed, i.e. has past a hole
+		"""
+		return self.__sacked_count
+
+	@property
+	def in_flight(self):
+		"""Number of segments still in the network: neither SACKed nor deemed lost and waiting to be retransmitted
+		"""
+		return len(self) - self.__sacked_count - self.__lost_count
+
+	def append(self, seq_num, end_seq, wire, sent_at):
+		"""Queues a segment that was just sent for the first time
+
+		Args:
+			seq_num (int): seq num of the segment
+			end_seq (int): seq num right after it, i.e. the ACK that acknowledges it
+			wire (bytes): the segment as sent
+			sent_at (float): time it was sent
+		"""
+		self.__seqs.append(seq_num)
+		self.__ends.append(end_seq)
+		self.__wires.append(wire)
+		self.__sent_at.append(sent_at)
+		self.__retransmits.append(0)
+		self.__sacked.append(False)
+		self.__lost.append(False)
+		return
+
+	def first(self):
+		"""Returns the oldest unacked segment as a Segment, None if there is none
+		"""
+		if len(self) == 0:
+			return None
+		head = self.__head
+		return Segment(self.__seqs[head], self.__ends[head], self.__wires[head])
+
+	def last(self):
+		"""Returns the segment sent last as a Segment, None if there is none
+		"""
+		if len(self) == 0:
+			return None
+		return Segment(self.__seqs[-1], self.__ends[-1], self.__wires[-1])
+
+	def mark_retransmit(self, now=None, last=False):
+		"""Counts a retransmission of the oldest segment, or of the one sent last if @last, sent again at @now
+		"""
+		index = -1 if last else self.__head
+		self.__retransmits[index] += 1
+		if now is not None:
+			self.__sent_at[index] = now
+		return
+
+	def invalidate_samples(self):
+		"""After a timeout, no segment currently queued gives an RTT sample (Karn's algorithm)
+		"""
+		if len(self) > 0:
+			self.__sample_from = self.__ends[-1]
+		return
+
+	def __deliver(self, index):
+		sent_at, end_seq, retransmitted = self.__sent_at[index], self.__ends[index], self.__retransmits[index] > 0
+		if self.__delivered is None or (sent_at, end_seq) > self.__delivered[:2]:
+			self.__delivered = (sent_at, end_seq, retransmitted)
+		if not retransmitted and (self.__lowest_delivered is None or end_seq < self.__lowest_delivered):
+			self.__lowest_delivered = end_seq
+		if self.__lost[index]:
+			self.__lost[index] = False
+			self.__lost_count -= 1
+		return
+
+	def take_delivered(self):
+		"""What the ACKs and SACKs since the last call delivered
+
+		Returns:
+			((float, int, bool), int): (time of last transmission, end seq num, whether it was retransmitted)
+			of the latest sent segment, None if nothing was, and the lowest end seq num of the segments
+			delivered that were never retransmitted, None if there is none
+		"""
+		delivered, lowest = self.__delivered, self.__lowest_delivered
+		self.__delivered = self.__lowest_delivered = None
+		return delivered, lowest
+
+	def ack(self, ack_num, now):
+		"""Drops every segment starting below @ack_num, i.e. cumulatively acknowledged
+
+		Args:
+			ack_num (int): ACK received
+			now (float): time it was received
+
+		Returns:
+			(int, float): number of segments dropped, and the RTT sample of the segment that @ack_num
+			acknowledges exactly, None if it was retransmitted, SACKed earlier or there is no such segment
+		"""
+		head = self.__head
+		new_head = bisect.bisect_left(self.__seqs, ack_num, head)
+		if new_head == head:
+			return 0, None
+		sample = None
+		last = new_head - 1
+		if self.__ends[last] == ack_num and self.__retransmits[last] == 0 and not self.__sacked[last] \
+			and (self.__sample_from is None or ack_num > self.__sample_from):
+			sample = now - self.__sent_at[last]
+		for index in range(head, new_head):
+			if self.__sacked[index]:
+				self.__sacked_count -= 1
+			else:
+				self.__deliver(index)
+		self.__head = new_head
+		if 2 * new_head >= len(self.__seqs):
+			for array in (self.__seqs, self.__ends, self.__wires, self.__sent_at, self.__retransmits, self.__sacked, self.__lost):
+				del array[:new_head]
+			self.__head = 0
+		return new_head - head, sample
+
+	def sack(self, left, right):
+		"""Marks the segments within the SACK block [@left, @right) delivered
+
+		Returns:
+			int: number of segments newly SACKed
+		"""
+		count = 0
+		index = bisect.bisect_left(self.__seqs, left, self.__head)
+		while index < len(self.__seqs) and self.__ends[index] <= right:
+			if not self.__sacked[index]:
+				self.__sacked[index] = True
+				self.__sacked_count += 1
+				self.__deliver(index)
+				count += 1
+			index += 1
+		return count
+
+	def mark_lost(self, xmit_ts, end_seq, cutoff):
+		"""Deems lost the segments neither SACKed nor lost already that were sent before the segment
+		sent at @xmit_ts and ending at @end_seq (the latest delivered), at @cutoff or earlier (RACK)
+
+		Returns:
+			(int, float): number of segments newly lost, and the latest time of transmission of the
+			others sent before that segment, None if there is none
+		"""
+		count = 0
+		pending = None
+		for index in range(self.__head, len(self.__seqs)):
+			if self.__sacked[index] or self.__lost[index]:
+				continue
+			sent_at = self.__sent_at[index]
+			if (sent_at, self.__ends[index]) > (xmit_ts, end_seq):
+				if self.__retransmits[index] == 0:
+					break # sent in order from here on
+				continue
+			if sent_at <= cutoff:
+				self.__lost[index] = True
+				self.__lost_count += 1
+				count += 1
+			elif pending is None or sent_at > pending:
+				pending = sent_at
+		return count, pending
+
+	def retransmit_lost(self, now):
+		"""Counts a retransmission at @now of every segment deemed lost, which are in flight again
+
+		Returns:
+			list: the Segments to send again
+		"""
+		segments = []
+		if self.__lost_count == 0:
+			return segments
+		for index in range(self.__head, len(self.__seqs)):
+			if self.__lost[index]:
+				self.__lost[index] = False
+				self.__retransmits[index] += 1
+				self.__sent_at[index] = now
+				segments.append(Segment(self.__seqs[index], self.__ends[index], self.__wires[index]))
+		self.__lost_count = 0
+		return segments
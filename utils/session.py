@@ -0,0 +1,98 @@
+import os
+import struct
+
+# in a session, every file is preceded in the stream by a frame: length of its name, size of the
+# data that follows, and where that data goes in the destination file, then the name (UTF-8)
+FRAME = struct.Struct('!HQQ')
+
+# events of :func:SessionReader.feed
+OPEN = 0
+DATA = 1
+CLOSE = 2
+
+
+def frame(name, size, offset=0):
+	"""Frame announcing the @size bytes of file @name that follow in the stream, to be written
+	from @offset on in the destination file
+	"""
+	encoded = name.encode()
+	return FRAME.pack(len(encoded), size, offset) + encoded
+
+def destination(root, name):
+	"""Where file @name of a session goes under directory @root
+
+	Returns:
+		str: the path, None if @name would escape @root (absolute, '..')
+	"""
+	root = os.path.abspath(root)
+	path = os.path.abspath(os.path.join(root, name))
+	if os.path.commonpath([root, path]) != root or path == root:
+		return None
+	return path
+
+
+class SessionReader(object):
+	"""Splits the stream of a session back into files, as it comes in order
+	"""
+
+	def __init__(self) -> None:
+		self.__header = bytearray() # frame received so far, while between two files
+		self.__name = None # of the current file
+		self.__position = 0 # where its next data goes
+		self.__remaining = 0 # of its data
+		self.__files = 0
+
+	@property
+	def files(self):
+		"""Number of files complete
+		"""
+		return self.__files
+
+	def feed(self, data):
+		"""Takes the next @data of the stream
+
+		Returns:
+			list: events, in order: (OPEN, name, offset) when a file starts, i.e. its destination
+			is to be truncated to offset, (DATA, position, data) for data of the current file, with
+			data a slice of @data, and (CLOSE, name, end) once a file is complete, end being the position
+			past its last byte
+		"""
+		events = []
+		view = memoryview(data) if not isinstance(data, memoryview) else data
+		while len(view) > 0 or (self.__name is not None and self.__remaining == 0):
+			if self.__name is None:
+				view = self.__read_frame(view, events)
+				if self.__name is None:
+					break # frame not complete yet
+				continue
+			if self.__remaining > 0:
+				piece = view[:self.__remaining]
+				view = view[len(piece):]
+				events.append((DATA, self.__position, piece))
+				self.__position += len(piece)
+				self.__remaining -= len(piece)
+			if self.__remaining == 0:
+				events.append((CLOSE, self.__name, self.__position))
+				self.__name = None
+				self.__files += 1
+		return events
+
+	def __read_frame(self, view, events):
+		missing = FRAME.size - len(self.__header)
+		if missing > 0:
+			self.__header += view[:missing]
+			view = view[missing:]
+			if len(self.__header) < FRAME.size:
+				return view
+		name_len, size, offset = FRAME.unpack_from(self.__header)
+		missing = FRAME.size + name_len - len(self.__header)
+		self.__header += view[:missing]
+		view = view[missing:]
+		if len(self.__header) < FRAME.size + name_len:
+			return view
+		self.__name = bytes(self.__header[FRAME.size:]).decode(errors='replace')
+		self.__header.clear()
+		self.__position = offset
+		self.__remaining = size
+		events.append((OPEN, self.__name, offset))
+		return view
@@ -0,0 +1,298 @@
+import logging
+import random
+
+import structure.packet
+
+from tcp.client import TCP_CLIENT
+from tcp.server import TCP_SERVER
+from utils import trace, util
+from utils.clock import VirtualClock
+from utils.compress import StreamDecompressor
+
+CLIENT_ADDRESS = ('127.0.0.1', 41198) # where the simulated server believes segments come from
+DISCARD_PORT = 9 # the sockets of the endpoints exist, but nothing is sent on them
+
+
+class Link(object):
+	"""One direction of a simulated network path, delivering datagrams through a :class:VirtualClock
+
+	A datagram waits for the ones ahead of it to go out at @rate datagrams per second (tail-dropped
+	when @queue are waiting already), then arrives @delay seconds later. On its way, it is lost,
+	held back by up to another @delay (so that later ones overtake it), duplicated or corrupted
+	with the given probabilities, all drawn from @rng.
+	"""
+
+	def __init__(self, clock:VirtualClock, deliver, rng:random.Random, delay=0.02, rate=0, queue=0, loss=0, reorder=0,
+		duplicate=0, corrupt=0, mark=0) -> None:
+		"""
+		Args:
+			clock (VirtualClock): clock the datagrams travel on
+			deliver (Callable): called with every datagram that arrives (bytes), and whether it was marked
+				Congestion Experienced
+			rng (random.Random): source of the losses, reorderings, etc.
+			delay (float, optional): one-way propagation delay in seconds. Defaults to 0.02.
+			rate (float, optional): bottleneck rate in datagrams per second, 0 for none. Defaults to 0.
+			queue (int, optional): datagrams waiting for the bottleneck at most, 0 for no limit. Defaults to 0.
+			loss (float, optional): probability a datagram is lost. Defaults to 0.
+			reorder (float, optional): probability a datagram is held back. Defaults to 0.
+			duplicate (float, optional): probability a datagram arrives twice. Defaults to 0.
+			corrupt (float, optional): probability a bit of a datagram is flipped. Defaults to 0.
+			mark (int, optional): datagrams waiting for the bottleneck from which on the next ones are
+				marked Congestion Experienced, 0 for never. Defaults to 0.
+		"""
+		self.__clock = clock
+		self.__deliver = deliver
+		self.__rng = rng
+		self.__delay = delay
+		self.__rate = rate
+		self.__queue = queue
+		self.__loss = loss
+		self.__reorder = reorder
+		self.__duplicate = duplicate
+		self.__corrupt = corrupt
+		self.__mark = mark
+		self.__busy_until = 0 # time the bottleneck is done with the datagrams queued so far
+		self.__counts = dict.fromkeys(('sent', 'lost', 'dropped', 'reordered', 'duplicated', 'corrupted', 'marked'), 0)
+
+	@property
+	def counts(self):
+		"""Datagrams sent over the link, and what happened to them
+		"""
+		return dict(self.__counts)
+
+	def __backlog(self, now):
+		"""Datagrams waiting for the bottleneck
+		"""
+		return max(self.__busy_until - now, 0) * self.__rate
+
+	def send(self, wire):
+		"""Puts a datagram on the link
+		"""
+		rng = self.__rng
+		now = self.__clock.time()
+		self.__counts['sent'] += 1
+		if rng.random() < self.__loss:
+			self.__counts['lost'] += 1
+			return
+		ce = False
+		departure = now
+		if self.__rate > 0:
+			backlog = self.__backlog(now)
+			if self.__queue > 0 and backlog >= self.__queue:
+				self.__counts['dropped'] += 1
+				return
+			ce = self.__mark > 0 and backlog >= self.__mark
+			self.__busy_until = max(self.__busy_until, now) + 1 / self.__rate
+			departure = self.__busy_until
+		if ce:
+			self.__counts['marked'] += 1
+		arrival = departure + self.__delay
+		if rng.random() < self.__reorder:
+			self.__counts['reordered'] += 1
+			arrival += rng.uniform(0, self.__delay)
+		if rng.random() < self.__corrupt:
+			self.__counts['corrupted'] += 1
+			wire = bytearray(wire)
+			wire[rng.randrange(len(wire))] ^= 1 << rng.randrange(8)
+			wire = bytes(wire)
+		copies = 2 if rng.random() < self.__duplicate else 1
+		self.__counts['duplicated'] += copies - 1
+		for _ in range(copies):
+			self.__clock.call_later(arrival - now, lambda: self.__deliver(wire, ce))
+		return
+
+
+class SimClient(TCP_CLIENT):
+	"""TCP_CLIENT whose datagrams go over a :class:Link rather than its socket
+	"""
+
+	def __init__(self, link:Link, **kwargs) -> None:
+		super().__init__('127.0.0.1', DISCARD_PORT, ack_lstn_port=0, **kwargs)
+		self.__link = link
+
+	def send_wire(self, wire, event=trace.SEND, path=0):
+		if self.tracer is not None:
+			self.tracer.record_wire(event, trace.TX, wire)
+		self.__link.send(bytes(wire))
+		self.stats.incr('segments_sent')
+		self.stats.incr('bytes_sent', len(wire))
+		return len(wire)
+
+	def close(self):
+		"""Closes the socket, without the FIN handshake of :func:self.terminate
+		"""
+		self.reset()
+		return super(TCP_CLIENT, self).terminate()
+
+
+class SimServer(TCP_SERVER):
+	"""TCP_SERVER whose datagrams go over a :class:Link rather than its socket
+	"""
+
+	def __init__(self, link:Link, **kwargs) -> None:
+		super().__init__(0, '127.0.0.1', DISCARD_PORT, **kwargs)
+		self.__link = link
+
+	def send_packet(self, packet, client_address, event=trace.SEND):
+		if self.tracer is not None:
+			self.tracer.record(event, trace.TX, packet)
+		return self.send_wire(structure.packet.serialize(packet), client_address, event=None)
+
+	def send_wire(self, wire, client_address, event=trace.SEND):
+		if event is not None and self.tracer is not None:
+			self.tracer.record_wire(event, trace.TX, wire)
+		self.__link.send(bytes(wire))
+		self.stats.incr('segments_sent')
+		self.stats.incr('bytes_sent', len(wire))
+		return len(wire)
+
+	def close(self):
+		self.reset()
+		self._socket.close()
+		return
+
+
+def to_packet(wire):
+	"""Deserializes a datagram that arrived, None if it is not a packet (e.g. corrupted header)
+	"""
+	try:
+		return structure.packet.deserialize(wire)
+	except Exception:
+		return None
+
+
+class Simulation(object):
+	"""A transfer of @data from a TCP_CLIENT to a TCP_SERVER, simulated on a :class:VirtualClock
+
+	Both run their real state machines, timers included, over a pair of :class:Link: the client
+	connects, writes @data as fast as its window lets it, and closes, while the server reassembles
+	what it receives and ACKs it as :func:tcp.server.service_client does. Everything random comes
+	from @seed, so that a scenario plays out the same every time.
+	"""
+
+	def __init__(self, data, seed=0, forward=None, reverse=None, client=None, server=None, limit=3600) -> None:
+		"""
+		Args:
+			data (bytes): what the client sends
+			seed (int, optional): seed of the links and the ISNs. Defaults to 0.
+			forward (dict, optional): arguments of the :class:Link from the client to the server. Defaults to None.
+			reverse (dict, optional): arguments of the :class:Link from the server to the client. Defaults to None.
+			client (dict, optional): more arguments of the TCP_CLIENT, e.g. sack=False. Defaults to None.
+			server (dict, optional): more arguments of the TCP_SERVER. Defaults to None.
+			limit (float, optional): simulated seconds after which the transfer is deemed stuck. Defaults to 3600.
+		"""
+		self.__data = data
+		self.__seed = seed
+		self.__limit = limit
+		self.__clock = VirtualClock()
+		rng = random.Random(seed)
+		self.__forward = Link(self.__clock, self.__to_server, random.Random(rng.random()), **(forward or {}))
+		self.__reverse = Link(self.__clock, self.__to_client, random.Random(rng.random()), **(reverse or {}))
+		self.__client = SimClient(self.__forward, window_size=0, isn=rng.randrange(util.MAX_ISN), clock=self.__clock, **(client or {}))
+		self.__server = SimServer(self.__reverse, isn=rng.randrange(util.MAX_ISN), clock=self.__clock, **(server or {}))
+		self.__received = {} # seq num -> payload, as delivered by the server
+		self.__compression = None # of the stream, if the server agreed to it
+		self.__written = 0 # bytes of @data written to the client
+		self.__closing = False # our FIN is out
+		self.__finished_at = None
+
+	@property
+	def clock(self):
+		return self.__clock
+
+	@property
+	def client(self):
+		return self.__client
+
+	@property
+	def server(self):
+		return self.__server
+
+	def __to_server(self, wire, ce):
+		server = self.__server
+		received = server.process(to_packet(wire), CLIENT_ADDRESS, ce=ce)
+		if received is not None and len(received.payload) > 0:
+			self.__received[received.header.seq_num] = bytes(received.payload)
+			self.__compression = server.compression
+		if server.state in (TCP_SERVER.ESTABLISHED, TCP_SERVER.CLOSE_WAIT) and server.ack_due:
+			server.send('')
+		return
+
+	def __to_client(self, wire, ce):
+		packet = to_packet(wire)
+		if packet is not None:
+			self.__client.process(packet)
+		return
+
+	def __pump(self):
+		"""Writes as much of the data as the client's window takes without blocking, then our FIN
+		"""
+		client = self.__client
+		if self.__closing or client.state != TCP_CLIENT.ESTABLISHED:
+			return
+		data = self.__data
+		if client.buffered > 0 and client.free_window > 0:
+			client.write(b'', block=False) # what the window did not take before, e.g. a block compressed since
+		while self.__written < len(data) and client.free_window > client.buffered:
+			chunk = data[self.__written:self.__written + client.free_window - client.buffered]
+			client.write(chunk, block=False)
+			self.__written += len(chunk)
+		if self.__written == len(data) and client.free_window > 0:
+			client.flush(block=False) # a partial segment Nagle held back, or block of the compressor
+			if client.buffered == 0:
+				client.shutdown()
+				self.__closing = True
+		return
+
+	def __done(self):
+		self.__pump()
+		if self.__finished_at is None and self.__closing and self.__client.state == TCP_CLIENT.CLOSED:
+			self.__finished_at = self.__clock.time()
+		return self.__finished_at is not None and self.__server.state == TCP_SERVER.LISTEN
+
+	def stream(self):
+		"""What the server received in order, from the first byte on, decompressed if the stream is
+		"""
+		chunks = []
+		seq = self.__server.stream_base
+		while seq in self.__received:
+			chunks.append(self.__received[seq])
+			seq += len(self.__received[seq])
+		if self.__compression is not None:
+			return StreamDecompressor(self.__compression).decompress(b''.join(chunks))
+		return b''.join(chunks)
+
+	def run(self):
+		"""Plays the transfer out
+
+		Returns:
+			dict: 'seed'; 'ok' whether the connection closed with the server holding exactly @data;
+			'completed' whether it closed at all within the limit; 'duration' simulated seconds until
+			the client closed; 'goodput' bytes/s over it, 0 unless ok; 'events' calls made by the clock; counters
+			of the 'client', 'server', and of the 'forward' and 'reverse' links
+		"""
+		client, server = self.__client, self.__server
+		try:
+			client.open()
+			completed = self.__clock.run(until=self.__limit, done=self.__done)
+		finally:
+			client.close()
+			server.close()
+		duration = self.__finished_at if self.__finished_at is not None else self.__clock.time()
+		ok = completed and self.stream() == self.__data
+		if not ok:
+			logging.warning('seed %s: %s', self.__seed, 'stream differs' if completed else f'stuck at {client.state}/{server.state}')
+		counters = ('segments_sent', 'retransmits_timeout', 'retransmits_fast', 'tail_loss_probes', 'dsacks',
+			'corrupt_drops', 'ecn_reductions')
+		return {
+			'seed': self.__seed,
+			'ok': ok,
+			'completed': completed,
+			'duration': round(duration, 6),
+			'goodput': round(len(self.__data) / duration, 3) if ok and duration > 0 else 0,
+			'events': self.__clock.fired,
+			'client': {name: client.stats.get(name) for name in counters},
+			'server': {name: server.stats.get(name) for name in ('segments_sent', 'retransmits_timeout', 'corrupt_drops', 'ce_marks')},
+			'forward': self.__forward.counts,
+			'reverse': self.__reverse.counts,
+		}
@@ -0,0 +1,213 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class ConnectionStats(object):
+	"""Counters and gauges of a single TCP connection
+
+	Counters only go up and are updated with :func:self.incr, gauges are overwritten with
+	:func:self.set. Goodput is derived from the delivered byte counter when a snapshot is taken.
+	"""
+
+	COUNTERS = (
+		'bytes_sent',
+		'bytes_received',
+		'segments_sent',
+		'segments_received',
+		'bytes_delivered',
+		'retransmits_timeout',
+		'retransmits_fast',
+		'dup_acks',
+		'corrupt_drops',
+		'fec_parity_sent',
+		'fec_recovered',
+		'bytes_uncompressed',
+		'acks_piggybacked',
+		'ce_marks',
+		'ecn_reductions',
+		'tail_loss_probes',
+		'dsacks',
+	)
+	GAUGES = (
+		'srtt',
+		'rttvar',
+		'rto',
+		'bytes_in_flight',
+		'ooo_queue_depth',
+		'rcv_window',
+		'cwnd',
+		'delivery_rate',
+		'goodput',
+	)
+
+	def __init__(self, role) -> None:
+		"""Constructs an empty set of statistics
+
+		Args:
+			role (str): which end of the connection this is, e.g. 'client' or 'server'
+		"""
+		super().__init__()
+		self.__role = role
+		self.__lock = threading.Lock()
+		self.__values = dict.fromkeys(ConnectionStats.COUNTERS + ConnectionStats.GAUGES, 0)
+		self.__start_time = time.time()
+
+	@property
+	def role(self):
+		return self.__role
+
+	def incr(self, name, value=1):
+		with self.__lock:
+			self.__values[name] += value
+		return
+
+	def set(self, name, value):
+		self.__values[name] = value
+		return
+
+	def get(self, name):
+		return self.__values[name]
+
+	def reset(self):
+		"""Zeroes everything, e.g. when the server starts serving a new client
+		"""
+		with self.__lock:
+			self.__values = dict.fromkeys(self.__values, 0)
+			self.__start_time = time.time()
+		return
+
+	def snapshot(self):
+		"""Returns a consistent copy of all counters and gauges
+
+		Returns:
+			dict: name -> value, plus 'role', 'timestamp' and 'uptime'
+		"""
+		now = time.time()
+		with self.__lock:
+			values = dict(self.__values)
+			uptime = now - self.__start_time
+		values['goodput'] = round(values['bytes_delivered'] / uptime, 3) if uptime > 0 else 0
+		values['role'] = self.__role
+		values['timestamp'] = round(now, 3)
+		values['uptime'] = round(uptime, 3)
+		return values
+
+	def to_json(self):
+		return json.dumps(self.snapshot())
+
+	def to_prometheus(self, prefix='tcp_over_udp'):
+		"""Renders the snapshot in the Prometheus text exposition format
+		"""
+		snapshot = self.snapshot()
+		lines = []
+		for name in ConnectionStats.COUNTERS + ConnectionStats.GAUGES:
+			metric = f'{prefix}_{name}' + ('_total' if name in ConnectionStats.COUNTERS else '')
+			kind = 'counter' if name in ConnectionStats.COUNTERS else 'gauge'
+			lines.append(f'# TYPE {metric} {kind}')
+			lines.append(f'{metric}{{role="{self.__role}"}} {snapshot[name]}')
+		return '\n'.join(lines) + '\n'
+
+
+class StatsExporter(object):
+	"""Periodically dumps :class:ConnectionStats to a file and/or serves them over HTTP
+
+	JSON lines are appended to the file, while Prometheus text replaces the file content
+	(so it can be picked up by a textfile collector). The HTTP endpoint serves the
+	Prometheus text at /metrics and the JSON snapshot at /stats.
+	"""
+
+	FORMATS = ('json', 'prometheus')
+
+	def __init__(self, stats:ConnectionStats, interval=1.0, path=None, fmt='json', http_port=None) -> None:
+		"""Constructs an exporter, call :func:self.start to begin exporting
+
+		Args:
+			stats (ConnectionStats): statistics to export
+			interval (float): seconds between two dumps to @path
+			path (str, optional): file to dump to. Defaults to None (no file).
+			fmt (str, optional): 'json' or 'prometheus'. Defaults to 'json'.
+			http_port (int, optional): local port to serve stats on. Defaults to None (no endpoint).
+		"""
+		if fmt not in StatsExporter.FORMATS:
+			raise Exception(f"Unknown stats format '{fmt}', expected one of {StatsExporter.FORMATS}")
+		self.__stats = stats
+		self.__interval = interval
+		self.__path = path
+		self.__fmt = fmt
+		self.__http_port = http_port
+		self.__stopped = threading.Event()
+		self.__thread = None
+		self.__httpd = None
+
+	def dump(self):
+		"""Writes one snapshot to the configured file
+		"""
+		if self.__path is None:
+			return
+		if self.__fmt == 'json':
+			with open(self.__path, 'a') as f:
+				f.write(self.__stats.to_json() + '\n')
+		else:
+			tmp_path = f'{self.__path}.tmp'
+			with open(tmp_path, 'w') as f:
+				f.write(self.__stats.to_prometheus())
+			os.replace(tmp_path, self.__path)
+		return
+
+	def __loop(self):
+		while not self.__stopped.wait(self.__interval):
+			try:
+				self.dump()
+			except OSError as err:
+				logging.error('failed to dump stats: %s', err)
+		return
+
+	def __serve(self):
+		stats = self.__stats
+
+		class Handler(BaseHTTPRequestHandler):
+			def do_GET(self):
+				if self.path == '/metrics':
+					body, content_type = stats.to_prometheus(), 'text/plain; version=0.0.4'
+				elif self.path == '/stats':
+					body, content_type = stats.to_json(), 'application/json'
+				else:
+					self.send_error(404)
+					return
+				body = body.encode()
+				self.send_response(200)
+				self.send_header('Content-Type', content_type)
+				self.send_header('Content-Length', str(len(body)))
+				self.end_headers()
+				self.wfile.write(body)
+
+			def log_message(self, format, *args):
+				return
+
+		self.__httpd = ThreadingHTTPServer(('127.0.0.1', self.__http_port), Handler)
+		threading.Thread(target=self.__httpd.serve_forever, daemon=True).start()
+		return
+
+	def start(self):
+		if self.__http_port is not None:
+			self.__serve()
+		if self.__path is not None:
+			self.__thread = threading.Thread(target=self.__loop, daemon=True)
+			self.__thread.start()
+		return self
+
+	def stop(self):
+		"""Stops exporting, writing one last snapshot
+		"""
+		self.__stopped.set()
+		if self.__thread is not None:
+			self.__thread.join()
+			self.dump()
+		if self.__httpd is not None:
+			self.__httpd.shutdown()
+			self.__httpd.server_close()
+		return
@@ -1,24 +1,47 @@
+import functools
 import logging
+import threading
 
-from threading import Timer
 from typing import *
+from utils.clock import SYSTEM
 
 class TCPTimer(object):
 	"""TCP timer implementation. Used for multithreading mainly
 	"""
 
-	def __init__(self, interval: float, function: Callable[..., Any], *args, **kwargs) -> None:
+	def __init__(self, interval: float, function: Callable[..., Any], *args, clock=None, **kwargs) -> None:
 		"""TCP Timer implementation. Essentially triggers @function when timedout.
 
 		Args:
 			interval (float): TimeoutInterval
 			function (Callable[..., Any]): function to call when timedout
+			clock (Clock, optional): runs the timer, e.g. a VirtualClock. Defaults to None (a thread per timer).
 		"""
+		self.__clock = clock or SYSTEM
 		self.__interval = interval
 		self.__function = function
 		self.__args = args
 		self.__kwargs = kwargs
 		self.__timer = None
+		self.__pending = False # armed and neither fired nor cancelled yet
+		self.__generation = 0 # of the timer armed last, an expiry of an earlier one is stale
+		self.__lock = threading.Lock()
+
+	def __arm(self):
+		"""Arms a new timer, to be called with the lock held
+		"""
+		self.__generation += 1
+		self.__pending = True
+		self.__timer = self.__clock.call_later(self.__interval, functools.partial(self.__fire, self.__generation))
+		return
+
+	def __fire(self, generation):
+		with self.__lock:
+			if generation != self.__generation:
+				# cancelled or armed anew after this expiry had started: the pending timer is not this one
+				return None
+			self.__pending = False
+		return self.__function(*self.__args, **self.__kwargs)
 
 	@property
 	def interval(self):
@@ -28,20 +51,25 @@ class TCPTimer(object):
 		if self.__timer is not None and self.__timer.is_alive():
 			logging.error('timer already running')
 			return
-		self.__timer = Timer(self.__interval, self.__function, args=self.__args, kwargs=self.__kwargs)
-		self.__timer.start()
+		with self.__lock:
+			self.__arm()
 		logging.debug('timer started')
 		return
 
 	def is_alive(self):
-		if self.__timer is None:
-			return False
-		return self.__timer.is_alive()
+		"""Whether the timer is still pending. Its thread may outlive that (being cancelled,
+		or running the function), so callers arm a new timer rather than rely on it. An expiry
+		of an earlier timer does not clear it.
+		"""
+		return self.__pending
 	
 	def cancel(self):
 		if self.__timer is None:
 			return
-		self.__timer.cancel()
+		with self.__lock:
+			self.__generation += 1
+			self.__pending = False
+			self.__timer.cancel()
 		return
 	
 	def restart(self, new_interval=None):
@@ -50,6 +78,6 @@ class TCPTimer(object):
 		# calling self.start() causes problem as the thread might NOT be finished 
 		# (e.g. function still executing)
 		self.__interval = new_interval or self.__interval
-		self.__timer = Timer(self.__interval, self.__function, args=self.__args, kwargs=self.__kwargs)
-		self.__timer.start()
+		with self.__lock:
+			self.__arm()
 		return
\ No newline at end of file
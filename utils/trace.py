@@ -0,0 +1,152 @@
+import struct
+import threading
+import time
+
+from collections import namedtuple
+
+# directions
+RX = 0
+TX = 1
+
+# event types
+SEND = 0
+RETRANSMIT = 1
+RECV = 2
+DROP = 3
+
+EVENT_NAMES = {SEND: 'send', RETRANSMIT: 'retransmit', RECV: 'recv', DROP: 'drop'}
+
+TraceRecord = namedtuple('TraceRecord', ['timestamp', 'direction', 'event', 'src_port', 'dst_port', 'seq_num', 'ack_num', 'flags', 'length', 'rcvwd'])
+
+
+class PacketTracer(object):
+	"""Ring buffer of fixed-size binary packet events
+
+	Every :func:self.record is a single struct.pack_into into a preallocated bytearray, so
+	tracing costs next to nothing on the hot path. Once @capacity records are taken, the
+	oldest ones are overwritten. The buffer can be written out as a binary trace (read back
+	by :func:load) or as a pcap file, where each record becomes a headers-only IPv4/TCP packet.
+	"""
+
+	RECORD = struct.Struct('<dBBHHIIBHHx')
+	WIRE_HEADER = struct.Struct('HHIIBBH') # leading fields of a serialized packet, see structure.packet.serialize
+	MAGIC = b'TCPTRACE'
+	FILE_HEADER = struct.Struct('<8sHH')
+	VERSION = 1
+
+	def __init__(self, capacity=65536) -> None:
+		self.__capacity = capacity
+		self.__buffer = bytearray(capacity * PacketTracer.RECORD.size)
+		self.__taken = 0
+		self.__lock = threading.Lock() # so that threads never share a slot
+
+	@property
+	def capacity(self):
+		return self.__capacity
+
+	def record(self, event, direction, packet):
+		"""Records one event of @packet
+
+		Args:
+			event (int): one of SEND, RETRANSMIT, RECV, DROP
+			direction (int): RX or TX
+			packet (Packet): packet the event is about
+		"""
+		header = packet.header
+		flags = header.flags
+		self.__record(event, direction,
+			header.src_port, header.dst_port,
+			header.seq_num, header.ack_num,
+			flags.ack << 4 | flags.cwr << 3 | flags.ece << 2 | flags.fin << 1 | flags.syn,
+			len(packet.payload), header.rcvwd)
+		return
+
+	def record_wire(self, event, direction, wire):
+		"""Records one event of an already serialized packet, without deserializing it
+
+		Args:
+			event (int): one of SEND, RETRANSMIT, RECV, DROP
+			direction (int): RX or TX
+			wire (bytes): the packet as sent, see :func:structure.packet.serialize
+		"""
+		src_port, dst_port, seq_num, ack_num, header_len, flags, rcvwd = PacketTracer.WIRE_HEADER.unpack_from(wire)
+		# the wire flag byte has the very bit layout of a record
+		self.__record(event, direction, src_port, dst_port, seq_num, ack_num, flags, len(wire) - header_len, rcvwd)
+		return
+
+	def __record(self, event, direction, *fields):
+		with self.__lock:
+			slot = self.__taken % self.__capacity
+			self.__taken += 1
+		PacketTracer.RECORD.pack_into(
+			self.__buffer, slot * PacketTracer.RECORD.size,
+			time.time(), direction, event, *fields)
+		return
+
+	def __len__(self):
+		return min(self.__taken, self.__capacity)
+
+	def records(self):
+		"""Returns the recorded events, oldest first
+
+		Returns:
+			list: of TraceRecord
+		"""
+		size = len(self)
+		start = self.__taken - size
+		records = []
+		for i in range(start, start + size):
+			slot = i % self.__capacity
+			records.append(TraceRecord(*PacketTracer.RECORD.unpack_from(self.__buffer, slot * PacketTracer.RECORD.size)))
+		return records
+
+	def dump(self, path, fmt='bin'):
+		"""Writes the recorded events to @path
+
+		Args:
+			path (str): file to write to
+			fmt (str, optional): 'bin' or 'pcap'. Defaults to 'bin'.
+		"""
+		if fmt == 'pcap':
+			return write_pcap(self.records(), path)
+		with open(path, 'wb') as f:
+			f.write(PacketTracer.FILE_HEADER.pack(PacketTracer.MAGIC, PacketTracer.VERSION, PacketTracer.RECORD.size))
+			for record in self.records():
+				f.write(PacketTracer.RECORD.pack(*record))
+		return
+
+
+def load(path):
+	"""Reads a binary trace written by :func:PacketTracer.dump
+
+	Returns:
+		list: of TraceRecord, oldest first
+	"""
+	with open(path, 'rb') as f:
+		data = f.read()
+	magic, version, record_size = PacketTracer.FILE_HEADER.unpack_from(data)
+	if magic != PacketTracer.MAGIC or version != PacketTracer.VERSION or record_size != PacketTracer.RECORD.size:
+		raise Exception(f"'{path}' is not a version {PacketTracer.VERSION} packet trace")
+	return [TraceRecord(*fields) for fields in PacketTracer.RECORD.iter_unpack(data[PacketTracer.FILE_HEADER.size:])]
+
+def write_pcap(records, path):
+	"""Writes @records as a LINKTYPE_RAW pcap, one headers-only IPv4/TCP packet per record
+
+	The payload is not recorded, so every packet is truncated after the TCP header
+	(the original length still shows up as the packet length).
+	"""
+	with open(path, 'wb') as f:
+		f.write(struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 101))
+		for record in records:
+			# map our flag bits to TCP's CWR/ECE/ACK/SYN/FIN
+			tcp_flags = (record.flags >> 4 & 1) << 4 | (record.flags >> 3 & 1) << 7 | (record.flags >> 2 & 1) << 6 \
+				| (record.flags >> 1 & 1) | (record.flags & 1) << 1
+			tcp = struct.pack('!HHIIBBHHH', record.src_port, record.dst_port, record.seq_num, record.ack_num,
+				5 << 4, tcp_flags, record.rcvwd, 0, 0)
+			total_len = 20 + len(tcp) + record.length
+			ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, min(total_len, 0xffff), 0, 0, 64, 6, 0,
+				bytes([127, 0, 0, 1]), bytes([127, 0, 0, 1]))
+			seconds = int(record.timestamp)
+			f.write(struct.pack('<IIII', seconds, int((record.timestamp - seconds) * 1e6), len(ip) + len(tcp), total_len))
+			f.write(ip + tcp)
+	return
@@ -0,0 +1,163 @@
+import logging
+import socket
+import struct
+
+# Linux UDP offloads, not all of them exported by the socket module (see linux/udp.h)
+SOL_UDP = getattr(socket, 'SOL_UDP', 17)
+UDP_SEGMENT = getattr(socket, 'UDP_SEGMENT', 103)
+UDP_GRO = getattr(socket, 'UDP_GRO', 104)
+
+MAX_SEGMENTS = 64 # segments per GSO send, UDP_MAX_SEGMENTS of the kernel
+MAX_DATAGRAM = 65507 # largest UDP payload over IPv4
+TRUESIZE = 2048 # about the kernel memory a queued datagram of a segment takes, counted against SO_RCVBUF
+GRO_ANCBUFSIZE = socket.CMSG_SPACE(struct.calcsize('i')) if hasattr(socket, 'CMSG_SPACE') else 0
+
+# ECN codepoints of the IP TOS byte (RFC 3168)
+ECN_MASK = 0x03
+ECT0 = 0x02
+CE = 0x03
+TOS_ANCBUFSIZE = socket.CMSG_SPACE(struct.calcsize('i')) if hasattr(socket, 'CMSG_SPACE') else 0
+SO_MEMINFO = getattr(socket, 'SO_MEMINFO', 55)
+MEMINFO_SIZE = 9 * 4 # SK_MEMINFO_VARS u32, the first of them SK_MEMINFO_RMEM_ALLOC
+
+
+def set_buffers(sock, sndbuf=None, rcvbuf=None):
+	"""Sets SO_SNDBUF/SO_RCVBUF of @sock, when given. The kernel may double or cap them,
+	the sizes actually granted are logged.
+	"""
+	for option, size in ((socket.SO_SNDBUF, sndbuf), (socket.SO_RCVBUF, rcvbuf)):
+		if size is None:
+			continue
+		try:
+			sock.setsockopt(socket.SOL_SOCKET, option, size)
+		except OSError as err:
+			logging.warning('could not set socket buffer to %s bytes: %s', size, err)
+	logging.info('socket buffers: sndbuf=%s rcvbuf=%s',
+		sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF), sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF))
+	return
+
+def reserve_datagrams(sock, datagrams):
+	"""Grows SO_RCVBUF of @sock so that @datagrams datagrams can be queued, e.g. a whole receive
+	window arriving back to back. Never shrinks it. The kernel caps it to net.core.rmem_max.
+	"""
+	size = datagrams * TRUESIZE
+	if sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) >= size:
+		return
+	try:
+		sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, size // 2) # the kernel doubles it
+	except OSError as err:
+		logging.warning('could not set socket buffer to %s bytes: %s', size, err)
+	return
+
+def supports_gso(sock):
+	"""Whether the kernel segments UDP sends on @sock (UDP_SEGMENT, Linux 4.18+)
+	"""
+	if not hasattr(sock, 'sendmsg'):
+		return False
+	try:
+		sock.getsockopt(SOL_UDP, UDP_SEGMENT)
+	except OSError:
+		return False
+	return True
+
+def enable_gro(sock):
+	"""Lets the kernel coalesce equal-size datagrams received on @sock (UDP_GRO, Linux 5.0+)
+
+	Returns:
+		bool: whether it is enabled
+	"""
+	if not hasattr(sock, 'recvmsg_into') or GRO_ANCBUFSIZE == 0:
+		return False
+	try:
+		sock.setsockopt(SOL_UDP, UDP_GRO, 1)
+	except OSError:
+		return False
+	return True
+
+def gso_batches(wires):
+	"""Splits @wires into runs that one GSO send can carry: datagrams of the same size, but the
+	last one that may be shorter, at most :attr:MAX_SEGMENTS of them and :attr:MAX_DATAGRAM bytes
+
+	Args:
+		wires (list): serialized packets, in sending order
+
+	Returns:
+		list: (segment size, list of wires) runs, in sending order
+	"""
+	batches = []
+	run = []
+	size = 0
+	for wire in wires:
+		if run and (len(wire) > size or len(run[-1]) < size or len(run) == MAX_SEGMENTS \
+			or (len(run) + 1) * size > MAX_DATAGRAM):
+			batches.append((size, run))
+			run = []
+		if not run:
+			size = len(wire)
+		run.append(wire)
+	if run:
+		batches.append((size, run))
+	return batches
+
+def send_gso(sock, run, size, address):
+	"""Sends the datagrams of @run, as split by :func:gso_batches, in a single syscall
+
+	Returns:
+		int: number of bytes sent
+	"""
+	return sock.sendmsg([b''.join(run)], [(SOL_UDP, UDP_SEGMENT, struct.pack('H', size))], 0, address)
+
+def gro_segment_size(ancdata):
+	"""Size of the datagrams that GRO coalesced into the buffer received along with @ancdata,
+	None if it holds a single datagram
+	"""
+	for level, kind, data in ancdata:
+		if level == SOL_UDP and kind == UDP_GRO:
+			return struct.unpack('i', data[:struct.calcsize('i')])[0]
+	return None
+
+def set_ect(sock):
+	"""Marks the datagrams sent on @sock ECN capable (ECT(0)), so that a congested queue on the way
+	marks them CE rather than drops them
+
+	Returns:
+		bool: whether the kernel took it
+	"""
+	try:
+		sock.setsockopt(socket.IPPROTO_IP, socket.IP_TOS, ECT0)
+	except OSError:
+		return False
+	return True
+
+def enable_recvtos(sock):
+	"""Has the TOS byte of every datagram received on @sock come along with it (IP_RECVTOS),
+	for its ECN codepoint, see :func:is_ce
+
+	Returns:
+		bool: whether it is supported
+	"""
+	if not hasattr(socket, 'IP_RECVTOS') or not hasattr(sock, 'recvmsg_into'):
+		return False
+	try:
+		sock.setsockopt(socket.IPPROTO_IP, socket.IP_RECVTOS, 1)
+	except OSError:
+		return False
+	return True
+
+def is_ce(ancdata):
+	"""Whether the datagram received along with @ancdata was marked Congestion Experienced
+	"""
+	for level, kind, data in ancdata:
+		if level == socket.IPPROTO_IP and kind == socket.IP_TOS and len(data) > 0:
+			return data[0] & ECN_MASK == CE
+	return False
+
+def queued_bytes(sock):
+	"""Kernel memory taken by the datagrams queued at @sock, not received yet (SO_MEMINFO,
+	Linux 4.6+), None where unsupported
+	"""
+	try:
+		meminfo = sock.getsockopt(socket.SOL_SOCKET, SO_MEMINFO, MEMINFO_SIZE)
+	except OSError:
+		return None
+	return struct.unpack_from('I', meminfo)[0]
@@ -1,5 +1,9 @@
+import secrets
+
 from typing import Callable
 
+MAX_ISN = 2**31 # keeps seq_num + file size below 2**32 for files up to 2GB, so seq numbers never wrap
+
 
 class Comparable(object):
 	"""Implementation so that objects are compared by values of their ATTRIBUTES
@@ -28,6 +32,11 @@ class Comparable(object):
 		return hash(tuple(attr_values))
 
 
+def random_isn():
+	"""Returns a random initial sequence number, so that datagrams of an older connection are not accepted
+	"""
+	return secrets.randbelow(MAX_ISN)
+
 def largest_contionus(sequence:set, sort_key=None, next_diff=None, pop=True):
 	"""Given a sequence {1,2,4,5}, returns the largest contionus number, i.e. 2
 
@@ -0,0 +1,134 @@
+import logging
+import os
+import queue
+import threading
+
+# fdatasync skips the metadata flush, where the platform has it
+_datasync = getattr(os, 'fdatasync', os.fsync)
+# queued by :func:WriteBehind.reopen, in place of an offset
+_REOPEN = object()
+
+
+class WriteBehind(object):
+	"""Bounded queue of file writes, drained by a dedicated writer thread
+
+	:func:self.write only queues (offset, data), so the thread receiving and ACKing segments
+	never waits for the disk, unless @capacity writes are pending already. :attr:self.free
+	tells how close to that the queue is. With @sync_every, the writer calls fdatasync after
+	that many writes or as soon as the queue runs empty, whichever comes first, so that syncs
+	are batched rather than done per write.
+	"""
+
+	def __init__(self, path, capacity=256, sync_every=0, flushed=None) -> None:
+		"""Starts a writer thread for the (existing) file @path
+
+		Args:
+			path (str): file to write to, None to wait for :func:self.reopen
+			capacity (int, optional): number of pending writes before :func:self.write blocks. Defaults to 256.
+			sync_every (int, optional): fdatasync after as many writes, 0 to never sync. Defaults to 0.
+			flushed (Callable, optional): called by the writer thread every time the file is flushed,
+				i.e. what is written so far is out of the process. Defaults to None.
+		"""
+		self.__capacity = capacity
+		self.__sync_every = sync_every
+		self.__flushed = flushed
+		self.__queue = queue.Queue(maxsize=capacity)
+		self.__file = open(path, 'r+b') if path is not None else None
+		self.__position = 0
+		self.__thread = threading.Thread(target=self.__loop, daemon=True)
+		self.__thread.start()
+
+	@property
+	def capacity(self):
+		return self.__capacity
+
+	@property
+	def free(self):
+		"""Number of writes that can be queued without blocking
+		"""
+		return max(self.__capacity - self.__queue.qsize(), 0)
+
+	def write(self, offset, data, done=None):
+		"""Queues @data to be written at @offset
+
+		Args:
+			offset (int): position in the file
+			data (bytes or memoryview): data to write, not to be modified until @done is called
+			done (Callable, optional): called by the writer thread once @data is written. Defaults to None.
+		"""
+		self.__queue.put((offset, data, done))
+		return
+
+	def reopen(self, path, truncate=None):
+		"""Queues a switch to file @path: the writes queued next go there. It is created if
+		missing, and truncated to @truncate bytes if given.
+		"""
+		self.__queue.put((_REOPEN, path, truncate))
+		return
+
+	def flush(self):
+		"""Blocks until every queued write is done
+		"""
+		self.__queue.join()
+		return
+
+	def close(self):
+		"""Writes out whatever is queued, then stops the writer thread and closes the file
+		"""
+		self.__queue.put(None)
+		self.__thread.join()
+		if self.__file is not None:
+			self.__file.close()
+		return
+
+	def __loop(self):
+		unsynced = 0
+		while True:
+			item = self.__queue.get()
+			try:
+				if item is None or item[0] is _REOPEN:
+					if self.__file is not None:
+						self.__flush()
+						if self.__sync_every and unsynced:
+							_datasync(self.__file.fileno())
+					unsynced = 0
+					if item is None:
+						return
+					self.__switch(*item[1:])
+					continue
+				offset, data, done = item
+				if self.__file is None:
+					raise OSError('no file to write to')
+				if offset != self.__position:
+					self.__file.seek(offset)
+				self.__file.write(data)
+				self.__position = offset + len(data)
+				if done is not None:
+					done()
+				unsynced += 1
+				if self.__queue.empty():
+					self.__flush() # visible to readers once the queue is drained
+				if self.__sync_every and (unsynced >= self.__sync_every or self.__queue.empty()):
+					self.__flush()
+					_datasync(self.__file.fileno())
+					unsynced = 0
+			except OSError as err:
+				logging.error('write-behind failed: %s', err)
+			finally:
+				self.__queue.task_done()
+
+	def __switch(self, path, truncate):
+		if self.__file is not None:
+			self.__file.close()
+			self.__file = None
+		self.__file = open(path, 'r+b' if os.path.exists(path) else 'w+b')
+		if truncate is not None:
+			self.__file.truncate(truncate)
+		self.__position = None # unknown, the next write seeks
+		return
+
+	def __flush(self):
+		self.__file.flush()
+		if self.__flushed is not None:
+			self.__flushed()
+		return